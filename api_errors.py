@@ -0,0 +1,179 @@
+"""Классы ошибок Telegram Bot API и повтор вызовов по классу ошибки.
+
+Вместо перехвата любого исключения с попыткой "отправить хоть что-нибудь"
+каждая ошибка относится к одному классу, и у каждого класса своё действие:
+- RATE_LIMITED (429) - подождать retry_after и повторить;
+- NOT_MODIFIED - сообщение уже такое, считать успехом;
+- MESSAGE_GONE - сообщение нельзя отредактировать (удалено, слишком старое или
+  другого типа) - один раз отправить новое;
+- MEDIA_INVALID - Telegram не принял фото или file_id - один раз загрузить файл
+  или показать текст;
+- TRANSPORT - сеть или 5xx: повторить, только если запрос точно не дошёл
+  (соединение не установлено), иначе повтор может задвоить сообщение;
+- BLOCKED - пользователь заблокировал бота или удалил аккаунт (403, чат не найден):
+  писать в этот чат больше бессмысленно;
+- OTHER - остальное (ошибка разметки и т.п.): не повторять.
+Каждая попытка передаётся в on_attempt(метод, исход), чтобы считать обращения к API.
+"""
+import asyncio
+import logging
+import time
+
+import requests
+
+from photo_cache import REJECTED_FILE_ID_ERRORS
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMITED = "rate_limited"
+NOT_MODIFIED = "not_modified"
+MESSAGE_GONE = "message_gone"
+MEDIA_INVALID = "media_invalid"
+TRANSPORT = "transport"
+BLOCKED = "blocked"
+OTHER = "other"
+
+# Исход успешной попытки (для счётчика попыток)
+OK = "ok"
+
+# Фрагменты описаний ошибок 400 по классам
+MESSAGE_GONE_ERRORS = (
+    "message to edit not found",
+    "message can't be edited",
+    "message_id_invalid",
+    "there is no text in the message to edit",
+    "there is no caption in the message to edit",
+    "there is no media in the message to edit",
+)
+MEDIA_INVALID_ERRORS = REJECTED_FILE_ID_ERRORS + (
+    "wrong type of the web page content",
+    "failed to get http url content",
+    "image_process_failed",
+    "photo_invalid_dimensions",
+    "photo_save_file_invalid",
+    "photo_ext_invalid",
+    "there is no photo in the request",
+)
+
+# Фрагменты описаний ошибок 400, после которых чат недоступен
+BLOCKED_ERRORS = (
+    "chat not found",
+    "user is deactivated",
+    "peer_id_invalid",
+)
+
+# Пауза перед повтором после обрыва соединения (секунды)
+TRANSPORT_RETRY_DELAY = 0.5
+
+
+def retry_after(error):
+    """Пауза из ответа 429 Too Many Requests или None для других ошибок"""
+    if getattr(error, "error_code", None) != 429:
+        return None
+    result_json = getattr(error, "result_json", None) or {}
+    return float((result_json.get("parameters") or {}).get("retry_after", 1))
+
+
+def classify(error):
+    """Класс ошибки вызова Bot API"""
+    code = getattr(error, "error_code", None)
+    if code == 429:
+        return RATE_LIMITED
+    if code == 400:
+        description = str(getattr(error, "description", "")).lower()
+        if "message is not modified" in description:
+            return NOT_MODIFIED
+        if any(fragment in description for fragment in MESSAGE_GONE_ERRORS):
+            return MESSAGE_GONE
+        if any(fragment in description for fragment in MEDIA_INVALID_ERRORS):
+            return MEDIA_INVALID
+        if any(fragment in description for fragment in BLOCKED_ERRORS):
+            return BLOCKED
+        return OTHER
+    if code == 403:
+        return BLOCKED
+    if code is not None:
+        return TRANSPORT if code >= 500 else OTHER
+    # Без кода ответа: сеть, таймаут, ответ не-JSON (telebot ApiHTTPException, RequestTimeout)
+    if isinstance(error, (requests.exceptions.RequestException, asyncio.TimeoutError, ConnectionError)):
+        return TRANSPORT
+    if type(error).__name__ in ("ApiHTTPException", "ApiInvalidJSONException", "RequestTimeout"):
+        return TRANSPORT
+    return OTHER
+
+
+def not_sent(error):
+    """Запрос точно не дошёл до Telegram, и его можно повторить без риска дубля"""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    return isinstance(error, requests.exceptions.ConnectionError) and \
+        "Failed to establish a new connection" in str(error)
+
+
+class ApiCallError(Exception):
+    """Вызов API не удался; kind - класс ошибки, error - исходное исключение"""
+
+    def __init__(self, method, kind, error):
+        super().__init__(f"{method}: {kind}: {error}")
+        self.method = method
+        self.kind = kind
+        self.error = error
+
+
+class ApiCaller:
+    """Вызывает методы бота с повторами по классу ошибки и считает каждую попытку"""
+
+    def __init__(self, on_attempt=None, rate_limit_retries=3, transport_retries=1):
+        self.on_attempt = on_attempt
+        self.rate_limit_retries = rate_limit_retries
+        self.transport_retries = transport_retries
+
+    def _record(self, method, outcome):
+        if self.on_attempt is not None:
+            self.on_attempt(method, outcome)
+
+    def _retry_delay(self, method, kind, error, retries):
+        """Пауза перед повтором или None, если повторять нельзя"""
+        if kind == RATE_LIMITED and retries[RATE_LIMITED] < self.rate_limit_retries:
+            retries[RATE_LIMITED] += 1
+            pause = retry_after(error)
+            logger.warning(f"Telegram просит подождать {pause} с ({method})")
+            return pause
+        if kind == TRANSPORT and not_sent(error) and retries[TRANSPORT] < self.transport_retries:
+            retries[TRANSPORT] += 1
+            return TRANSPORT_RETRY_DELAY
+        return None
+
+    def call(self, method, function, *args, **kwargs):
+        """Результат function(*args, **kwargs); при неустранимой ошибке - ApiCallError"""
+        retries = {RATE_LIMITED: 0, TRANSPORT: 0}
+        while True:
+            try:
+                result = function(*args, **kwargs)
+            except Exception as e:
+                kind = classify(e)
+                self._record(method, kind)
+                delay = self._retry_delay(method, kind, e, retries)
+                if delay is None:
+                    raise ApiCallError(method, kind, e) from e
+                time.sleep(delay)
+                continue
+            self._record(method, OK)
+            return result
+
+    async def call_async(self, method, function, *args, **kwargs):
+        """То же для корутин AsyncTeleBot"""
+        retries = {RATE_LIMITED: 0, TRANSPORT: 0}
+        while True:
+            try:
+                result = await function(*args, **kwargs)
+            except Exception as e:
+                kind = classify(e)
+                self._record(method, kind)
+                delay = self._retry_delay(method, kind, e, retries)
+                if delay is None:
+                    raise ApiCallError(method, kind, e) from e
+                await asyncio.sleep(delay)
+                continue
+            self._record(method, OK)
+            return result
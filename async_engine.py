@@ -0,0 +1,589 @@
+"""Асинхронный режим работы бота на AsyncTeleBot.
+
+Сценарии те же, что и в синхронном режиме (старт, листание меню, тест, результат,
+инлайн-кнопки), но вызовы Telegram API не занимают потоки: все диалоги
+обслуживаются одним циклом событий через общий пул keep-alive соединений aiohttp.
+Тексты, клавиатуры, подбор чая, переходы теста (запись ответов, отмена, результат),
+кэш фото и хранилище сессий берутся из bot.py, который передаётся в run() как
+модуль приложения.
+"""
+import asyncio
+import logging
+import os
+import threading
+import weakref
+
+import aiohttp
+from telebot import asyncio_helper, types
+from telebot.async_telebot import AsyncTeleBot
+
+from log_pipeline import event
+from api_errors import ApiCaller, ApiCallError, MEDIA_INVALID, MESSAGE_GONE, NOT_MODIFIED
+from outbound import AsyncRateLimiter
+from photo_cache import file_id_from_message
+from session_store import State
+from router import MessageRouter
+from callbacks import CallbackRouter
+from update_scheduler import update_chat_id
+
+logger = logging.getLogger(__name__)
+
+# Размер общего пула соединений к api.telegram.org
+POOL_SIZE = int(os.getenv('ASYNC_POOL_SIZE', 100))
+# Сколько секунд держать простаивающее соединение открытым
+KEEPALIVE_TIMEOUT = float(os.getenv('ASYNC_KEEPALIVE_TIMEOUT', 60))
+
+
+class PooledSessionManager(asyncio_helper.SessionManager):
+    """Одна aiohttp-сессия на процесс с ограниченным пулом keep-alive соединений"""
+
+    def __init__(self, pool_size=POOL_SIZE, keepalive_timeout=KEEPALIVE_TIMEOUT):
+        super().__init__()
+        self.pool_size = pool_size
+        self.keepalive_timeout = keepalive_timeout
+
+    async def create_session(self):
+        connector = aiohttp.TCPConnector(
+            limit=self.pool_size,
+            limit_per_host=self.pool_size,
+            keepalive_timeout=self.keepalive_timeout,
+            ssl=self.ssl_context
+        )
+        self.session = aiohttp.ClientSession(connector=connector)
+        return self.session
+
+    async def close(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+
+
+class AsyncEngine:
+    """Регистрирует обработчики бота на AsyncTeleBot"""
+
+    def __init__(self, app, token):
+        self.app = app
+        self.bot = AsyncTeleBot(token)
+        self._chat_locks = weakref.WeakValueDictionary()
+        self._background = set()
+
+        # Обновления одного чата обрабатываются по очереди, разных чатов - параллельно
+        self._process_new_updates = self.bot.process_new_updates
+        self.bot.process_new_updates = self._process_in_chat_order
+
+        self.router = MessageRouter(lambda chat_id: app.get_session(chat_id).state)
+        self.callback_router = CallbackRouter(app.callbacks)
+        # Очереди outbound в этом режиме нет: паузы 429 выдерживаются здесь
+        self.api = ApiCaller(on_attempt=app.metrics.attempt)
+        # Лимиты частоты те же, что у очереди outbound синхронного режима (OUTBOUND_*_RATE)
+        outbound = app.outbound
+        self.limiter = AsyncRateLimiter(outbound.global_bucket.rate, outbound.chat_rate, outbound.chat_burst)
+        self.limiter.install(self.bot)
+        # Листания меню, которые ждут лимита: (chat_id, message_id) -> последняя выбранная страница
+        self._page_flips = {}
+        # Рассылка идёт в своём потоке, отправки выполняются в цикле событий
+        self.loop = None
+        self.broadcaster = app.create_broadcaster(self.send_broadcast_message)
+        self._register_handlers()
+        app.metrics.instrument_handlers(self.bot)
+        app.metrics.instrument_router(self.router)
+        app.metrics.instrument_router(self.callback_router)
+
+    def _chat_lock(self, chat_id):
+        lock = self._chat_locks.get(chat_id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._chat_locks[chat_id] = lock
+        return lock
+
+    async def _process_chat_update(self, update):
+        # Нажатие кнопки подтверждается сразу, не дожидаясь предыдущих обновлений чата и обработчика
+        if update.callback_query is not None:
+            self.in_background(self.answer_callback(update.callback_query))
+        lock = self._chat_lock(update_chat_id(update))
+        async with lock:
+            await self._process_new_updates([update])
+
+    async def _process_in_chat_order(self, updates):
+        await asyncio.gather(*(self._process_chat_update(update) for update in updates))
+
+    def _register_handlers(self):
+        app = self.app
+        bot = self.bot
+        router = self.router
+        # Тот же порядок приоритетов, что и в bot.py
+        router.command('start')(self.start)
+        router.text(*app.MAIN_MENU_BUTTONS)(self.handle_main_menu)
+        router.state(*app.QUESTION_STATES)(self.handle_test_answer)
+        router.command('test')(self.start_test_command)
+        router.command('help')(self.show_help)
+        router.command('menu')(self.command_menu)
+        router.command('broadcast', 'broadcast_status', 'broadcast_cancel')(self.command_broadcast)
+        router.default(self.handle_other_messages)
+        bot.register_message_handler(self.dispatch)
+
+        callback_router = self.callback_router
+        callback_router.on("menu_page")(self.callback_menu_page)
+        callback_router.on("main_menu")(self.callback_main_menu)
+        callback_router.on("start_test")(self.callback_start_test)
+        callback_router.on("show_menu")(self.callback_show_menu)
+        callback_router.on("answer")(self.callback_answer)
+        callback_router.on("cancel_test")(self.callback_cancel_test)
+        bot.register_callback_query_handler(self.dispatch_callback, func=None)
+        bot.register_inline_handler(self.handle_inline_query, func=lambda query: True)
+
+    async def dispatch(self, message):
+        handler = self.router.resolve(message)
+        if handler is not None:
+            await handler(message)
+
+    async def dispatch_callback(self, call):
+        resolved = self.callback_router.resolve(call.data)
+        if resolved is not None:
+            handler, args = resolved
+            await handler(call, *args)
+
+    # Отправка сообщений и фото: действие выбирается по классу ошибки (api_errors)
+
+    async def send_message(self, chat_id, text, **kwargs):
+        """Новое сообщение; 429 выдерживается и повторяется"""
+        return await self.api.call_async("send_message", self.bot.send_message, chat_id, text, **kwargs)
+
+    async def _deliver_photo(self, chat_id, photo, caption, reply_markup=None, message_id=None):
+        if message_id and reply_markup:
+            try:
+                return await self.api.call_async(
+                    "edit_message_media", self.bot.edit_message_media,
+                    chat_id=chat_id,
+                    message_id=message_id,
+                    media=types.InputMediaPhoto(photo, caption=caption, parse_mode="Markdown"),
+                    reply_markup=reply_markup
+                )
+            except ApiCallError as e:
+                if e.kind == NOT_MODIFIED:
+                    return None
+                if e.kind != MESSAGE_GONE:
+                    raise
+                self.app.metrics.fallback("message_gone")
+                if hasattr(photo, 'seek'):
+                    photo.seek(0)
+        return await self.api.call_async("send_photo", self.bot.send_photo, chat_id, photo, caption=caption,
+                                         reply_markup=reply_markup, parse_mode="Markdown")
+
+    async def send_caption_text(self, chat_id, caption, reply_markup=None, message_id=None):
+        if message_id and reply_markup:
+            try:
+                return await self.api.call_async(
+                    "edit_message_text", self.bot.edit_message_text,
+                    chat_id=chat_id,
+                    message_id=message_id,
+                    text=caption,
+                    reply_markup=reply_markup,
+                    parse_mode="Markdown"
+                )
+            except ApiCallError as e:
+                if e.kind == NOT_MODIFIED:
+                    return None
+                if e.kind != MESSAGE_GONE:
+                    raise
+                self.app.metrics.fallback("message_gone")
+        return await self.send_message(chat_id, caption, reply_markup=reply_markup, parse_mode="Markdown")
+
+    async def send_photo_cached(self, chat_id, photo_path, caption, reply_markup=None, message_id=None):
+        photo_cache = self.app.photo_cache
+        file_id = photo_cache.get(photo_path)
+        if file_id:
+            try:
+                return await self._deliver_photo(chat_id, file_id, caption, reply_markup, message_id)
+            except ApiCallError as e:
+                if e.kind != MEDIA_INVALID:
+                    raise
+                logger.warning(f"Telegram отклонил file_id для {photo_path}: {e.error}")
+                self.app.metrics.fallback("file_id_rejected")
+                photo_cache.forget(photo_path)
+
+        # Файл читается целиком: aiohttp закрывает открытый файл после запроса, а повтор
+        # после 429 должен отправить его ещё раз
+        with open(photo_path, 'rb') as f:
+            photo = f.read()
+        sent = await self._deliver_photo(chat_id, photo, caption, reply_markup, message_id)
+
+        file_id = file_id_from_message(sent)
+        if file_id:
+            photo_cache.put(photo_path, file_id)
+        return sent
+
+    async def send_tea_photo(self, chat_id, tea_data, caption, reply_markup=None, message_id=None):
+        """Отправляет фото чая, а если фото нет или Telegram его не принял - текст"""
+        app = self.app
+        photo_path = app.tea_photo_path(tea_data)
+        if photo_path:
+            try:
+                await self.send_photo_cached(chat_id, photo_path, caption, reply_markup, message_id)
+                return True
+            except ApiCallError as e:
+                if e.kind != MEDIA_INVALID:
+                    logger.error(f"Фото {photo_path} не доставлено ({e.kind}): {e.error}")
+                    app.metrics.fallback("undelivered")
+                    return False
+                logger.warning(f"Telegram не принял фото {photo_path}, отправляем текст: {e.error}")
+                app.metrics.fallback("media_invalid")
+            except OSError as e:
+                logger.warning(f"Не удалось прочитать фото {photo_path}: {e}")
+                app.metrics.fallback("missing_file")
+
+        try:
+            await self.send_caption_text(chat_id, caption, reply_markup, message_id)
+        except ApiCallError as e:
+            logger.error(f"Подпись для {chat_id} не доставлена ({e.kind}): {e.error}")
+            app.metrics.fallback("undelivered")
+        return False
+
+    def send_broadcast_message(self, chat_id, text, photo_path):
+        """Вызывается из потока рассылки: ждёт отправки в цикле событий"""
+        return asyncio.run_coroutine_threadsafe(self._send_broadcast_message(chat_id, text, photo_path),
+                                                self.loop).result()
+
+    async def _send_broadcast_message(self, chat_id, text, photo_path):
+        if photo_path:
+            await self.send_photo_cached(chat_id, photo_path, text)
+        else:
+            await self.api.call_async("send_message", self.bot.send_message, chat_id, text)
+
+    def in_background(self, coroutine):
+        # Ссылка на задачу хранится до её завершения, иначе её может собрать сборщик мусора
+        task = asyncio.ensure_future(coroutine)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        return task
+
+    async def answer_callback(self, call):
+        try:
+            await self.api.call_async("answer_callback_query", self.bot.answer_callback_query, call.id)
+        except ApiCallError as e:
+            logger.warning(f"Не удалось подтвердить нажатие кнопки ({e.kind}): {e.error}")
+
+    async def delete_message(self, chat_id, message_id):
+        try:
+            await self.bot.delete_message(chat_id, message_id)
+        except Exception:
+            pass
+
+    # Сценарии
+
+    async def start(self, message):
+        user_id = message.chat.id
+        self.app.update_session(user_id, answers=0, state=State.MAIN)
+        await self.send_message(user_id, self.app.WELCOME_TEXT,
+                                    reply_markup=self.app.rendered().main_menu, parse_mode="Markdown")
+        event(logger, "bot_started", "Пользователь {user_id} начал работу с ботом", user_id=user_id)
+
+    async def start_test(self, message):
+        self.app.update_session(message.chat.id, answers=0, state=State.TEST)
+        await self.ask_question(message, self.app.next_question_index(0))
+
+    async def handle_main_menu(self, message):
+        user_id = message.chat.id
+        if message.text == "🍃 Пройти тест":
+            event(logger, "test_started", "Пользователь {user_id} начал тест", user_id=user_id)
+            await self.start_test(message)
+        elif message.text == "📖 Посмотреть меню":
+            event(logger, "menu_requested", "Пользователь {user_id} запросил меню", user_id=user_id)
+            await self.show_menu_page(message, page=0)
+        elif message.text == "🔄 Начать заново":
+            event(logger, "restarted", "Пользователь {user_id} начал заново", user_id=user_id)
+            await self.start(message)
+        elif message.text == "ℹ️ О чаях":
+            await self.send_message(user_id, self.app.TEA_INFO_TEXT,
+                                        reply_markup=self.app.rendered().main_menu, parse_mode="Markdown")
+
+    async def show_menu_page(self, message, page=0, message_id=None):
+        app = self.app
+        user_id = message.chat.id
+        pages = app.rendered().pages
+        if message_id is None:
+            if not 0 <= page < len(pages):
+                page = 0
+            app.update_session(user_id, state=State.BROWSING_MENU, menu_page=page)
+        else:
+            if not 0 <= page < len(pages):
+                return
+            app.update_session(user_id, menu_page=page)
+            self.flip_page(user_id, message_id, page)
+            return
+
+        menu_page = pages[page]
+        await self.send_tea_photo(user_id, menu_page.tea_data, menu_page.caption, menu_page.markup)
+
+    def flip_page(self, chat_id, message_id, page):
+        """Правит сообщение меню в фоне. Пока правка ждёт лимита, новое листание того же
+        сообщения только подменяет страницу - уйдёт одна правка с последней (как в outbound)"""
+        key = (chat_id, message_id)
+        waiting = key in self._page_flips
+        self._page_flips[key] = page
+        if waiting:
+            self.limiter.coalesced()
+            return
+        self.in_background(self._edit_menu_page(chat_id, message_id))
+
+    async def _edit_menu_page(self, chat_id, message_id):
+        key = (chat_id, message_id)
+        try:
+            await self.limiter.wait(chat_id)
+        finally:
+            page = self._page_flips.pop(key)
+        pages = self.app.rendered().pages
+        if page < len(pages):
+            menu_page = pages[page]
+            await self.send_tea_photo(chat_id, menu_page.tea_data, menu_page.caption, menu_page.markup, message_id)
+
+    async def send_quiz_card(self, chat_id, question_index, answers):
+        """Сообщение инлайн-теста с вопросом (с картинкой, если она есть)"""
+        app = self.app
+        caption = app.rendered().questions[question_index].text
+        markup = app.quiz_keyboard(question_index, answers)
+        photo_path = app.quiz_cover_path()
+        if photo_path:
+            try:
+                await self.send_photo_cached(chat_id, photo_path, caption, markup)
+                return
+            except ApiCallError as e:
+                logger.warning(f"Картинка теста не отправлена ({e.kind}), отправляем текст: {e.error}")
+            except OSError as e:
+                logger.warning(f"Не удалось прочитать картинку теста {photo_path}: {e}")
+        await self.send_message(chat_id, caption, reply_markup=markup, parse_mode="Markdown")
+
+    async def edit_quiz_card(self, message, question_index, answers):
+        """Следующий вопрос инлайн-теста в том же сообщении"""
+        app = self.app
+        chat_id = message.chat.id
+        caption = app.rendered().questions[question_index].text
+        markup = app.quiz_keyboard(question_index, answers)
+        try:
+            if message.photo:
+                await self.api.call_async("edit_message_caption", self.bot.edit_message_caption, caption=caption,
+                                          chat_id=chat_id, message_id=message.message_id, reply_markup=markup,
+                                          parse_mode="Markdown")
+            else:
+                await self.api.call_async("edit_message_text", self.bot.edit_message_text, caption,
+                                          chat_id=chat_id, message_id=message.message_id, reply_markup=markup,
+                                          parse_mode="Markdown")
+        except ApiCallError as e:
+            if e.kind == NOT_MODIFIED:
+                return
+            if e.kind != MESSAGE_GONE:
+                raise
+            await self.send_quiz_card(chat_id, question_index, answers)
+
+    async def ask_question(self, message, question_index):
+        app = self.app
+        user_id = message.chat.id
+        if question_index < len(app.QUESTIONS):
+            if app.QUIZ_UI == "inline":
+                await self.send_quiz_card(user_id, question_index, app.get_session(user_id).answers)
+            else:
+                question = app.rendered().questions[question_index]
+                await self.send_message(
+                    user_id,
+                    question.text,
+                    reply_markup=question.markup,
+                    parse_mode="Markdown"
+                )
+            app.update_session(user_id, state=State.question(question_index))
+        else:
+            await self.show_result(message)
+
+    async def handle_test_answer(self, message):
+        app = self.app
+        user_id = message.chat.id
+
+        if app.QUIZ_UI == "inline":
+            await self.send_message(user_id, app.USE_BUTTONS_TEXT, parse_mode="Markdown")
+            return
+
+        if message.text == app.CANCEL_BUTTON:
+            await self.send_message(user_id, app.TEST_CANCELLED_TEXT, reply_markup=app.rendered().main_menu)
+            app.cancel_test(user_id)
+            return
+
+        answered = app.record_text_answer(user_id, message.text)
+        if answered is None:
+            return
+        question_index, next_question = answered
+        if next_question is not None:
+            await self.ask_question(message, next_question)
+        else:
+            await self.send_message(user_id, app.INVALID_ANSWER_TEXT, parse_mode="Markdown")
+            await self.ask_question(message, question_index)
+
+    async def show_result(self, message, message_id=None):
+        app = self.app
+        user_id = message.chat.id
+        session = app.get_session(user_id)
+
+        try:
+            best_tea = app.test_result(session)
+        except KeyError:
+            await self.send_message(user_id, app.NO_TEST_TEXT, reply_markup=app.rendered().main_menu)
+            return
+
+        if not best_tea:
+            await self.send_message(user_id, app.NO_MATCH_TEXT, reply_markup=app.rendered().main_menu)
+            return
+
+        tea_name, tea_data, score, max_score = best_tea
+        await self.send_tea_photo(user_id, tea_data, app.result_caption(tea_name, tea_data, score, max_score),
+                                  app.rendered().result_markup, message_id)
+        app.complete_test(user_id, tea_name, score, max_score)
+
+    async def start_test_command(self, message):
+        event(logger, "test_started", "Пользователь {user_id} начал тест через команду", user_id=message.chat.id,
+              source="command")
+        await self.start_test(message)
+
+    async def show_help(self, message):
+        await self.send_message(message.chat.id, self.app.HELP_TEXT,
+                                    reply_markup=self.app.rendered().main_menu, parse_mode="Markdown")
+        event(logger, "help_requested", "Пользователь {user_id} запросил справку", user_id=message.chat.id)
+
+    async def command_menu(self, message):
+        await self.show_menu_page(message, page=0)
+
+    async def command_broadcast(self, message):
+        app = self.app
+        if not app.is_admin(message.chat.id):
+            return
+        await self.send_message(message.chat.id, app.broadcast_command(self.broadcaster, message))
+
+    async def handle_other_messages(self, message):
+        app = self.app
+        user_id = message.chat.id
+        if message.text and message.text.startswith('/'):
+            return
+
+        session = app.sessions.get(user_id)
+        if session is None or session.state == State.MAIN:
+            await self.send_message(user_id, app.GREETING_TEXT,
+                                        reply_markup=app.rendered().main_menu, parse_mode="Markdown")
+        else:
+            await self.send_message(user_id, app.USE_BUTTONS_TEXT, parse_mode="Markdown")
+
+    async def callback_menu_page(self, call, page):
+        await self.show_menu_page(call.message, page=page, message_id=call.message.message_id)
+
+    async def callback_main_menu(self, call):
+        # Удаление старого сообщения и отправка нового друг от друга не зависят
+        user_id = call.message.chat.id
+        await asyncio.gather(
+            self.delete_message(user_id, call.message.message_id),
+            self.send_message(user_id, self.app.MAIN_MENU_TEXT,
+                              reply_markup=self.app.rendered().main_menu, parse_mode="Markdown")
+        )
+
+    async def callback_start_test(self, call):
+        app = self.app
+        if app.QUIZ_UI == "inline" and call.message.photo:
+            # Сообщение с фото само становится сообщением теста
+            user_id = call.message.chat.id
+            question_index = app.next_question_index(0)
+            app.update_session(user_id, answers=0, state=State.TEST)
+            await self.edit_quiz_card(call.message, question_index, 0)
+            app.update_session(user_id, state=State.question(question_index))
+            return
+        await asyncio.gather(
+            self.delete_message(call.message.chat.id, call.message.message_id),
+            self.start_test(call.message)
+        )
+
+    async def callback_show_menu(self, call):
+        await asyncio.gather(
+            self.delete_message(call.message.chat.id, call.message.message_id),
+            self.show_menu_page(call.message, page=0)
+        )
+
+    async def callback_answer(self, call, question_index, option, answers):
+        app = self.app
+        user_id = call.message.chat.id
+        next_question = app.record_inline_answer(user_id, question_index, option, answers)
+        if next_question is None:
+            return
+        if next_question < len(app.QUESTIONS):
+            await self.edit_quiz_card(call.message, next_question, app.get_session(user_id).answers)
+            app.update_session(user_id, state=State.question(next_question))
+        elif call.message.photo:
+            await self.show_result(call.message, message_id=call.message.message_id)
+        else:
+            await asyncio.gather(
+                self.delete_message(user_id, call.message.message_id),
+                self.show_result(call.message)
+            )
+
+    async def callback_cancel_test(self, call):
+        app = self.app
+        user_id = call.message.chat.id
+        if State.question_index(app.get_session(user_id).state) is None:
+            return
+        await asyncio.gather(
+            self.delete_message(user_id, call.message.message_id),
+            self.send_message(user_id, app.TEST_CANCELLED_TEXT, reply_markup=app.rendered().main_menu)
+        )
+        app.cancel_test(user_id)
+
+    async def handle_inline_query(self, query):
+        results, next_offset = self.app.inline_results(query.query, query.offset)
+        await self.bot.answer_inline_query(query.id, results, cache_time=self.app.INLINE_CACHE_TIME,
+                                           next_offset=next_offset)
+
+    async def run_webhook(self):
+        """Принимает обновления встроенным сервером вебхука и обрабатывает их в цикле событий"""
+        app = self.app
+        loop = asyncio.get_running_loop()
+        # Ограничиваем число обновлений в обработке: при переполнении очередь вебхука ответит 503
+        in_flight = threading.BoundedSemaphore(app.WEBHOOK_QUEUE_SIZE)
+
+        def submit(updates):
+            in_flight.acquire()
+            future = asyncio.run_coroutine_threadsafe(self.bot.process_new_updates(updates), loop)
+            future.add_done_callback(lambda _: in_flight.release())
+
+        server = app.create_webhook_server(submit)
+        if app.WEBHOOK_URL:
+            await self.bot.set_webhook(url=app.WEBHOOK_URL, secret_token=app.WEBHOOK_SECRET)
+            logger.info(f"🌐 Вебхук зарегистрирован: {app.WEBHOOK_URL}")
+        threading.Thread(target=server.serve_forever, name="webhook-server", daemon=True).start()
+        try:
+            await asyncio.Event().wait()
+        finally:
+            server.stop()
+            logger.info(f"Статистика вебхука: {server.stats()}")
+
+    async def run(self, polling_timeout=60):
+        session_manager = PooledSessionManager()
+        asyncio_helper.session_manager = session_manager
+        self.loop = asyncio.get_running_loop()
+        try:
+            bot_info = await self.bot.get_me()
+            logger.info(f"✅ Бот успешно запущен в асинхронном режиме: @{bot_info.username}")
+            logger.info(f"🔌 Пул соединений: {session_manager.pool_size}")
+            self.broadcaster.resume()
+            if self.app.BOT_MODE == "webhook":
+                await self.run_webhook()
+            else:
+                await self.bot.delete_webhook()
+                await self.bot.infinity_polling(timeout=polling_timeout, request_timeout=polling_timeout + 5)
+        finally:
+            # Поток рассылки ждёт отправок в этом цикле, поэтому останавливается не блокируя его
+            await asyncio.to_thread(self.broadcaster.stop, 10)
+            logger.info(f"Статистика лимитов отправки: {self.limiter.stats()}")
+            await session_manager.close()
+
+
+def run(app, token):
+    """Запускает бота в асинхронном режиме (блокирует до остановки)"""
+    if app.TELEGRAM_API_URL:
+        asyncio_helper.API_URL = app.TELEGRAM_API_URL
+    app.metrics.instrument_api(asyncio_helper, "_process_request")
+    try:
+        asyncio.run(AsyncEngine(app, token).run())
+    except KeyboardInterrupt:
+        # Ctrl+C: asyncio.run уже отменил задачи, и finally в AsyncEngine.run отработал
+        logger.info("Бот остановлен")
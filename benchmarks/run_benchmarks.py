@@ -0,0 +1,314 @@
+"""Микробенчмарки горячих функций бота.
+
+Бот импортируется офлайн: токен фиктивный, сессии в памяти, а вызовы Telegram API
+заменены заглушкой, которая сразу возвращает ответ. Результаты пишутся в JSON;
+с --baseline текущий прогон сравнивается с сохранённым и замедления больше порога
+отмечаются как регрессии (код выхода 1).
+
+    python benchmarks/run_benchmarks.py --output bench.json
+    python benchmarks/run_benchmarks.py --baseline bench.json --threshold 0.2
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CWD = os.getcwd()
+
+# Окружение для офлайн-импорта bot.py: каталог и фото берутся из репозитория
+os.chdir(ROOT)
+sys.path.insert(0, ROOT)
+os.environ.setdefault('TELEGRAM_BOT_TOKEN', '0:benchmark')
+os.environ.setdefault('BOT_DATA_DIR', tempfile.mkdtemp(prefix='chaybar-bench-'))
+os.environ.setdefault('SESSION_BACKEND', 'memory')
+logging.disable(logging.WARNING)
+
+import bot  # noqa: E402
+from recommender import TeaRecommender  # noqa: E402
+from catalog import Catalog  # noqa: E402
+from render import Rendered  # noqa: E402
+from search import SearchIndex  # noqa: E402
+from quiz_tree import QuizTree  # noqa: E402
+
+# Размеры синтетических каталогов
+SYNTHETIC_SIZES = (10, 1000, 100000)
+
+# Размеры синтетических каталогов для инлайн-поиска
+SEARCH_SIZES = (1000, 10000)
+
+# Минимальное время одного замера и число замеров
+MIN_TIME = 0.05
+REPEATS = 5
+
+
+class FakeBot:
+    """Заглушка TeleBot: методы отправки сразу возвращают сообщение с фото"""
+
+    def __init__(self):
+        self.calls = 0
+        self._message = SimpleNamespace(message_id=1, photo=[SimpleNamespace(file_id="BENCH_FILE_ID")])
+
+    def _call(self, *args, **kwargs):
+        self.calls += 1
+        return self._message
+
+    send_message = send_photo = edit_message_media = edit_message_text = delete_message = _call
+
+
+class NoPhotoCache:
+    """Кэш file_id, в котором ничего нет: каждое фото загружается заново"""
+
+    def get(self, path):
+        return None
+
+    def put(self, path, file_id):
+        pass
+
+    def forget(self, path):
+        pass
+
+
+def measure(func, min_time=MIN_TIME, repeats=REPEATS):
+    """Время одного вызова func в секундах: медиана и минимум по нескольким замерам"""
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or number >= 1 << 20:
+            break
+        number *= 2 if elapsed <= 0 else max(2, min(10, int(min_time / elapsed) + 1))
+
+    samples = [elapsed / number]
+    for _ in range(repeats - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter() - start) / number)
+    return {"median": statistics.median(samples), "min": min(samples), "number": number, "repeats": repeats}
+
+
+def synthetic_menu(size, questions, seed=0):
+    """Каталог из size чаев со случайными характеристиками из вариантов ответов"""
+    rng = random.Random(seed)
+    keys = ["type", "strength", "caffeine", "taste", "aroma"]
+    values = [list(question["options"].values()) + ["other"] for question in questions]
+    return {
+        f"Чай {index}": {
+            "description": "Синтетический чай для бенчмарка.",
+            "price": 100 + index % 200,
+            "characteristics": {keys[i]: rng.choice(values[i]) for i in range(len(questions))},
+            "photo_file": None,
+        }
+        for index in range(size)
+    }
+
+
+def all_answer_combinations(questions):
+    return [
+        {f"q{i}": value for i, value in enumerate(combo)}
+        for combo in itertools.product(*[question["options"].values() for question in questions])
+    ]
+
+
+def collect_benchmarks():
+    """Список (имя, функция без аргументов)"""
+    questions = bot.QUESTIONS
+    snapshot = bot.current_catalog()
+    catalog = snapshot.catalog
+    combos = all_answer_combinations(questions)
+    benchmarks = []
+
+    # Подбор чая: полный перебор ответов на текущем меню
+    def find_best_tea_all():
+        for prefs in combos:
+            bot.find_best_tea(prefs, catalog.menu)
+
+    def recommender_all():
+        for prefs in combos:
+            snapshot.recommender.best(prefs)
+
+    def result_table_all():
+        for prefs in combos:
+            snapshot.results.lookup(prefs)
+
+    benchmarks += [
+        (f"find_best_tea.all_combinations[{len(combos)}]", find_best_tea_all),
+        (f"recommender.best.all_combinations[{len(combos)}]", recommender_all),
+        (f"result_table.lookup.all_combinations[{len(combos)}]", result_table_all),
+        ("quiz_tree.build", lambda: QuizTree.build(snapshot.recommender, snapshot.results, questions)),
+    ]
+
+    # Подбор чая на синтетических каталогах разного размера
+    rng = random.Random(1)
+    sample = [rng.choice(combos) for _ in range(20)]
+    for size in SYNTHETIC_SIZES:
+        menu = synthetic_menu(size, questions)
+        recommender = TeaRecommender(menu, questions)
+
+        def find_best_tea_synthetic(menu=menu):
+            for prefs in sample:
+                bot.find_best_tea(prefs, menu)
+
+        def recommender_synthetic(recommender=recommender):
+            for prefs in sample:
+                recommender.best(prefs)
+
+        benchmarks += [
+            (f"find_best_tea.synthetic[{size}]x{len(sample)}", find_best_tea_synthetic),
+            (f"recommender.best.synthetic[{size}]x{len(sample)}", recommender_synthetic),
+        ]
+
+    # Инлайн-поиск: текущий каталог и синтетические, где под "чай" подходит каждый чай
+    index = SearchIndex.from_catalog(catalog, bot.describe_tea)
+    benchmarks += [
+        ("search.prefix", lambda: index.search("ул")),
+        ("search.words", lambda: index.search("пуэр земл")),
+        ("inline_results", lambda: bot.inline_results("чай")),
+    ]
+    for size in SEARCH_SIZES:
+        synthetic = Catalog(synthetic_menu(size, questions), questions, bot.TEA_PHOTOS_DIR)
+        synthetic_index = SearchIndex.from_catalog(synthetic, bot.describe_tea)
+        benchmarks += [
+            (f"search.all_match[{size}]", lambda i=synthetic_index: i.search("чай")),
+            (f"search.two_words[{size}]", lambda i=synthetic_index: i.search("синтетич зелен")),
+            (f"search.none[{size}]", lambda i=synthetic_index: i.search("улунн")),
+        ]
+
+    # Клавиатуры и подписи
+    total_pages = len(catalog)
+
+    def menu_captions():
+        for page in range(total_pages):
+            tea_name, tea_data = catalog.page(page)
+            bot.menu_page_caption(page, tea_name, tea_data, total_pages)
+
+    def menu_keyboards():
+        for page in range(total_pages):
+            bot.get_menu_keyboard(page, total_pages).to_json()
+
+    benchmarks += [
+        ("main_menu", lambda: bot.main_menu().to_json()),
+        (f"get_menu_keyboard.all_pages[{total_pages}]", menu_keyboards),
+        (f"menu_page_caption.all_pages[{total_pages}]", menu_captions),
+        ("render.rebuild", lambda: Rendered(bot, catalog)),
+        ("render.cached", bot.rendered),
+    ]
+
+    # Выбор обработчика текстового сообщения: команда, кнопка, сообщение до яруса состояний
+    def text_message(text):
+        return SimpleNamespace(text=text, chat=SimpleNamespace(id=1))
+
+    benchmarks += [
+        ("router.resolve.command", lambda m=text_message("/start"): bot.router.resolve(m)),
+        ("router.resolve.button", lambda m=text_message(bot.MAIN_MENU_BUTTONS[-1]): bot.router.resolve(m)),
+        ("router.resolve.fallback", lambda m=text_message("привет"): bot.router.resolve(m)),
+        ("callbacks.resolve", lambda data=bot.callbacks.encode("menu_page", 1): bot.callback_router.resolve(data)),
+        ("callbacks.resolve.legacy", lambda: bot.callback_router.resolve("menu_page_1")),
+    ]
+
+    # Отправка фото по всем веткам send_tea_photo
+    fake_bot = FakeBot()
+    bot.bot = fake_bot
+    cached_photos = bot.photo_cache
+    no_photos = NoPhotoCache()
+    tea_name, tea_data = next(
+        (name, tea) for name, tea in zip(catalog.names, catalog.teas) if tea.get("photo_file")
+        and os.path.exists(os.path.join(bot.TEA_PHOTOS_DIR, tea["photo_file"]))
+    )
+    missing_tea = dict(tea_data, photo_file="нет_такого_файла.jpg")
+    text_tea = dict(tea_data, photo_file=None)
+    caption = bot.rendered().pages[0].caption
+    markup = bot.rendered().pages[0].markup
+
+    def send_photo_cached():
+        bot.send_tea_photo(1, tea_name, tea_data, caption, markup)
+
+    def send_photo_upload():
+        bot.photo_cache = no_photos
+        try:
+            bot.send_tea_photo(1, tea_name, tea_data, caption, markup)
+        finally:
+            bot.photo_cache = cached_photos
+
+    message = SimpleNamespace(chat=SimpleNamespace(id=1))
+    benchmarks += [
+        ("send_tea_photo.photo_cached_file_id", send_photo_cached),
+        ("send_tea_photo.photo_upload", send_photo_upload),
+        ("send_tea_photo.missing_file", lambda: bot.send_tea_photo(1, tea_name, missing_tea, caption, markup)),
+        ("send_tea_photo.no_photo", lambda: bot.send_tea_photo(1, tea_name, text_tea, caption, markup)),
+        ("show_menu_page", lambda: bot.show_menu_page(message, 1)),
+    ]
+    return benchmarks
+
+
+def compare(results, baseline, threshold):
+    """Сравнивает медианы с базовым прогоном и возвращает список регрессий"""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"  {name}: нет в базовом прогоне")
+            continue
+        ratio = result["median"] / base["median"] if base["median"] else float("inf")
+        mark = "РЕГРЕССИЯ" if ratio > 1 + threshold else ("быстрее" if ratio < 1 - threshold else "")
+        print(f"  {name}: {base['median'] * 1e6:.2f} -> {result['median'] * 1e6:.2f} мкс (x{ratio:.2f}) {mark}")
+        if ratio > 1 + threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Микробенчмарки бота")
+    parser.add_argument("--output", help="куда сохранить результаты (JSON)")
+    parser.add_argument("--baseline", help="JSON предыдущего прогона для сравнения")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="допустимое замедление относительно базового прогона (0.2 = 20%%)")
+    parser.add_argument("--filter", help="запускать только бенчмарки, в имени которых есть эта строка")
+    args = parser.parse_args()
+    # Пути из аргументов - относительно папки, из которой запущен скрипт
+    output = os.path.join(CWD, args.output) if args.output else None
+    baseline_path = os.path.join(CWD, args.baseline) if args.baseline else None
+
+    results = {}
+    for name, func in collect_benchmarks():
+        if args.filter and args.filter not in name:
+            continue
+        results[name] = measure(func)
+        print(f"{name}: {results[name]['median'] * 1e6:.2f} мкс")
+
+    report = {
+        "meta": {
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if baseline_path:
+        with open(baseline_path, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        print(f"Сравнение с {args.baseline} (порог {args.threshold:.0%}):")
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"Регрессий: {len(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
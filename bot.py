@@ -1,17 +1,44 @@
 import telebot
 from telebot import types
+from telebot.util import extract_arguments
 import os
+import sys
+import secrets
 import logging
 from datetime import datetime
+from concurrent.futures import Future
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler()
-    ]
+from photo_cache import PhotoFileIdCache, file_id_from_message
+from recommender import TeaRecommender
+import result_table
+from session_store import Session, State, create_session_store, DEFAULT_TTL
+from update_scheduler import ChatUpdateScheduler
+from webhook_server import WebhookServer
+from outbound import OutboundDispatcher
+from render import RenderCache
+from catalog import CatalogLoader, CatalogSnapshot
+from image_optimizer import PhotoOptimizer, log_report
+from metrics import BotMetrics, MetricsServer
+from router import MessageRouter
+from callbacks import CallbackCodec, CallbackRouter
+from search import SearchIndexCache
+from quiz_tree import QuizTree
+from recommender import EXACT_MATCH_SCORE
+from transport import PooledTransport
+from broadcast import Broadcaster
+from log_pipeline import setup_logging, parse_sample_rates, event
+from api_errors import ApiCaller, ApiCallError, classify, NOT_MODIFIED, MESSAGE_GONE, MEDIA_INVALID
+
+# Настройка логирования: обработчики только ставят записи в очередь, пишет их фоновый поток.
+# LOG_FORMAT=json - по записи JSON на строку; LOG_SAMPLE - доля записи событий по типам
+log_pipeline = setup_logging(
+    level=os.getenv('LOG_LEVEL', 'INFO'),
+    fmt=os.getenv('LOG_FORMAT', 'text'),
+    sample_rates=parse_sample_rates(os.getenv('LOG_SAMPLE')),
+    queue_size=int(os.getenv('LOG_QUEUE_SIZE', 10000))
 )
+# У telebot свой синхронный обработчик; его записи тоже идут через очередь
+telebot.logger.handlers.clear()
 logger = logging.getLogger(__name__)
 
 # Получаем токен из переменной окружения TELEGRAM_BOT_TOKEN
@@ -22,7 +49,76 @@ if not TOKEN:
     logger.info("Пример: export TELEGRAM_BOT_TOKEN='ваш_токен' или создайте файл .env")
     exit(1)
 
-bot = telebot.TeleBot(TOKEN)
+# Адрес Bot API (локальный сервер Bot API или заглушка нагрузочного теста), формат telebot: .../bot{0}/{1}
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL')
+if TELEGRAM_API_URL:
+    telebot.apihelper.API_URL = TELEGRAM_API_URL
+
+# Общий пул keep-alive соединений к Bot API для всех потоков вместо сессии на поток.
+# Размер пула - не меньше числа потоков, которые одновременно ходят в API (воркеры, outbound, polling)
+transport = PooledTransport(
+    pool_size=int(os.getenv('HTTP_POOL_SIZE', 16)),
+    connect_timeout=float(os.getenv('HTTP_CONNECT_TIMEOUT', 5)),
+    read_timeout=float(os.getenv('HTTP_READ_TIMEOUT', 30)),
+    pool_block=os.getenv('HTTP_POOL_BLOCK', '0') == '1'
+)
+transport.install(telebot.apihelper)
+
+# Обработчики выполняются в воркерах планировщика обновлений, поэтому внутренний пул telebot не нужен
+bot = telebot.TeleBot(TOKEN, threaded=False)
+
+# Метрики в формате Prometheus на http://METRICS_HOST:METRICS_PORT/metrics (0 - не поднимать сервер)
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', 9100))
+metrics = BotMetrics()
+
+# Исходящие вызовы API идут через очередь с лимитами Telegram (~30 сообщений/с всего, ~1/с на чат).
+# Каждый вызов API, включая повторы после 429, считается в метриках попыток здесь
+outbound = OutboundDispatcher(
+    bot,
+    global_rate=float(os.getenv('OUTBOUND_GLOBAL_RATE', 30)),
+    chat_rate=float(os.getenv('OUTBOUND_CHAT_RATE', 1)),
+    chat_burst=float(os.getenv('OUTBOUND_CHAT_BURST', 3)),
+    workers=int(os.getenv('OUTBOUND_WORKERS', 8)),
+    on_attempt=metrics.attempt
+)
+
+# Режим работы: sync - TeleBot с пулом воркеров, async - AsyncTeleBot (см. async_engine.py)
+BOT_ENGINE = os.getenv('BOT_ENGINE', 'sync')
+
+# Получение обновлений: polling - long polling, webhook - встроенный HTTP-сервер
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')  # Публичный адрес вебхука; если не задан, вебхук не регистрируется
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', 8080))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+WEBHOOK_QUEUE_SIZE = int(os.getenv('WEBHOOK_QUEUE_SIZE', 1000))
+
+# Вебхук зарегистрирован снаружи (WEBHOOK_URL не задан): случайный секрет Telegram не узнает,
+# и каждое обновление получит 403, поэтому без общего секрета не запускаемся
+if BOT_MODE == "webhook" and not WEBHOOK_URL and not WEBHOOK_SECRET:
+    logger.error("WEBHOOK_SECRET обязателен, если вебхук регистрирует не этот процесс (WEBHOOK_URL не задан)")
+    exit(1)
+
+# Администраторы (через запятую): им доступны /broadcast, /broadcast_status и /broadcast_cancel
+ADMIN_CHAT_IDS = frozenset(int(chat_id) for chat_id in os.getenv('ADMIN_CHAT_IDS', '').split(',') if chat_id.strip())
+
+# Инлайн-поиск (@бот улун): сколько секунд Telegram может отдавать ответ на запрос из своего кэша
+INLINE_CACHE_TIME = int(os.getenv('INLINE_CACHE_TIME', 300))
+
+# Нажатие инлайн-кнопки подтверждается сразу при получении и вне очереди чата: у пользователя
+# пропадают часики на кнопке, не дожидаясь очереди воркера, правок и отправок
+def acknowledge_callback(update):
+    if update.callback_query is not None:
+        outbound.submit("answer_callback_query", update.callback_query.id, ordered=False)
+
+# Обновления одного чата обрабатываются по порядку, разных чатов - параллельно
+scheduler = ChatUpdateScheduler(
+    workers=int(os.getenv('UPDATE_WORKERS', 4)),
+    queue_size=int(os.getenv('UPDATE_QUEUE_SIZE', 1000)),
+    on_receive=acknowledge_callback
+)
 
 # Путь к папке с фотографиями чая
 TEA_PHOTOS_DIR = "tea_photos"
@@ -32,57 +128,31 @@ if not os.path.exists(TEA_PHOTOS_DIR):
     logger.warning(f"Папка {TEA_PHOTOS_DIR} не найдена. Создайте её и добавьте фотографии чаев.")
     os.makedirs(TEA_PHOTOS_DIR, exist_ok=True)
 
-# Меню чаев с путями к фотографиям
-TEA_MENU = {
-    "Зеленый чай Сенча": {
-        "description": "Японский зеленый чай с нежным травяным вкусом и свежим ароматом. Идеален для утреннего пробуждения.",
-        "price": 180,
-        "characteristics": {"type": "green", "strength": "light", "caffeine": "medium", "taste": "fresh", "aroma": "grassy"},
-        "photo_file": "Сенча.png"
-    },
-    "Улун Те Гуань Инь": {
-        "description": "Китайский улун с цветочным ароматом и медовым послевкусием. Ценится за сложный букет.",
-        "price": 220,
-        "characteristics": {"type": "oolong", "strength": "medium", "caffeine": "medium", "taste": "floral", "aroma": "orchid"},
-        "photo_file": "улун_те_гуань_инь.jpg"
-    },
-    "Черный чай Дарджилинг": {
-        "description": "Индийский черный чай с мускатными нотками, 'чайное шампанское'. Элегантный и бодрящий.",
-        "price": 200,
-        "characteristics": {"type": "black", "strength": "strong", "caffeine": "high", "taste": "muscatel", "aroma": "fruity"},
-        "photo_file": "индия.jpg"
-    },
-    "Белый чай Бай Хао Инь Чжэнь": {
-        "description": "Нежный белый чай из нераспустившихся почек с тонким цветочным вкусом. Утонченный выбор.",
-        "price": 250,
-        "characteristics": {"type": "white", "strength": "very_light", "caffeine": "low", "taste": "delicate", "aroma": "honey"},
-        "photo_file": "белый.jpg"
-    },
-    "Пуэр Шу": {
-        "description": "Ферментированный чай с землистым вкусом и глубоким послевкусием. С возрастом становится лучше.",
-        "price": 240,
-        "characteristics": {"type": "pu-erh", "strength": "very_strong", "caffeine": "medium", "taste": "earthy", "aroma": "woody"},
-        "photo_file": "шу_пуэр.jpg"
-    },
-    "Ройбуш": {
-        "description": "Южноафриканский травяной настой без кофеина со сладковатым вкусом. Успокаивающий напиток.",
-        "price": 160,
-        "characteristics": {"type": "herbal", "strength": "light", "caffeine": "none", "taste": "sweet", "aroma": "nutty"},
-        "photo_file": "Ройбуш.jpg"
-    },
-    "Чай с жасмином": {
-        "description": "Зеленый чай, ароматизированный цветами жасмина. Благоухающий и освежающий.",
-        "price": 190,
-        "characteristics": {"type": "scented", "strength": "light", "caffeine": "medium", "taste": "floral", "aroma": "jasmine"},
-        "photo_file": "жасмин.jpg"
-    },
-    "Иван-чай": {
-        "description": "Традиционный русский травяной напиток с мягким вкусом. Натуральный и полезный.",
-        "price": 170,
-        "characteristics": {"type": "herbal", "strength": "medium", "caffeine": "none", "taste": "herbal", "aroma": "meadow"},
-        "photo_file": "иван_чай.jpg"
-    }
-}
+# Папка для служебных данных бота (кэши, состояние)
+DATA_DIR = os.getenv('BOT_DATA_DIR', 'data')
+os.makedirs(DATA_DIR, exist_ok=True)
+
+# Кэш file_id загруженных фотографий, чтобы не загружать файлы повторно
+photo_cache = PhotoFileIdCache(
+    os.getenv('PHOTO_CACHE_FILE', os.path.join(DATA_DIR, 'photo_file_ids.json'))
+)
+
+# Оптимизированные для Telegram варианты фото (JPEG, до 1280 px, без метаданных)
+PHOTO_OPTIMIZE = os.getenv('PHOTO_OPTIMIZE', '1') == '1'
+photo_optimizer = PhotoOptimizer(
+    os.getenv('PHOTO_VARIANTS_DIR', os.path.join(DATA_DIR, 'photo_variants')),
+    max_side=int(os.getenv('PHOTO_MAX_SIDE', 1280)),
+    quality=int(os.getenv('PHOTO_QUALITY', 85))
+)
+
+def optimize_photos(catalog):
+    """Готовит варианты всех найденных фото каталога и пишет отчёт об экономии"""
+    if PHOTO_OPTIMIZE:
+        sources = [os.path.join(catalog.photos_dir, photo_file) for photo_file in catalog.available_photos]
+        log_report(photo_optimizer.optimize(sources))
+
+# Файл каталога чаев: правки подхватываются без перезапуска бота
+CATALOG_FILE = os.getenv('CATALOG_FILE', 'tea_menu.json')
 
 # Вопросы теста для чайного сомелье
 QUESTIONS = [
@@ -137,176 +207,519 @@ QUESTIONS = [
     }
 ]
 
-# Хранилище ответов пользователей и состояний меню
-user_responses = {}
-user_states = {}
-user_menu_pages = {}  # Для хранения текущей страницы меню пользователя
+# Тест: full - все вопросы по порядку, adaptive - следующий вопрос выбирается по дереву решений,
+# и тест заканчивается, как только ответы на оставшиеся вопросы уже не могут изменить рекомендацию
+QUIZ_MODE = os.getenv('QUIZ_MODE', 'full')
+
+# Вид теста: keyboard - вопрос новым сообщением с обычной клавиатурой, inline - одно сообщение
+# с инлайн-кнопками, которое правится на месте (следующий вопрос, затем результат)
+QUIZ_UI = os.getenv('QUIZ_UI', 'keyboard')
+
+# Картинка сообщения инлайн-теста (по умолчанию - первое фото каталога)
+QUIZ_COVER_PHOTO = os.getenv('QUIZ_COVER_PHOTO')
+
+# Готовые результаты для всех комбинаций ответов (пересобираются при изменении меню или вопросов)
+RESULT_TABLE_FILE = os.getenv('RESULT_TABLE_FILE', os.path.join(DATA_DIR, 'result_table.npz'))
+
+def prepare_catalog(catalog):
+    """Движок подбора и таблица результатов для новой версии каталога (до её подмены)"""
+    # Новые фото при перезагрузке каталога оптимизируем до подмены (первую загрузку - при запуске)
+    if catalog_loader.current is not None:
+        optimize_photos(catalog)
+    # Характеристики чаев закодированы в матрицу один раз на версию каталога
+    recommender = TeaRecommender(catalog.menu, catalog.questions)
+    results = result_table.load_or_build(recommender, catalog.menu, catalog.questions, RESULT_TABLE_FILE)
+    quiz = QuizTree.build(recommender, results, catalog.questions) if QUIZ_MODE == "adaptive" else None
+    return CatalogSnapshot(catalog, recommender, results, quiz)
+
+catalog_loader = CatalogLoader(
+    CATALOG_FILE,
+    QUESTIONS,
+    TEA_PHOTOS_DIR,
+    prepare=prepare_catalog,
+    interval=float(os.getenv('CATALOG_WATCH_INTERVAL', 2))
+)
+catalog_loader.load()
+
+def current_catalog():
+    """Текущая версия каталога вместе с движком подбора и таблицей результатов.
+
+    Обработчик берёт её один раз и работает с ней до конца, даже если каталог подменят.
+    """
+    return catalog_loader.current
+
+# Подписи и сериализованная разметка собираются один раз на версию каталога
+render_cache = RenderCache(sys.modules[__name__])
+
+def rendered(snapshot=None):
+    """Готовые подписи и клавиатуры для текущей версии каталога"""
+    return render_cache.get((snapshot or current_catalog()).catalog)
+
+# Хранилище сессий: состояние, ответы теста и текущая страница меню каждого чата
+sessions = create_session_store(
+    os.getenv('SESSION_BACKEND', 'sqlite'),
+    path=os.getenv('SESSION_DB', os.path.join(DATA_DIR, 'sessions.db')),
+    ttl=int(os.getenv('SESSION_TTL', DEFAULT_TTL))
+)
+
+# Датчики считаются в момент запроса метрик
+metrics.gauge("chaybar_active_sessions", "Сессии в хранилище", sessions.count)
+metrics.gauge("chaybar_update_queue_depth", "Обновления в очередях воркеров",
+              lambda: sum(scheduler.stats()["queue_depth"]))
+metrics.gauge("chaybar_outbound_queued", "Исходящие вызовы в очереди", lambda: outbound.stats()["queued"])
+metrics.gauge("chaybar_http_requests", "Запросы к Bot API через общий пул соединений",
+              lambda: transport.stats()["requests"])
+metrics.gauge("chaybar_http_connections_opened", "Открытые за всё время соединения к Bot API",
+              transport.connections_opened)
+metrics.gauge("chaybar_photo_file_ids", "Сохранённые file_id фотографий", lambda: len(photo_cache))
+metrics.gauge("chaybar_log_queue_depth", "Записи лога, ждущие потока записи", lambda: log_pipeline.stats()["queued"])
+metrics.gauge("chaybar_log_dropped", "Записи лога, отброшенные из-за переполнения очереди",
+              lambda: log_pipeline.stats()["dropped_full"])
+
+def get_session(user_id):
+    """Возвращает сессию чата (новую, если чат ещё не писал боту)"""
+    session = sessions.get(user_id)
+    return session if session is not None else Session()
+
+def update_session(user_id, **fields):
+    """Меняет поля сессии чата и сохраняет её в хранилище"""
+    session = get_session(user_id)
+    for name, value in fields.items():
+        setattr(session, name, value)
+    sessions.put(user_id, session)
+    return session
+
+# Кнопки главного меню
+MAIN_MENU_BUTTONS = ["🍃 Пройти тест", "📖 Посмотреть меню", "🔄 Начать заново", "ℹ️ О чаях"]
+CANCEL_BUTTON = "🔙 Отмена"
+
+# Состояния, в которых чат отвечает на вопросы теста
+QUESTION_STATES = tuple(State.question(i) for i in range(len(QUESTIONS)))
+
+# Текст варианта -> номер варианта для каждого вопроса (номера хранятся в сессии)
+QUESTION_OPTIONS = [{text: index for index, text in enumerate(question["options"])} for question in QUESTIONS]
+
+# Текстовые сообщения выбираются по таблицам команд, кнопок и состояний;
+# приоритет - порядок регистрации обработчиков ниже
+router = MessageRouter(lambda chat_id: get_session(chat_id).state)
+bot.register_message_handler(router.dispatch)
+
+# Действия инлайн-кнопок: имя, код в callback_data и типы аргументов
+callbacks = CallbackCodec()
+callbacks.action("menu_page", "p", int)
+callbacks.action("current_page", "c")
+callbacks.action("main_menu", "m")
+callbacks.action("start_test", "t")
+callbacks.action("show_menu", "s")
+# Ответ в инлайн-тесте: вопрос, вариант и ответы до этого вопроса (упакованные, как в сессии)
+callbacks.action("answer", "a", int, int, int)
+callbacks.action("cancel_test", "x")
+# Кнопки старого формата на уже отправленных сообщениях
+callbacks.legacy_prefix("menu_page_", "menu_page")
+callbacks.legacy("current_page", "current_page")
+callbacks.legacy("to_main_menu", "main_menu")
+callbacks.legacy("start_test_from_menu", "start_test")
+callbacks.legacy("start_test_from_result", "start_test")
+callbacks.legacy("show_menu_from_result", "show_menu")
+
+# Нажатие кнопки уходит обработчику действия по коду из callback_data
+callback_router = CallbackRouter(callbacks)
+
+# Ошибку фоновой отправки некому вернуть - пишем её в лог
+def log_background_error(future):
+    if future.cancelled():
+        return
+    error = future.exception()
+    if error is not None:
+        logger.error(f"Ошибка фоновой отправки: {error}")
+
+# Долгие продолжения нажатий (загрузка фото, новые сообщения) снова встают в очередь
+# воркера чата: воркер сразу берёт следующие обновления, а состояние чата по-прежнему
+# меняется строго по очереди, без гонок с новыми нажатиями и ответами
+def defer(chat_id, function, *args):
+    scheduler.submit_task(chat_id, function, *args)
+
+bot.register_callback_query_handler(callback_router.dispatch, func=None)
+
+# Тексты сообщений
+WELCOME_TEXT = (
+    "🍃 *Добро пожаловать в бота-чайного сомелье!*\n\n"
+    "Я помогу подобрать идеальный чайный напиток для вас!\n\n"
+    "Пройти тест из 5 вопросов - и я найду чай,\n"
+    "который идеально соответствует вашим предпочтениям.\n\n"
+    "Выберите действие:"
+)
+
+TEA_INFO_TEXT = (
+    "*Информация о типах чая:*\n\n"
+    "*Зеленый чай* - минимальная обработка, сохраняет натуральный цвет и свежесть\n"
+    "*Черный чай* - полная ферментация, насыщенный цвет и крепкий вкус\n"
+    "*Улун* - частичная ферментация, сочетает свежесть зеленого и насыщенность черного\n"
+    "*Белый чай* - самые нежные почки, минимальная обработка\n"
+    "*Пуэр* - ферментированный чай, выдержанный годами\n"
+    "*Травяные чаи* - настои трав, цветов, плодов (не содержат чайных листьев)\n\n"
+    "Рекомендую пройти тест для точного подбора!"
+)
+
+HELP_TEXT = (
+    "*🍃 Чайный сомелье - доступные команды:*\n\n"
+    "/start - Главное меню\n"
+    "/test - Начать тест по подбору чая\n"
+    "/menu - Показать чайную карту\n"
+    "/help - Эта справка\n\n"
+    "*Или используйте кнопки меню:*\n"
+    "🍃 Пройти тест - подбор чая по предпочтениям\n"
+    "📖 Посмотреть меню - вся чайная карта (листается кнопками)\n"
+    "ℹ️ О чаях - информация о типах чая\n"
+    "🔄 Начать заново - сбросить всё\n\n"
+    "*Поиск:* напишите в любом чате имя бота и запрос, например «улун» или «медовый»"
+)
+
+MAIN_MENU_TEXT = "🍃 *Главное меню*\n\nВыберите действие:"
+
+GREETING_TEXT = (
+    "🍃 *Чайный сомелье приветствует вас!*\n\n"
+    "Пожалуйста, выберите действие из меню ниже:"
+)
+
+USE_BUTTONS_TEXT = "Пожалуйста, используйте кнопки для выбора вариантов или нажмите /start для возврата в главное меню."
+INVALID_ANSWER_TEXT = "Пожалуйста, выберите вариант из предложенных кнопок."
+NO_TEST_TEXT = "Давайте пройдем тест сначала."
+TEST_CANCELLED_TEXT = "Тест отменен."
+NO_MATCH_TEXT = "😔 К сожалению, не нашлось идеального чая по вашим предпочтениям.\nПопробуйте изменить критерии или посмотрите полное меню."
 
 # Главное меню
 def main_menu():
     markup = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
-    btn1 = types.KeyboardButton("🍃 Пройти тест")
-    btn2 = types.KeyboardButton("📖 Посмотреть меню")
-    btn3 = types.KeyboardButton("🔄 Начать заново")
-    btn4 = types.KeyboardButton("ℹ️ О чаях")
-    markup.add(btn1, btn2, btn3, btn4)
+    markup.add(*[types.KeyboardButton(text) for text in MAIN_MENU_BUTTONS])
     return markup
 
 # Инлайн-кнопки для меню (по 1 чаю на страницу)
-def get_menu_keyboard(page=0):
+def get_menu_keyboard(page=0, total_pages=None):
     markup = types.InlineKeyboardMarkup(row_width=2)
     
-    # Получаем список чаев
-    tea_list = list(TEA_MENU.items())
-    total_pages = len(tea_list)
+    # Число страниц - число чаев в каталоге
+    if total_pages is None:
+        total_pages = len(current_catalog().catalog)
     
     # Кнопки навигации
     nav_buttons = []
     if page > 0:
-        nav_buttons.append(types.InlineKeyboardButton("◀️ Назад", callback_data=f"menu_page_{page-1}"))
+        nav_buttons.append(types.InlineKeyboardButton("◀️ Назад", callback_data=callbacks.encode("menu_page", page - 1)))
     
-    nav_buttons.append(types.InlineKeyboardButton(f"{page+1}/{total_pages}", callback_data="current_page"))
+    nav_buttons.append(types.InlineKeyboardButton(f"{page+1}/{total_pages}", callback_data=callbacks.encode("current_page")))
     
     if page < total_pages - 1:
-        nav_buttons.append(types.InlineKeyboardButton("Вперед ▶️", callback_data=f"menu_page_{page+1}"))
+        nav_buttons.append(types.InlineKeyboardButton("Вперед ▶️", callback_data=callbacks.encode("menu_page", page + 1)))
     
     if nav_buttons:
         markup.row(*nav_buttons)
     
     # Кнопки действий
     markup.add(
-        types.InlineKeyboardButton("🏠 В главное меню", callback_data="to_main_menu"),
-        types.InlineKeyboardButton("🍃 Пройти тест", callback_data="start_test_from_menu")
+        types.InlineKeyboardButton("🏠 В главное меню", callback_data=callbacks.encode("main_menu")),
+        types.InlineKeyboardButton("🍃 Пройти тест", callback_data=callbacks.encode("start_test"))
     )
     
     return markup
 
-# Функция для отправки фото чая
-def send_tea_photo(chat_id, tea_name, tea_data, caption, reply_markup=None, message_id=None):
-    """Отправляет фото чая, если файл существует"""
-    photo_file = tea_data.get('photo_file')
+# Подпись к странице меню
+def menu_page_caption(page, tea_name, tea_data, total_pages):
+    return (
+        f"📖 *Чайная карта* (страница {page+1}/{total_pages})\n\n"
+        f"*{tea_name}*\n"
+        f"Цена: {tea_data['price']}₽\n\n"
+        f"{tea_data['description']}\n\n"
+        f"Используйте кнопки для навигации по меню"
+    )
+
+# Клавиатура с вариантами ответа на вопрос теста
+def question_keyboard(question_index):
+    question = QUESTIONS[question_index]
+    markup = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
     
-    if photo_file:
-        photo_path = os.path.join(TEA_PHOTOS_DIR, photo_file)
-        
-        # Проверяем существование файла
-        if os.path.exists(photo_path):
-            try:
-                with open(photo_path, 'rb') as photo:
-                    if message_id and reply_markup:
-                        # Редактируем существующее сообщение с фото
-                        bot.edit_message_media(
-                            chat_id=chat_id,
-                            message_id=message_id,
-                            media=types.InputMediaPhoto(photo, caption=caption, parse_mode="Markdown"),
-                            reply_markup=reply_markup
-                        )
-                    elif reply_markup:
-                        # Отправляем новое фото с кнопками
-                        bot.send_photo(chat_id, photo, caption=caption, 
-                                     reply_markup=reply_markup, parse_mode="Markdown")
-                    else:
-                        # Отправляем фото без кнопок
-                        bot.send_photo(chat_id, photo, caption=caption, parse_mode="Markdown")
-                logger.debug(f"Фото отправлено: {photo_file}")
-                return True
-            except Exception as e:
-                logger.error(f"Ошибка при отправке фото {photo_file}: {e}")
-                # Если ошибка, отправляем текстовое сообщение
-                if message_id and reply_markup:
-                    try:
-                        bot.edit_message_text(
-                            chat_id=chat_id,
-                            message_id=message_id,
-                            text=caption,
-                            reply_markup=reply_markup,
-                            parse_mode="Markdown"
-                        )
-                    except:
-                        bot.send_message(chat_id, caption, reply_markup=reply_markup, 
-                                       parse_mode="Markdown")
-                else:
-                    bot.send_message(chat_id, caption, reply_markup=reply_markup, 
-                                   parse_mode="Markdown")
-                return False
+    buttons = []
+    for option_text in question["options"].keys():
+        buttons.append(types.KeyboardButton(option_text))
+    
+    # Распределяем кнопки по 2 в ряд
+    for i in range(0, len(buttons), 2):
+        if i + 1 < len(buttons):
+            markup.add(buttons[i], buttons[i + 1])
         else:
-            logger.warning(f"Файл не найден: {photo_path}")
-            # Файл не найден, отправляем текстовое сообщение
-            if message_id and reply_markup:
-                try:
-                    bot.edit_message_text(
-                        chat_id=chat_id,
-                        message_id=message_id,
-                        text=caption,
-                        reply_markup=reply_markup,
-                        parse_mode="Markdown"
-                    )
-                except:
-                    bot.send_message(chat_id, caption, reply_markup=reply_markup, 
-                                   parse_mode="Markdown")
-            else:
-                bot.send_message(chat_id, caption, reply_markup=reply_markup, 
-                               parse_mode="Markdown")
-            return False
-    else:
-        # Нет фото, отправляем текстовое сообщение
-        if message_id and reply_markup:
-            try:
-                bot.edit_message_text(
-                    chat_id=chat_id,
-                    message_id=message_id,
-                    text=caption,
-                    reply_markup=reply_markup,
-                    parse_mode="Markdown"
-                )
-            except:
-                bot.send_message(chat_id, caption, reply_markup=reply_markup, 
-                               parse_mode="Markdown")
+            markup.add(buttons[i])
+    
+    # Добавляем кнопку отмены
+    cancel_btn = types.KeyboardButton(CANCEL_BUTTON)
+    markup.add(cancel_btn)
+    return markup
+
+def question_text(question_index):
+    if QUIZ_MODE == "adaptive":
+        # Порядок и число вопросов зависят от ответов, поэтому без номера
+        return f"*Вопрос:*\n{QUESTIONS[question_index]['text']}"
+    return f"*Вопрос {question_index + 1}/{len(QUESTIONS)}:*\n{QUESTIONS[question_index]['text']}"
+
+# Инлайн-кнопки вопроса для теста в одном сообщении. По ответам в данных кнопки
+# нажатие на устаревшем сообщении отличается от ответа на текущий вопрос
+def quiz_keyboard(question_index, answers):
+    markup = types.InlineKeyboardMarkup(row_width=2)
+    markup.add(*[
+        types.InlineKeyboardButton(option_text, callback_data=callbacks.encode("answer", question_index, option, answers))
+        for option, option_text in enumerate(QUESTIONS[question_index]["options"])
+    ])
+    markup.add(types.InlineKeyboardButton(CANCEL_BUTTON, callback_data=callbacks.encode("cancel_test")))
+    return markup
+
+# Текст и кнопки результата теста
+def result_caption(tea_name, tea_data, score, max_score=EXACT_MATCH_SCORE * len(QUESTIONS)):
+    return (
+        f"🎉 *Ваш идеальный чай подобран!*\n\n"
+        f"По вашим предпочтениям я рекомендую:\n\n"
+        f"*{tea_name}* - {tea_data['price']}₽\n"
+        f"Совпадение: {score}/{max_score} баллов\n\n"
+        f"{tea_data['description']}\n\n"
+        f"Что вы хотите сделать дальше?"
+    )
+
+def result_keyboard():
+    markup = types.InlineKeyboardMarkup()
+    markup.add(
+        types.InlineKeyboardButton("📖 Посмотреть меню", callback_data=callbacks.encode("show_menu")),
+        types.InlineKeyboardButton("🍃 Пройти тест заново", callback_data=callbacks.encode("start_test")),
+        types.InlineKeyboardButton("🏠 В главное меню", callback_data=callbacks.encode("main_menu"))
+    )
+    return markup
+
+# Вызовы API при доставке фото и текста: действие выбирается по классу ошибки. Попытки
+# считает очередь outbound, она же выдерживает паузы 429, поэтому здесь 429 не повторяется
+api = ApiCaller(rate_limit_retries=0)
+
+# Отправка фото (или замена фото в сообщении) по file_id или файлу
+def _deliver_photo(chat_id, photo, caption, reply_markup=None, message_id=None):
+    if message_id and reply_markup:
+        # Редактируем существующее сообщение с фото
+        try:
+            return api.call(
+                "edit_message_media", bot.edit_message_media,
+                chat_id=chat_id,
+                message_id=message_id,
+                media=types.InputMediaPhoto(photo, caption=caption, parse_mode="Markdown"),
+                reply_markup=reply_markup
+            )
+        except ApiCallError as e:
+            if e.kind == NOT_MODIFIED:
+                return None
+            if e.kind != MESSAGE_GONE:
+                raise
+            # Сообщение удалено или его нельзя отредактировать - один раз отправляем новое
+            metrics.fallback("message_gone")
+    # Отправляем новое фото (с кнопками, если они есть)
+    return api.call("send_photo", bot.send_photo, chat_id, photo, caption=caption,
+                    reply_markup=reply_markup, parse_mode="Markdown")
+
+# Текст вместо фото: правка сообщения или новое сообщение
+def send_caption_text(chat_id, caption, reply_markup=None, message_id=None):
+    if message_id and reply_markup:
+        try:
+            return api.call(
+                "edit_message_text", bot.edit_message_text,
+                chat_id=chat_id,
+                message_id=message_id,
+                text=caption,
+                reply_markup=reply_markup,
+                parse_mode="Markdown"
+            )
+        except ApiCallError as e:
+            if e.kind == NOT_MODIFIED:
+                return None
+            if e.kind != MESSAGE_GONE:
+                raise
+            # Например, в сообщении фото, а не текст - один раз отправляем новое
+            metrics.fallback("message_gone")
+    return api.call("send_message", bot.send_message, chat_id, caption,
+                    reply_markup=reply_markup, parse_mode="Markdown")
+
+# Файл фото для загрузки. Читается в память целиком: после 429 очередь outbound отправляет
+# те же аргументы ещё раз, и открытый файл к тому времени уже дочитан до конца (или закрыт)
+def read_photo(photo_path):
+    with open(photo_path, 'rb') as f:
+        return f.read()
+
+def log_photo_sent(photo_path):
+    event(logger, "photo_sent", "Фото отправлено: {photo_path}", logging.DEBUG, photo_path=photo_path)
+
+# Итог повторной отправки фото из очереди: новый file_id
+def _photo_resent(photo_path):
+    def on_done(future):
+        error = future.exception()
+        if error is not None:
+            logger.error(f"Не удалось доставить фото {photo_path}: {error}")
+            return
+        sent = future.result()
+        if sent is None:
+            # Правку заменила более свежая
+            return
+        log_photo_sent(photo_path)
+        file_id = file_id_from_message(sent)
+        if file_id:
+            photo_cache.put(photo_path, file_id)
+    return on_done
+
+# Замена фото при листании меню без ожидания ответа
+def edit_photo_coalesced(chat_id, photo_path, file_id, caption, reply_markup, message_id):
+    """Ставит правку в очередь: если пользователь листает быстрее лимитов, уйдёт только последняя"""
+    coalesce_key = ("edit_message_media", chat_id, message_id)
+    future = outbound.submit(
+        "edit_message_media",
+        chat_id=chat_id,
+        message_id=message_id,
+        media=types.InputMediaPhoto(file_id, caption=caption, parse_mode="Markdown"),
+        reply_markup=reply_markup,
+        coalesce_key=coalesce_key
+    )
+    
+    def on_done(future):
+        error = future.exception()
+        if error is None:
+            # None - правку заменила более свежая, её и засчитаем
+            if future.result() is not None:
+                log_photo_sent(photo_path)
+            return
+        kind = classify(error)
+        if kind == NOT_MODIFIED:
+            return
+        if kind == MEDIA_INVALID:
+            # file_id отклонён - забываем его и один раз загружаем файл
+            logger.warning(f"Telegram отклонил file_id для {photo_path}: {error}")
+            metrics.fallback("file_id_rejected")
+            photo_cache.forget(photo_path)
+            photo = read_photo(photo_path)
+            outbound.submit(
+                "edit_message_media",
+                chat_id=chat_id,
+                message_id=message_id,
+                media=types.InputMediaPhoto(photo, caption=caption, parse_mode="Markdown"),
+                reply_markup=reply_markup,
+                coalesce_key=coalesce_key
+            ).add_done_callback(_photo_resent(photo_path))
+        elif kind == MESSAGE_GONE:
+            # Сообщение удалено - один раз отправляем страницу новым сообщением
+            metrics.fallback("message_gone")
+            outbound.submit(
+                "send_photo", chat_id, file_id, caption=caption, reply_markup=reply_markup, parse_mode="Markdown"
+            ).add_done_callback(_photo_resent(photo_path))
         else:
-            bot.send_message(chat_id, caption, reply_markup=reply_markup, 
-                           parse_mode="Markdown")
-        return False
+            # Лимит (после повторов в очереди), сеть или прочее: ещё одна попытка только задвоит запросы
+            metrics.fallback("undelivered")
+            logger.error(f"Ошибка при замене фото {photo_path} ({kind}): {error}")
+    
+    future.add_done_callback(on_done)
+    return future
+
+def send_photo_cached(chat_id, photo_path, caption, reply_markup=None, message_id=None):
+    """Отправляет фото по сохранённому file_id, а при первой отправке загружает файл.
+
+    Правка фото по file_id только ставится в очередь outbound - тогда возвращается её future.
+    """
+    file_id = photo_cache.get(photo_path)
+    if file_id and message_id and reply_markup:
+        return edit_photo_coalesced(chat_id, photo_path, file_id, caption, reply_markup, message_id)
+    if file_id:
+        try:
+            return _deliver_photo(chat_id, file_id, caption, reply_markup, message_id)
+        except ApiCallError as e:
+            if e.kind != MEDIA_INVALID:
+                raise
+            # file_id устарел или отозван - забываем его и загружаем файл заново
+            logger.warning(f"Telegram отклонил file_id для {photo_path}: {e.error}")
+            metrics.fallback("file_id_rejected")
+            photo_cache.forget(photo_path)
+
+    sent = _deliver_photo(chat_id, read_photo(photo_path), caption, reply_markup, message_id)
+
+    file_id = file_id_from_message(sent)
+    if file_id:
+        photo_cache.put(photo_path, file_id)
+    return sent
+
+# Путь к фото чая для отправки или None, если фото нет
+def tea_photo_path(tea_data):
+    photo_file = tea_data.get('photo_file')
+    if not photo_file:
+        metrics.fallback("no_photo")
+        return None
+    photo_path = os.path.join(TEA_PHOTOS_DIR, photo_file)
+    if not os.path.exists(photo_path):
+        logger.warning(f"Файл не найден: {photo_path}")
+        metrics.fallback("missing_file")
+        return None
+    return photo_optimizer.variant(photo_path)
+
+# Функция для отправки фото чая
+def send_tea_photo(chat_id, tea_name, tea_data, caption, reply_markup=None, message_id=None):
+    """Отправляет фото чая, а если фото нет или Telegram его не принял - текст.
+
+    Возвращает True, если ушло фото, и None, если правка фото стоит в очереди outbound
+    (отправку засчитает её future). После лимита, сетевой или прочей ошибки текст не
+    отправляется: повторы уже сделаны, а ещё один запрос только задвоит сообщение.
+    """
+    photo_path = tea_photo_path(tea_data)
+    if photo_path:
+        try:
+            sent = send_photo_cached(chat_id, photo_path, caption, reply_markup, message_id)
+            if isinstance(sent, Future):
+                return None
+            log_photo_sent(photo_path)
+            return True
+        except ApiCallError as e:
+            if e.kind != MEDIA_INVALID:
+                logger.error(f"Фото {tea_name} не доставлено ({e.kind}): {e.error}")
+                metrics.fallback("undelivered")
+                return False
+            logger.warning(f"Telegram не принял фото {photo_path}, отправляем текст: {e.error}")
+            metrics.fallback("media_invalid")
+        except OSError as e:
+            logger.warning(f"Не удалось прочитать фото {photo_path}: {e}")
+            metrics.fallback("missing_file")
+    
+    try:
+        send_caption_text(chat_id, caption, reply_markup, message_id)
+    except ApiCallError as e:
+        logger.error(f"Подпись {tea_name} не доставлена ({e.kind}): {e.error}")
+        metrics.fallback("undelivered")
+    return False
 
 # Команда /start
-@bot.message_handler(commands=['start'])
+@router.command('start')
 def start_test(message):
     user_id = message.chat.id
-    user_responses[user_id] = {}
-    user_states[user_id] = "main"
-    
-    welcome_text = (
-        "🍃 *Добро пожаловать в бота-чайного сомелье!*\n\n"
-        "Я помогу подобрать идеальный чайный напиток для вас!\n\n"
-        "Пройти тест из 5 вопросов - и я найду чай,\n"
-        "который идеально соответствует вашим предпочтениям.\n\n"
-        "Выберите действие:"
-    )
+    update_session(user_id, answers=0, state=State.MAIN)
     
     bot.send_message(
         user_id,
-        welcome_text,
-        reply_markup=main_menu(),
+        WELCOME_TEXT,
+        reply_markup=rendered().main_menu,
         parse_mode="Markdown"
     )
-    logger.info(f"Пользователь {user_id} начал работу с ботом")
+    event(logger, "bot_started", "Пользователь {user_id} начал работу с ботом", user_id=user_id)
 
 # Обработка кнопок главного меню
-@bot.message_handler(func=lambda message: message.text in ["🍃 Пройти тест", "📖 Посмотреть меню", "🔄 Начать заново", "ℹ️ О чаях"])
+@router.text(*MAIN_MENU_BUTTONS)
 def handle_main_menu(message):
     user_id = message.chat.id
     
     if message.text == "🍃 Пройти тест":
-        user_responses[user_id] = {}
-        user_states[user_id] = "test"
-        logger.info(f"Пользователь {user_id} начал тест")
-        ask_question(message, 0)
+        update_session(user_id, answers=0, state=State.TEST)
+        event(logger, "test_started", "Пользователь {user_id} начал тест", user_id=user_id)
+        ask_question(message, next_question_index(0))
         
     elif message.text == "📖 Посмотреть меню":
-        logger.info(f"Пользователь {user_id} запросил меню")
+        event(logger, "menu_requested", "Пользователь {user_id} запросил меню", user_id=user_id)
         show_menu_page(message, page=0)
         
     elif message.text == "🔄 Начать заново":
-        logger.info(f"Пользователь {user_id} начал заново")
+        event(logger, "restarted", "Пользователь {user_id} начал заново", user_id=user_id)
         start_test(message)
         
     elif message.text == "ℹ️ О чаях":
@@ -315,53 +728,31 @@ def handle_main_menu(message):
 # Показать страницу меню с фото чая
 def show_menu_page(message, page=0):
     user_id = message.chat.id
-    user_states[user_id] = "browsing_menu"
-    user_menu_pages[user_id] = page
+    pages = rendered().pages
     
-    tea_list = list(TEA_MENU.items())
-    total_pages = len(tea_list)
-    
-    if page >= total_pages:
+    if not 0 <= page < len(pages):
         page = 0
     
-    # Получаем текущий чай
-    tea_name, tea_data = tea_list[page]
+    update_session(user_id, state=State.BROWSING_MENU, menu_page=page)
     
-    # Формируем описание
-    caption = (
-        f"📖 *Чайная карта* (страница {page+1}/{total_pages})\n\n"
-        f"*{tea_name}*\n"
-        f"Цена: {tea_data['price']}₽\n\n"
-        f"{tea_data['description']}\n\n"
-        f"Используйте кнопки для навигации по меню"
-    )
+    # Готовая страница: чай, подпись и клавиатура
+    menu_page = pages[page]
     
     # Отправляем фото с кнопками
     send_tea_photo(
         user_id, 
-        tea_name, 
-        tea_data, 
-        caption, 
-        get_menu_keyboard(page)
+        menu_page.tea_name, 
+        menu_page.tea_data, 
+        menu_page.caption, 
+        menu_page.markup
     )
 
 # Показать информацию о типах чая
 def show_tea_info(message):
-    info_text = (
-        "*Информация о типах чая:*\n\n"
-        "*Зеленый чай* - минимальная обработка, сохраняет натуральный цвет и свежесть\n"
-        "*Черный чай* - полная ферментация, насыщенный цвет и крепкий вкус\n"
-        "*Улун* - частичная ферментация, сочетает свежесть зеленого и насыщенность черного\n"
-        "*Белый чай* - самые нежные почки, минимальная обработка\n"
-        "*Пуэр* - ферментированный чай, выдержанный годами\n"
-        "*Травяные чаи* - настои трав, цветов, плодов (не содержат чайных листьев)\n\n"
-        "Рекомендую пройти тест для точного подбора!"
-    )
-    
     bot.send_message(
         message.chat.id,
-        info_text,
-        reply_markup=main_menu(),
+        TEA_INFO_TEXT,
+        reply_markup=rendered().main_menu,
         parse_mode="Markdown"
     )
 
@@ -423,170 +814,341 @@ def get_aroma_name(aroma):
     }
     return aromas.get(aroma, aroma)
 
-# Обработка инлайн-кнопок
-@bot.callback_query_handler(func=lambda call: True)
-def handle_callback_query(call):
+# Названия характеристик чая по-русски (по ним тоже работает поиск)
+def describe_tea(tea_data):
+    characteristics = tea_data["characteristics"]
+    return " ".join([
+        get_tea_type_name(characteristics.get("type", "")),
+        get_strength_name(characteristics.get("strength", "")),
+        get_caffeine_name(characteristics.get("caffeine", "")),
+        get_taste_name(characteristics.get("taste", "")),
+        get_aroma_name(characteristics.get("aroma", "")),
+    ])
+
+# Поисковый индекс строится один раз на версию каталога
+search_cache = SearchIndexCache(describe_tea)
+
+# Подпись чая в результатах инлайн-поиска
+def inline_caption(tea_name, tea_data):
+    return (
+        f"*{tea_name}* - {tea_data['price']}₽\n\n"
+        f"{tea_data['description']}"
+    )
+
+# file_id фото чая, если оно уже загружалось в Telegram
+def cached_photo_id(tea_data):
+    photo_file = tea_data.get('photo_file')
+    if not photo_file:
+        return None
+    return photo_cache.get(photo_optimizer.variant(os.path.join(TEA_PHOTOS_DIR, photo_file)))
+
+def inline_results(query, offset=""):
+    """Результаты инлайн-поиска и смещение следующей страницы ("" - страниц больше нет)"""
+    catalog = current_catalog().catalog
+    start = int(offset) if offset.isdigit() else 0
+    found, next_offset = search_cache.get(catalog).search(query, start)
+
+    results = []
+    for index in found:
+        tea_name, tea_data = catalog.names[index], catalog.teas[index]
+        caption = inline_caption(tea_name, tea_data)
+        file_id = cached_photo_id(tea_data)
+        if file_id:
+            # Фото уже есть у Telegram - отдаём по file_id без загрузки
+            results.append(types.InlineQueryResultCachedPhoto(
+                str(index), file_id, title=tea_name, caption=caption, parse_mode="Markdown"))
+        else:
+            results.append(types.InlineQueryResultArticle(
+                str(index), tea_name,
+                types.InputTextMessageContent(caption, parse_mode="Markdown"),
+                description=f"{tea_data['price']}₽ · {describe_tea(tea_data)}"
+            ))
+    return results, "" if next_offset is None else str(next_offset)
+
+# Инлайн-поиск по каталогу: @бот улун
+@bot.inline_handler(func=lambda query: True)
+def handle_inline_query(query):
+    results, next_offset = inline_results(query.query, query.offset)
+    bot.answer_inline_query(query.id, results, cache_time=INLINE_CACHE_TIME, next_offset=next_offset)
+
+# Удалить сообщение с инлайн-кнопками без ожидания (оно могло быть уже удалено).
+# Порядок удаления не важен, поэтому оно идёт параллельно с новыми сообщениями чата
+def delete_message_quietly(chat_id, message_id):
+    return outbound.submit("delete_message", chat_id, message_id, ordered=False)
+
+# Листание страниц меню
+@callback_router.on("menu_page")
+def callback_menu_page(call, page):
     user_id = call.message.chat.id
+    pages = rendered().pages
     
-    if call.data.startswith("menu_page_"):
-        # Листание страниц меню
-        page = int(call.data.split("_")[2])
-        user_menu_pages[user_id] = page
-        
-        tea_list = list(TEA_MENU.items())
-        total_pages = len(tea_list)
-        
-        if page < 0 or page >= total_pages:
-            return
-        
-        # Получаем текущий чай
-        tea_name, tea_data = tea_list[page]
-        
-        # Формируем описание
-        caption = (
-            f"📖 *Чайная карта* (страница {page+1}/{total_pages})\n\n"
-            f"*{tea_name}*\n"
-            f"Цена: {tea_data['price']}₽\n\n"
-            f"{tea_data['description']}\n\n"
-            f"Используйте кнопки для навигации по меню"
-        )
-        
-        # Обновляем фото и кнопки
-        send_tea_photo(
-            user_id,
-            tea_name,
-            tea_data,
-            caption,
-            get_menu_keyboard(page),
-            call.message.message_id
-        )
-        
-    elif call.data == "to_main_menu":
-        # Возврат в главное меню из меню чаев
-        try:
-            bot.delete_message(user_id, call.message.message_id)
-        except:
-            pass
-        
-        # Показываем главное меню
-        bot.send_message(
-            user_id,
-            "🍃 *Главное меню*\n\nВыберите действие:",
-            reply_markup=main_menu(),
-            parse_mode="Markdown"
-        )
-        
-    elif call.data == "start_test_from_menu":
-        # Начать тест из меню чаев
-        try:
-            bot.delete_message(user_id, call.message.message_id)
-        except:
-            pass
-        
-        user_responses[user_id] = {}
-        user_states[user_id] = "test"
-        ask_question(call.message, 0)
-        
-    elif call.data == "start_test_from_result":
-        # Начать тест из результатов
-        try:
-            bot.delete_message(user_id, call.message.message_id)
-        except:
-            pass
-        
-        user_responses[user_id] = {}
-        user_states[user_id] = "test"
-        ask_question(call.message, 0)
-        
-    elif call.data == "show_menu_from_result":
-        # Показать меню из результатов
+    # Номер страницы пришёл из callback_data - проверяем его до записи в сессию
+    if not 0 <= page < len(pages):
+        return
+    
+    update_session(user_id, menu_page=page)
+    
+    # Готовая страница: чай, подпись и клавиатура
+    menu_page = pages[page]
+    
+    # Обновляем фото и кнопки
+    send_tea_photo(
+        user_id,
+        menu_page.tea_name,
+        menu_page.tea_data,
+        menu_page.caption,
+        menu_page.markup,
+        call.message.message_id
+    )
+
+# Возврат в главное меню из меню чаев или результата
+@callback_router.on("main_menu")
+def callback_main_menu(call):
+    user_id = call.message.chat.id
+    delete_message_quietly(user_id, call.message.message_id)
+    
+    outbound.submit(
+        "send_message",
+        user_id,
+        MAIN_MENU_TEXT,
+        reply_markup=rendered().main_menu,
+        parse_mode="Markdown"
+    ).add_done_callback(log_background_error)
+
+# Начать тест из меню чаев или из результата
+@callback_router.on("start_test")
+def callback_start_test(call):
+    user_id = call.message.chat.id
+    if QUIZ_UI == "inline" and call.message.photo:
+        # Сообщение с фото само становится сообщением теста
+        update_session(user_id, answers=0, state=State.TEST)
+        question_index = next_question_index(0)
+        edit_quiz_card(call.message, question_index, 0)
+        update_session(user_id, state=State.question(question_index))
+        return
+    delete_message_quietly(user_id, call.message.message_id)
+    
+    update_session(user_id, answers=0, state=State.TEST)
+    defer(user_id, ask_question, call.message, next_question_index(0))
+
+# Показать меню из результатов
+@callback_router.on("show_menu")
+def callback_show_menu(call):
+    delete_message_quietly(call.message.chat.id, call.message.message_id)
+    # Ответить на кнопки страницы пользователь сможет только после её отправки
+    defer(call.message.chat.id, show_menu_page, call.message, 0)
+
+# Следующий вопрос теста: по порядку или по дереву адаптивного теста.
+# len(QUESTIONS) - вопросов больше нет, пора показывать результат
+def next_question_index(answers, answered=None):
+    quiz = current_catalog().quiz
+    if quiz is not None:
+        question = quiz.next_question(answers)
+        return len(QUESTIONS) if question is None else question
+    return 0 if answered is None else answered + 1
+
+# Результат теста по ответам сессии
+def test_result(session):
+    """(название, данные, баллы, наибольшие баллы) или None, если ничего не подошло.
+
+    KeyError, если ответов для результата недостаточно.
+    """
+    snapshot = current_catalog()
+    if snapshot.quiz is not None:
+        # В адаптивном тесте заданы не все вопросы - наибольшие баллы считает дерево
+        best_tea = snapshot.quiz.result(session.answers)
+        max_score = snapshot.quiz.max_score(session.answers)
+    else:
+        best_tea = snapshot.results.lookup_options(session.options(len(QUESTIONS)))
+        max_score = EXACT_MATCH_SCORE * session.answered()
+    if best_tea is None:
+        return None
+    return best_tea + (max_score,)
+
+# Переходы теста без отправки сообщений - общие для синхронного и асинхронного
+# (async_engine.py) режимов, чтобы сессия и события в них не расходились
+
+# Ответ кнопкой клавиатуры: (номер вопроса, следующий вопрос) или None, если тест не идёт.
+# Следующий вопрос None - такого варианта ответа нет, вопрос нужно повторить
+def record_text_answer(user_id, text):
+    session = get_session(user_id)
+    question_index = State.question_index(session.state)
+    if question_index is None or question_index >= len(QUESTIONS):
+        return None
+    option = QUESTION_OPTIONS[question_index].get(text)
+    if option is None:
+        return question_index, None
+    session.set_answer(question_index, option)
+    sessions.put(user_id, session)
+    event(logger, "answer", "Пользователь {user_id}: вопрос {question}, ответ: {answer}", logging.DEBUG,
+          user_id=user_id, question=question_index + 1, answer=text)
+    return question_index, next_question_index(session.answers, question_index)
+
+# Ответ инлайн-кнопкой: следующий вопрос или None для кнопки устаревшего сообщения теста
+def record_inline_answer(user_id, question_index, option, answers):
+    session = get_session(user_id)
+    if session.state != State.question(question_index) or session.answers != answers:
+        return None
+    if question_index >= len(QUESTIONS) or option >= len(QUESTIONS[question_index]["options"]):
+        return None
+    session.set_answer(question_index, option)
+    sessions.put(user_id, session)
+    event(logger, "answer", "Пользователь {user_id}: вопрос {question}, вариант {option}", logging.DEBUG,
+          user_id=user_id, question=question_index + 1, option=option + 1)
+    return next_question_index(session.answers, question_index)
+
+def cancel_test(user_id):
+    update_session(user_id, state=State.MAIN)
+    event(logger, "test_cancelled", "Пользователь {user_id} отменил тест", user_id=user_id)
+
+# Результат отправлен: ответы очищаются для следующего теста
+def complete_test(user_id, tea_name, score, max_score):
+    update_session(user_id, state=State.RESULT, answers=0)
+    metrics.tests_completed.inc()
+    event(logger, "recommendation", "Пользователь {user_id} получил рекомендацию: {tea} (счет: {score}/{max_score})",
+          user_id=user_id, tea=tea_name, score=score, max_score=max_score)
+
+# Картинка сообщения инлайн-теста или None
+def quiz_cover_path():
+    if QUIZ_COVER_PHOTO and os.path.exists(QUIZ_COVER_PHOTO):
+        return photo_optimizer.variant(QUIZ_COVER_PHOTO)
+    catalog = current_catalog().catalog
+    if catalog.available_photos:
+        return photo_optimizer.variant(os.path.join(catalog.photos_dir, catalog.available_photos[0]))
+    return None
+
+# Сообщение инлайн-теста с первым вопросом. С картинкой результат потом встаёт
+# в то же сообщение, без картинки - приходит отдельным сообщением
+def send_quiz_card(chat_id, question_index, answers):
+    caption = rendered().questions[question_index].text
+    markup = quiz_keyboard(question_index, answers)
+    photo_path = quiz_cover_path()
+    if photo_path:
         try:
-            bot.delete_message(user_id, call.message.message_id)
-        except:
-            pass
-        
-        show_menu_page(call.message, page=0)
+            send_photo_cached(chat_id, photo_path, caption, markup)
+            return
+        except ApiCallError as e:
+            logger.warning(f"Картинка теста не отправлена ({e.kind}), отправляем текст: {e.error}")
+        except OSError as e:
+            logger.warning(f"Не удалось прочитать картинку теста {photo_path}: {e}")
+    bot.send_message(chat_id, caption, reply_markup=markup, parse_mode="Markdown")
+
+# Следующий вопрос инлайн-теста в том же сообщении
+def edit_quiz_card(message, question_index, answers):
+    chat_id = message.chat.id
+    caption = rendered().questions[question_index].text
+    markup = quiz_keyboard(question_index, answers)
+    try:
+        if message.photo:
+            api.call("edit_message_caption", bot.edit_message_caption, caption=caption, chat_id=chat_id,
+                     message_id=message.message_id, reply_markup=markup, parse_mode="Markdown")
+        else:
+            api.call("edit_message_text", bot.edit_message_text, caption, chat_id=chat_id,
+                     message_id=message.message_id, reply_markup=markup, parse_mode="Markdown")
+    except ApiCallError as e:
+        if e.kind == NOT_MODIFIED:
+            return
+        if e.kind != MESSAGE_GONE:
+            raise
+        # Сообщение теста удалено - продолжаем в новом
+        send_quiz_card(chat_id, question_index, answers)
 
 # Начать тест с первого вопроса
 def ask_question(message, question_index):
     user_id = message.chat.id
     
     if question_index < len(QUESTIONS):
-        question = QUESTIONS[question_index]
-        markup = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
-        
-        buttons = []
-        for option_text in question["options"].keys():
-            buttons.append(types.KeyboardButton(option_text))
-        
-        # Распределяем кнопки по 2 в ряд
-        for i in range(0, len(buttons), 2):
-            if i + 1 < len(buttons):
-                markup.add(buttons[i], buttons[i + 1])
-            else:
-                markup.add(buttons[i])
-        
-        # Добавляем кнопку отмены
-        cancel_btn = types.KeyboardButton("🔙 Отмена")
-        markup.add(cancel_btn)
-        
-        bot.send_message(
-            user_id,
-            f"*Вопрос {question_index + 1}/{len(QUESTIONS)}:*\n{question['text']}",
-            reply_markup=markup,
-            parse_mode="Markdown"
-        )
+        if QUIZ_UI == "inline":
+            send_quiz_card(user_id, question_index, get_session(user_id).answers)
+        else:
+            question = rendered().questions[question_index]
+            bot.send_message(
+                user_id,
+                question.text,
+                reply_markup=question.markup,
+                parse_mode="Markdown"
+            )
         
         # Сохраняем текущий вопрос
-        user_states[user_id] = f"question_{question_index}"
-        logger.debug(f"Пользователь {user_id} получил вопрос {question_index + 1}")
+        update_session(user_id, state=State.question(question_index))
+        event(logger, "question_asked", "Пользователь {user_id} получил вопрос {question}", logging.DEBUG,
+              user_id=user_id, question=question_index + 1)
     else:
         show_result(message)
 
 # Обработка ответов на вопросы теста
-@bot.message_handler(func=lambda message: user_states.get(message.chat.id, "").startswith("question_"))
+@router.state(*QUESTION_STATES)
 def handle_test_answer(message):
     user_id = message.chat.id
     
-    if message.text == "🔙 Отмена":
-        bot.send_message(user_id, "Тест отменен.", reply_markup=main_menu())
-        user_states[user_id] = "main"
-        logger.info(f"Пользователь {user_id} отменил тест")
+    if QUIZ_UI == "inline":
+        # Ответы приходят нажатиями инлайн-кнопок (callback_answer), текст ответом не считается
+        bot.send_message(user_id, USE_BUTTONS_TEXT, parse_mode="Markdown")
         return
     
-    # Получаем номер текущего вопроса
-    current_state = user_states[user_id]
-    question_index = int(current_state.split("_")[1])
-    
-    if question_index >= len(QUESTIONS):
+    if message.text == CANCEL_BUTTON:
+        bot.send_message(user_id, TEST_CANCELLED_TEXT, reply_markup=rendered().main_menu)
+        cancel_test(user_id)
         return
     
-    question = QUESTIONS[question_index]
-    user_answer = message.text
+    # Ответ записывается в сессию; номер вопроса - из её состояния
+    answered = record_text_answer(user_id, message.text)
+    if answered is None:
+        return
+    question_index, next_question = answered
     
     # Проверяем, что ответ валидный
-    if user_answer in question["options"]:
-        user_responses[user_id][f"q{question_index}"] = question["options"][user_answer]
-        logger.debug(f"Пользователь {user_id}: вопрос {question_index + 1}, ответ: {user_answer}")
-        
+    if next_question is not None:
         # Переходим к следующему вопросу
-        next_question = question_index + 1
         ask_question(message, next_question)
     else:
         # Неверный ответ - повторяем вопрос
         bot.send_message(
             user_id,
-            "Пожалуйста, выберите вариант из предложенных кнопок.",
+            INVALID_ANSWER_TEXT,
             parse_mode="Markdown"
         )
         ask_question(message, question_index)
 
-# Функция подбора чая (только один лучший)
-def find_best_tea(user_prefs):
+# Ответ в инлайн-тесте: следующий вопрос или результат в том же сообщении
+@callback_router.on("answer")
+def callback_answer(call, question_index, option, answers):
+    user_id = call.message.chat.id
+    next_question = record_inline_answer(user_id, question_index, option, answers)
+    
+    # Кнопка устаревшего сообщения теста или уже отвеченного вопроса
+    if next_question is None:
+        return
+    
+    if next_question < len(QUESTIONS):
+        edit_quiz_card(call.message, next_question, get_session(user_id).answers)
+        update_session(user_id, state=State.question(next_question))
+    elif call.message.photo:
+        show_result(call.message, message_id=call.message.message_id)
+    else:
+        delete_message_quietly(user_id, call.message.message_id)
+        show_result(call.message)
+
+# Отмена инлайн-теста
+@callback_router.on("cancel_test")
+def callback_cancel_test(call):
+    user_id = call.message.chat.id
+    if State.question_index(get_session(user_id).state) is None:
+        return
+    delete_message_quietly(user_id, call.message.message_id)
+    bot.send_message(user_id, TEST_CANCELLED_TEXT, reply_markup=rendered().main_menu)
+    cancel_test(user_id)
+
+# Функция подбора чая (только один лучший).
+# Эталонная реализация: в боте используется recommender, результаты должны совпадать
+def find_best_tea(user_prefs, menu=None):
     best_tea = None
     best_score = 0
     
-    for tea_name, tea_data in TEA_MENU.items():
+    if menu is None:
+        menu = current_catalog().catalog.menu
+    
+    for tea_name, tea_data in menu.items():
         score = 0
         chars = tea_data["characteristics"]
         
@@ -616,114 +1178,160 @@ def find_best_tea(user_prefs):
     
     return best_tea
 
-# Показать результат с фото (только один лучший чай)
-def show_result(message):
+# Показать результат с фото (только один лучший чай); с message_id - вместо сообщения теста
+def show_result(message, message_id=None):
     user_id = message.chat.id
     
-    if user_id not in user_responses or len(user_responses[user_id]) < len(QUESTIONS):
+    session = get_session(user_id)
+    
+    # Находим лучший чай (готовый результат из таблицы или дерева адаптивного теста)
+    try:
+        best_tea = test_result(session)
+    except KeyError:
         bot.send_message(
             user_id, 
-            "Давайте пройдем тест сначала.", 
-            reply_markup=main_menu()
+            NO_TEST_TEXT, 
+            reply_markup=rendered().main_menu
         )
         return
     
-    # Находим лучший чай
-    best_tea = find_best_tea(user_responses[user_id])
-    
     if not best_tea:
         bot.send_message(
             user_id,
-            "😔 К сожалению, не нашлось идеального чая по вашим предпочтениям.\nПопробуйте изменить критерии или посмотрите полное меню.",
-            reply_markup=main_menu()
+            NO_MATCH_TEXT,
+            reply_markup=rendered().main_menu
         )
         return
     
-    tea_name, tea_data, score = best_tea
+    tea_name, tea_data, score, max_score = best_tea
     
     # Формируем текст результата
-    result_text = (
-        f"🎉 *Ваш идеальный чай подобран!*\n\n"
-        f"По вашим предпочтениям я рекомендую:\n\n"
-        f"*{tea_name}* - {tea_data['price']}₽\n"
-        f"Совпадение: {score}/15 баллов\n\n"
-        f"{tea_data['description']}\n\n"
-        f"Что вы хотите сделать дальше?"
-    )
-    
-    # Создаем кнопки для результата
-    markup = types.InlineKeyboardMarkup()
-    markup.add(
-        types.InlineKeyboardButton("📖 Посмотреть меню", callback_data="show_menu_from_result"),
-        types.InlineKeyboardButton("🍃 Пройти тест заново", callback_data="start_test_from_result"),
-        types.InlineKeyboardButton("🏠 В главное меню", callback_data="to_main_menu")
-    )
+    result_text = result_caption(tea_name, tea_data, score, max_score)
     
     # Отправляем результат с фото
-    send_tea_photo(user_id, tea_name, tea_data, result_text, markup)
-    
-    user_states[user_id] = "result"
-    logger.info(f"Пользователь {user_id} получил рекомендацию: {tea_name} (счет: {score}/15)")
+    send_tea_photo(user_id, tea_name, tea_data, result_text, rendered().result_markup, message_id)
     
-    # Очищаем ответы пользователя для следующего теста
-    user_responses[user_id] = {}
+    complete_test(user_id, tea_name, score, max_score)
 
 # Обработка команды /test
-@bot.message_handler(commands=['test'])
+@router.command('test')
 def start_test_command(message):
     user_id = message.chat.id
-    user_responses[user_id] = {}
-    user_states[user_id] = "test"
-    logger.info(f"Пользователь {user_id} начал тест через команду")
-    ask_question(message, 0)
+    update_session(user_id, answers=0, state=State.TEST)
+    event(logger, "test_started", "Пользователь {user_id} начал тест через команду", user_id=user_id, source="command")
+    ask_question(message, next_question_index(0))
 
 # Обработка команды /help
-@bot.message_handler(commands=['help'])
+@router.command('help')
 def show_help(message):
-    help_text = (
-        "*🍃 Чайный сомелье - доступные команды:*\n\n"
-        "/start - Главное меню\n"
-        "/test - Начать тест по подбору чая\n"
-        "/menu - Показать чайную карту\n"
-        "/help - Эта справка\n\n"
-        "*Или используйте кнопки меню:*\n"
-        "🍃 Пройти тест - подбор чая по предпочтениям\n"
-        "📖 Посмотреть меню - вся чайная карта (листается кнопками)\n"
-        "ℹ️ О чаях - информация о типах чая\n"
-        "🔄 Начать заново - сбросить всё"
-    )
-    
     bot.send_message(
         message.chat.id,
-        help_text,
-        reply_markup=main_menu(),
+        HELP_TEXT,
+        reply_markup=rendered().main_menu,
         parse_mode="Markdown"
     )
-    logger.info(f"Пользователь {message.chat.id} запросил справку")
+    event(logger, "help_requested", "Пользователь {user_id} запросил справку", user_id=message.chat.id)
 
 # Обработка команды /menu
-@bot.message_handler(commands=['menu'])
+@router.command('menu')
 def command_menu(message):
     show_menu_page(message, page=0)
 
-# Проверить существование всех файлов фотографий
+# Рассылка объявлений всем пользователям (см. broadcast.py)
+BROADCAST_USAGE_TEXT = (
+    "Использование: /broadcast текст объявления\n\n"
+    "Если первая строка - название чая из меню, объявление уйдёт с его фото, "
+    "а подписью станет остальной текст."
+)
+# Ограничение Telegram на подпись к фото
+CAPTION_LIMIT = 1024
+
+def is_admin(chat_id):
+    return chat_id in ADMIN_CHAT_IDS
+
+# Текст объявления и фото чая (или None) из аргументов /broadcast
+def parse_broadcast(arguments):
+    first_line, _, rest = arguments.strip().partition("\n")
+    tea_data = current_catalog().catalog.get(first_line.strip())
+    if tea_data is not None and rest.strip():
+        photo_path = tea_photo_path(tea_data)
+        if photo_path:
+            return rest.strip(), photo_path
+    return arguments.strip(), None
+
+# Одно сообщение рассылки; ApiCallError, если Telegram его не принял
+def send_broadcast_message(chat_id, text, photo_path):
+    if photo_path:
+        send_photo_cached(chat_id, photo_path, text)
+    else:
+        api.call("send_message", bot.send_message, chat_id, text)
+
+def create_broadcaster(send):
+    return Broadcaster(
+        sessions,
+        send,
+        os.getenv('BROADCAST_CHECKPOINT_FILE', os.path.join(DATA_DIR, 'broadcast.json')),
+        rate=float(os.getenv('BROADCAST_RATE', 20)),
+        chunk_size=int(os.getenv('BROADCAST_CHUNK_SIZE', 100)),
+        workers=int(os.getenv('BROADCAST_WORKERS', 4)),
+        report_interval=float(os.getenv('BROADCAST_REPORT_INTERVAL', 30)),
+        on_outcome=metrics.broadcast_messages.inc
+    )
+
+broadcaster = create_broadcaster(send_broadcast_message)
+
+# Ответ администратору на /broadcast, /broadcast_status, /broadcast_cancel
+def broadcast_command(broadcaster, message):
+    command = message.text.split(maxsplit=1)[0].split('@')[0]
+    if command == "/broadcast_status":
+        job = broadcaster.status()
+        return broadcaster.describe(job) if job is not None else "Рассылок ещё не было."
+    if command == "/broadcast_cancel":
+        return "Рассылка отменяется." if broadcaster.cancel() else "Сейчас рассылки нет."
+
+    arguments = extract_arguments(message.text)
+    if not arguments or not arguments.strip():
+        return BROADCAST_USAGE_TEXT
+    text, photo_path = parse_broadcast(arguments)
+    if photo_path and len(text) > CAPTION_LIMIT:
+        return f"Подпись к фото длиннее {CAPTION_LIMIT} символов - сократите текст."
+    try:
+        job = broadcaster.start(text, photo_path, admin_chat_id=message.chat.id)
+    except RuntimeError:
+        return f"Рассылка уже идёт. {broadcaster.describe()}"
+    logger.info(f"Администратор {message.chat.id} запустил рассылку")
+    return f"📣 Рассылка запущена: ~{job.total} получателей{', с фото' if photo_path else ''}."
+
+@router.command('broadcast', 'broadcast_status', 'broadcast_cancel')
+def command_broadcast(message):
+    # Для остальных пользователей команды как будто нет
+    if not is_admin(message.chat.id):
+        return
+    bot.send_message(message.chat.id, broadcast_command(broadcaster, message))
+
+# Создать сервер вебхука, передающий обновления в process_updates
+def create_webhook_server(process_updates):
+    global WEBHOOK_SECRET
+    if not WEBHOOK_SECRET:
+        # Несколько процессов за балансировщиком должны использовать общий WEBHOOK_SECRET
+        WEBHOOK_SECRET = secrets.token_urlsafe(32)
+        logger.warning("WEBHOOK_SECRET не задан, сгенерирован случайный секрет для этого процесса")
+    return WebhookServer(
+        process_updates,
+        host=WEBHOOK_HOST,
+        port=WEBHOOK_PORT,
+        path=WEBHOOK_PATH,
+        secret_token=WEBHOOK_SECRET,
+        queue_size=WEBHOOK_QUEUE_SIZE
+    )
+
+# Найденные и отсутствующие фото текущего каталога (проверяются при каждой его загрузке)
 def check_photo_files():
-    missing_files = []
-    available_files = []
-    
-    for tea_name, tea_data in TEA_MENU.items():
-        photo_file = tea_data.get('photo_file')
-        if photo_file:
-            photo_path = os.path.join(TEA_PHOTOS_DIR, photo_file)
-            if os.path.exists(photo_path):
-                available_files.append(photo_file)
-            else:
-                missing_files.append((tea_name, photo_file))
-    
-    return available_files, missing_files
+    catalog = current_catalog().catalog
+    return list(catalog.available_photos), list(catalog.missing_photos)
 
 # Обработка любых других сообщений (fallback)
-@bot.message_handler(func=lambda message: True)
+@router.default
 def handle_other_messages(message):
     user_id = message.chat.id
     
@@ -732,19 +1340,19 @@ def handle_other_messages(message):
         return
     
     # Если пользователь не в состоянии или в главном меню
-    if user_id not in user_states or user_states[user_id] == "main":
+    session = sessions.get(user_id)
+    if session is None or session.state == State.MAIN:
         bot.send_message(
             user_id,
-            "🍃 *Чайный сомелье приветствует вас!*\n\n"
-            "Пожалуйста, выберите действие из меню ниже:",
-            reply_markup=main_menu(),
+            GREETING_TEXT,
+            reply_markup=rendered().main_menu,
             parse_mode="Markdown"
         )
     else:
         # Если пользователь в процессе теста или другого состояния
         bot.send_message(
             user_id,
-            "Пожалуйста, используйте кнопки для выбора вариантов или нажмите /start для возврата в главное меню.",
+            USE_BUTTONS_TEXT,
             parse_mode="Markdown"
         )
 
@@ -763,6 +1371,36 @@ if __name__ == "__main__":
         for tea_name, photo_file in missing_files:
             logger.warning(f"  - {tea_name}: {photo_file}")
     
+    optimize_photos(current_catalog().catalog)
+    logger.info(f"📎 В кэше {len(photo_cache)} file_id загруженных фото")
+    
+    # Следим за файлом каталога и подменяем меню на лету
+    catalog_loader.start()
+    
+    # Метрики обработчиков и запросов к Bot API
+    metrics_server = None
+    if METRICS_PORT:
+        try:
+            metrics_server = MetricsServer(metrics.registry, METRICS_HOST, METRICS_PORT)
+            metrics_server.start()
+        except OSError as e:
+            logger.warning(f"Не удалось поднять сервер метрик на порту {METRICS_PORT}: {e}")
+    
+    # Асинхронный режим: те же сценарии на AsyncTeleBot с общим пулом соединений
+    if BOT_ENGINE == "async":
+        import async_engine
+        try:
+            async_engine.run(sys.modules[__name__], TOKEN)
+        except Exception as e:
+            logger.error(f"❌ Ошибка при запуске бота: {e}")
+            logger.error("Проверьте ваш токен TELEGRAM_BOT_TOKEN")
+            exit(1)
+        finally:
+            catalog_loader.stop()
+            sessions.close()
+            logger.info(f"Статистика логирования: {log_pipeline.stats()}")
+        exit(0)
+    
     # Проверяем подключение к боту
     try:
         bot_info = bot.get_me()
@@ -772,10 +1410,51 @@ if __name__ == "__main__":
         logger.info("🍵 Чайный сомелье готов к работе!")
         logger.info("=" * 50)
         
-        # Запускаем опрос
-        bot.infinity_polling(timeout=60, long_polling_timeout=60)
+        metrics.instrument_handlers(bot)
+        metrics.instrument_router(router)
+        metrics.instrument_router(callback_router)
+        metrics.instrument_api(telebot.apihelper, "_make_request")
+        
+        # Запускаем воркеры обработки обновлений
+        scheduler.install(bot)
+        logger.info(f"⚙️ Воркеров обработки обновлений: {scheduler.workers}")
+        outbound.install(bot)
+        
+        # Рассылка, прерванная остановкой или падением, продолжается с контрольной точки
+        broadcaster.resume()
+        
+        if BOT_MODE == "webhook":
+            # Обновления приходят POST-запросами от Telegram
+            webhook_server = create_webhook_server(bot.process_new_updates)
+            if WEBHOOK_URL:
+                bot.set_webhook(url=WEBHOOK_URL, secret_token=WEBHOOK_SECRET)
+                logger.info(f"🌐 Вебхук зарегистрирован: {WEBHOOK_URL}")
+            try:
+                webhook_server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                webhook_server.stop()
+                logger.info(f"Статистика вебхука: {webhook_server.stats()}")
+        else:
+            # Long polling не работает, пока у бота зарегистрирован вебхук
+            bot.remove_webhook()
+            bot.infinity_polling(timeout=60, long_polling_timeout=60)
         
     except Exception as e:
         logger.error(f"❌ Ошибка при запуске бота: {e}")
         logger.error("Проверьте ваш токен TELEGRAM_BOT_TOKEN")
         exit(1)
+    finally:
+        # Дорабатываем принятые обновления и сохраняем сессии, чтобы после перезапуска продолжить диалоги
+        scheduler.stop(timeout=10)
+        logger.info(f"Статистика обработки обновлений: {scheduler.stats()}")
+        broadcaster.stop(timeout=10)
+        outbound.stop(timeout=10)
+        logger.info(f"Статистика исходящих вызовов: {outbound.stats()}")
+        logger.info(f"Статистика HTTP-соединений: {transport.stats()}")
+        transport.close()
+        catalog_loader.stop()
+        sessions.close()
+        logger.info(f"Статистика логирования: {log_pipeline.stats()}")
+        log_pipeline.stop()
@@ -0,0 +1,293 @@
+"""Рассылка объявлений всем пользователям бота (новый чай в меню и т.п.).
+
+Получатели читаются из хранилища сессий по возрастанию chat_id и отправляются
+порциями. Отправки идут через своё ведро токенов с запасом до общего лимита
+Telegram (~30 сообщений/с), чтобы ответы пользователям не вставали в очередь за
+рассылкой. Первое сообщение запуска отправляется отдельно: фото загружается один
+раз, а остальным получателям уходит его сохранённый file_id. После каждой порции
+прогресс пишется на диск, так что после падения или перезапуска рассылка
+продолжается с первого необработанного chat_id (повторно может уйти не больше
+одной порции). Чаты, где бот заблокирован, удаляются из хранилища сессий.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from api_errors import ApiCallError, BLOCKED
+from outbound import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Сообщений рассылки в секунду: остаток общего лимита Telegram остаётся ответам пользователям
+BULK_RATE = 20
+CHUNK_SIZE = 100
+# Как часто сообщать о ходе рассылки (секунды)
+REPORT_INTERVAL = 30
+
+# Исходы отправки одному получателю
+SENT = "sent"
+BLOCKED_CHAT = "blocked"
+FAILED = "failed"
+
+
+class BroadcastJob:
+    """Рассылка и её прогресс; after - последний обработанный chat_id"""
+
+    __slots__ = ("text", "photo_path", "admin_chat_id", "total", "after", "sent", "blocked", "failed",
+                 "started_at", "finished", "cancelled")
+
+    FIELDS = ("text", "photo_path", "admin_chat_id", "total", "after", "sent", "blocked", "failed", "started_at")
+
+    def __init__(self, text, photo_path=None, admin_chat_id=None, total=0, after=None,
+                 sent=0, blocked=0, failed=0, started_at=None):
+        self.text = text
+        self.photo_path = photo_path
+        self.admin_chat_id = admin_chat_id
+        self.total = total
+        self.after = after
+        self.sent = sent
+        self.blocked = blocked
+        self.failed = failed
+        self.started_at = started_at or time.time()
+        self.finished = False
+        self.cancelled = False
+
+    @property
+    def processed(self):
+        return self.sent + self.blocked + self.failed
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{field: data[field] for field in cls.FIELDS if field in data})
+
+
+class Broadcaster:
+    """Рассылка в фоновом потоке с контрольной точкой на диске.
+
+    send(chat_id, text, photo_path) отправляет одно сообщение и блокирует поток до
+    результата; при неудаче - ApiCallError. Через него же уходят отчёты о ходе
+    рассылки в чат администратора.
+    """
+
+    def __init__(self, sessions, send, checkpoint_path, rate=BULK_RATE, chunk_size=CHUNK_SIZE, workers=4,
+                 report_interval=REPORT_INTERVAL, on_outcome=None):
+        self.sessions = sessions
+        self.send = send
+        self.checkpoint_path = checkpoint_path
+        self.rate = rate
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.report_interval = report_interval
+        self.on_outcome = on_outcome
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._job = None
+        # Начало текущего запуска и сколько было обработано до него - для скорости и ETA
+        self._started = None
+        self._processed_before = 0
+
+    # Управление
+
+    def start(self, text, photo_path=None, admin_chat_id=None):
+        """Запускает новую рассылку; RuntimeError, если предыдущая ещё идёт"""
+        if self.running():
+            raise RuntimeError("Рассылка уже идёт")
+        job = BroadcastJob(text, photo_path, admin_chat_id, total=self.sessions.count())
+        # Контрольная точка пишется до запуска: короткая рассылка может закончиться и удалить её раньше
+        self._save(job)
+        self._launch(job)
+        logger.info(f"Рассылка запущена: {job.total} получателей, фото: {photo_path or 'нет'}")
+        return job
+
+    def resume(self):
+        """Продолжает рассылку из контрольной точки, если она осталась; возвращает её или None"""
+        job = self._load()
+        if job is None:
+            return None
+        self._launch(job)
+        logger.info(f"Рассылка продолжена после chat_id {job.after}: обработано {job.processed} из {job.total}")
+        return job
+
+    def cancel(self):
+        """Останавливает рассылку без возможности продолжить; False, если рассылки нет"""
+        with self._lock:
+            job = self._job
+            if job is None or job.finished:
+                return False
+            job.cancelled = True
+        self._stop.set()
+        return True
+
+    def stop(self, timeout=None):
+        """Останавливает поток рассылки; контрольная точка остаётся для продолжения"""
+        self._stop.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def status(self):
+        """Текущая или последняя рассылка (или None)"""
+        return self._job
+
+    def running(self):
+        thread = self._thread
+        return thread is not None and thread.is_alive()
+
+    def _launch(self, job):
+        with self._lock:
+            if self.running():
+                raise RuntimeError("Рассылка уже идёт")
+            self._stop.clear()
+            self._job = job
+            self._started = time.monotonic()
+            self._processed_before = job.processed
+            self._thread = threading.Thread(target=self._run, args=(job,), name="broadcast", daemon=True)
+            self._thread.start()
+
+    # Контрольная точка
+
+    def _save(self, job):
+        # Пишем во временный файл и атомарно подменяем, чтобы не оставить битый JSON
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(job.to_dict(), f, ensure_ascii=False)
+            os.replace(tmp_path, self.checkpoint_path)
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить прогресс рассылки {self.checkpoint_path}: {e}")
+
+    def _load(self):
+        if not os.path.exists(self.checkpoint_path):
+            return None
+        try:
+            with open(self.checkpoint_path, 'r', encoding='utf-8') as f:
+                return BroadcastJob.from_dict(json.load(f))
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Не удалось прочитать прогресс рассылки {self.checkpoint_path}: {e}")
+            return None
+
+    def _discard(self):
+        try:
+            os.remove(self.checkpoint_path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Не удалось удалить прогресс рассылки {self.checkpoint_path}: {e}")
+
+    # Отправка
+
+    def _deliver(self, job, chat_id):
+        try:
+            self.send(chat_id, job.text, job.photo_path)
+            outcome = SENT
+        except ApiCallError as e:
+            if e.kind == BLOCKED:
+                # Бот заблокирован или аккаунт удалён - больше этому чату не пишем
+                self.sessions.delete(chat_id)
+                outcome = BLOCKED_CHAT
+            else:
+                logger.warning(f"Рассылка: сообщение в чат {chat_id} не доставлено ({e.kind}): {e.error}")
+                outcome = FAILED
+        except Exception as e:
+            logger.error(f"Рассылка: ошибка отправки в чат {chat_id}: {e}")
+            outcome = FAILED
+        if self.on_outcome is not None:
+            self.on_outcome(outcome)
+        return outcome
+
+    def _count(self, job, outcome):
+        if outcome == SENT:
+            job.sent += 1
+        elif outcome == BLOCKED_CHAT:
+            job.blocked += 1
+        else:
+            job.failed += 1
+
+    def _send_chunk(self, job, chunk, bucket, executor, first):
+        futures = []
+        for chat_id in chunk:
+            if chat_id == job.admin_chat_id:
+                # Админу рассылку не шлём, но он остаётся в порции: курсор after сдвигается и за него
+                continue
+            bucket.acquire()
+            if first:
+                # Первое сообщение - синхронно: после него file_id фото уже в кэше
+                self._count(job, self._deliver(job, chat_id))
+                first = False
+            else:
+                futures.append(executor.submit(self._deliver, job, chat_id))
+        for future in futures:
+            self._count(job, future.result())
+        job.after = chunk[-1]
+        self._save(job)
+
+    def progress(self, job):
+        """(скорость в сообщениях/с за этот запуск, оставшиеся секунды или None)"""
+        elapsed = time.monotonic() - self._started
+        rate = (job.processed - self._processed_before) / elapsed if elapsed > 0 else 0.0
+        remaining = max(job.total - job.processed, 0)
+        return rate, (remaining / rate if rate > 0 else None)
+
+    def describe(self, job=None, title="📣 Рассылка"):
+        """Текст о ходе рассылки: сколько обработано, скорость и сколько осталось"""
+        job = job or self._job
+        rate, eta = self.progress(job)
+        text = (f"{title}: обработано {job.processed} из ~{job.total} "
+                f"(доставлено {job.sent}, заблокировали бота {job.blocked}, ошибок {job.failed}), "
+                f"{rate:.1f} сообщ./с")
+        if eta is not None and not job.finished and not job.cancelled:
+            text += f", осталось ~{int(eta // 60)} мин {int(eta % 60)} с"
+        return text
+
+    def _report(self, job, text):
+        logger.info(text)
+        if job.admin_chat_id is None:
+            return
+        try:
+            self.send(job.admin_chat_id, text, None)
+        except Exception as e:
+            logger.warning(f"Не удалось отправить отчёт о рассылке: {e}")
+
+    def _run(self, job):
+        bucket = TokenBucket(self.rate)
+        last_report = time.monotonic()
+        first = True
+        executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="broadcast-send")
+        try:
+            chunk = []
+            for chat_id in self.sessions.chat_ids(after=job.after):
+                if self._stop.is_set():
+                    break
+                chunk.append(chat_id)
+                if len(chunk) < self.chunk_size:
+                    continue
+                self._send_chunk(job, chunk, bucket, executor, first)
+                chunk, first = [], False
+                if time.monotonic() - last_report >= self.report_interval:
+                    last_report = time.monotonic()
+                    self._report(job, self.describe(job))
+            if chunk and not self._stop.is_set():
+                self._send_chunk(job, chunk, bucket, executor, first)
+        except Exception as e:
+            # Контрольная точка остаётся - рассылку можно продолжить после перезапуска
+            logger.error(f"Рассылка прервана ошибкой: {e}")
+            return
+        finally:
+            executor.shutdown(wait=True)
+
+        if job.cancelled:
+            self._discard()
+            self._report(job, self.describe(job, "⏹ Рассылка отменена"))
+        elif not self._stop.is_set():
+            job.finished = True
+            self._discard()
+            self._report(job, self.describe(job, "✅ Рассылка завершена"))
+        else:
+            logger.info(f"Рассылка приостановлена после chat_id {job.after}, продолжится при следующем запуске")
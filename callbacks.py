@@ -0,0 +1,173 @@
+"""Формат callback_data инлайн-кнопок и выбор обработчика нажатия.
+
+Данные кнопки - номер версии формата, короткий код действия и аргументы через
+точку, целые числа в base36: "1p.a" - страница меню 10. Telegram ограничивает
+callback_data 64 байтами, так что длина проверяется при кодировании. Разбор идёт
+по таблице действий: неизвестный код, лишний или испорченный аргумент дают None,
+а не исключение в обработчике. Строки старого формата ("menu_page_3",
+"to_main_menu"...) продолжают приниматься - они остаются на кнопках уже
+отправленных сообщений.
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+VERSION = "1"
+SEPARATOR = "."
+
+# Ограничение Telegram на callback_data
+MAX_CALLBACK_DATA = 64
+
+# Самое длинное целое в аргументах (base36), чтобы не разбирать мусор произвольной длины
+MAX_INT_DIGITS = 8
+# Наибольшее целое аргумента: столько вмещают поля сессии (страница меню - uint32)
+MAX_INT = 2 ** 32 - 1
+
+DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+
+class CallbackDataError(ValueError):
+    """Действие нельзя закодировать в callback_data"""
+
+
+def encode_int(value):
+    if not 0 <= value <= MAX_INT:
+        raise CallbackDataError(f"Число вне допустимого диапазона в callback_data: {value}")
+    encoded = ""
+    while True:
+        value, digit = divmod(value, 36)
+        encoded = DIGITS[digit] + encoded
+        if not value:
+            return encoded
+
+
+def decode_int(text):
+    """Целое из base36 или None"""
+    if not text or len(text) > MAX_INT_DIGITS or not text.isascii() or not text.isalnum():
+        return None
+    value = int(text, 36)
+    return value if value <= MAX_INT else None
+
+
+def decode_decimal(text):
+    """Целое в десятичной записи (старый формат) или None"""
+    if not text or len(text) > MAX_INT_DIGITS or not text.isascii() or not text.isdigit():
+        return None
+    value = int(text)
+    return value if value <= MAX_INT else None
+
+
+def encode_str(value):
+    value = str(value)
+    if SEPARATOR in value:
+        raise CallbackDataError(f"Разделитель в аргументе callback_data: {value!r}")
+    return value
+
+
+def decode_str(text):
+    return text or None
+
+
+# Типы аргументов: (кодирование, разбор)
+ARG_TYPES = {
+    int: (encode_int, decode_int),
+    str: (encode_str, decode_str),
+}
+
+
+class CallbackCodec:
+    """Таблица действий: имя -> код и типы аргументов"""
+
+    def __init__(self, version=VERSION):
+        self.version = version
+        self._by_name = {}  # имя -> (код, кодировщики аргументов)
+        self._by_code = {}  # код -> (имя, разборщики аргументов)
+        self._legacy = {}  # старая строка целиком -> (имя, аргументы)
+        self._legacy_prefixes = {}  # старый префикс -> имя действия с одним целым аргументом
+
+    def action(self, name, code, *arg_types):
+        if code in self._by_code or SEPARATOR in code:
+            raise ValueError(f"Код действия {code!r} занят или некорректен")
+        self._by_name[name] = (code, tuple(ARG_TYPES[t][0] for t in arg_types))
+        self._by_code[code] = (name, tuple(ARG_TYPES[t][1] for t in arg_types))
+
+    def legacy(self, data, name, *args):
+        """Строка старого формата, которая означает действие name с аргументами args"""
+        self._legacy[data] = (name, args)
+
+    def legacy_prefix(self, prefix, name):
+        """Старый формат вида prefix + десятичное число ("menu_page_3")"""
+        self._legacy_prefixes[prefix] = name
+
+    def encode(self, name, *args):
+        code, encoders = self._by_name[name]
+        if len(args) != len(encoders):
+            raise CallbackDataError(f"{name}: ожидается аргументов {len(encoders)}, передано {len(args)}")
+        data = SEPARATOR.join([self.version + code] + [encode(arg) for encode, arg in zip(encoders, args)])
+        if len(data.encode("utf-8")) > MAX_CALLBACK_DATA:
+            raise CallbackDataError(f"callback_data длиннее {MAX_CALLBACK_DATA} байт: {data!r}")
+        return data
+
+    def decode(self, data):
+        """(имя действия, аргументы) или None для неизвестных и испорченных данных"""
+        if not data:
+            return None
+        if data.startswith(self.version):
+            parts = data[len(self.version):].split(SEPARATOR)
+            entry = self._by_code.get(parts[0])
+            if entry is not None:
+                name, decoders = entry
+                if len(parts) - 1 != len(decoders):
+                    return None
+                args = tuple(decode(part) for decode, part in zip(decoders, parts[1:]))
+                if None in args:
+                    return None
+                return name, args
+        return self._decode_legacy(data)
+
+    def _decode_legacy(self, data):
+        entry = self._legacy.get(data)
+        if entry is not None:
+            return entry
+        for prefix, name in self._legacy_prefixes.items():
+            if data.startswith(prefix):
+                arg = decode_decimal(data[len(prefix):])
+                return (name, (arg,)) if arg is not None else None
+        return None
+
+
+class CallbackRouter:
+    """Обработчики действий инлайн-кнопок: handler(call, *аргументы)"""
+
+    def __init__(self, codec):
+        self.codec = codec
+        self._handlers = {}
+
+    def on(self, name):
+        def decorator(handler):
+            self._handlers[name] = handler
+            return handler
+        return decorator
+
+    def resolve(self, data):
+        """(обработчик, аргументы) или None"""
+        decoded = self.codec.decode(data)
+        if decoded is None:
+            return None
+        handler = self._handlers.get(decoded[0])
+        return (handler, decoded[1]) if handler is not None else None
+
+    def dispatch(self, call):
+        resolved = self.resolve(call.data)
+        if resolved is None:
+            logger.debug(f"Необработанные данные кнопки от {call.from_user.id}: {call.data!r}")
+            return
+        handler, args = resolved
+        return handler(call, *args)
+
+    def handlers(self):
+        return list(self._handlers.values())
+
+    def replace_handlers(self, wrap):
+        """Заменяет каждый обработчик на wrap(обработчик), например для замера времени"""
+        self._handlers = {name: wrap(handler) for name, handler in self._handlers.items()}
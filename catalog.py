@@ -0,0 +1,187 @@
+"""Каталог чаев во внешнем JSON-файле с горячей перезагрузкой.
+
+Меню читается из файла (по умолчанию tea_menu.json) в неизменяемую структуру на
+массивах: страница меню - индекс в кортеже, поиск по названию - словарь индексов.
+Загрузчик следит за временем изменения файла и подменяет каталог целиком одной
+операцией присваивания: обработчики, которые уже взяли старую версию, дорабатывают
+с ней, а новые запросы получают новую. Перед подменой каталог проверяется
+(структура, наличие фото), а ошибочный файл не трогает работающую версию.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import namedtuple
+from types import MappingProxyType
+
+logger = logging.getLogger(__name__)
+
+# Как часто проверять, не изменился ли файл каталога (секунды)
+DEFAULT_WATCH_INTERVAL = 2.0
+
+# Обязательные поля каждого чая
+REQUIRED_FIELDS = ("description", "price", "characteristics")
+
+# Версия каталога вместе с построенными по ней движком подбора, таблицей результатов
+# и деревом адаптивного теста (None, если тест всегда полный)
+CatalogSnapshot = namedtuple("CatalogSnapshot", ["catalog", "recommender", "results", "quiz"], defaults=(None,))
+
+
+class CatalogError(ValueError):
+    """Файл каталога не прочитан или содержит ошибки"""
+
+
+def content_fingerprint(menu, questions):
+    """Отпечаток всех данных, которые попадают в подписи и клавиатуры"""
+    raw = json.dumps([menu, questions], ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def validate_menu(menu, questions):
+    """Проверяет структуру меню и выбрасывает CatalogError с описанием первой ошибки"""
+    if not isinstance(menu, dict) or not menu:
+        raise CatalogError("Каталог должен быть непустым объектом {название: данные чая}")
+    for name, tea in menu.items():
+        if not isinstance(tea, dict):
+            raise CatalogError(f"{name}: данные чая должны быть объектом")
+        for field in REQUIRED_FIELDS:
+            if field not in tea:
+                raise CatalogError(f"{name}: нет поля {field}")
+        characteristics = tea["characteristics"]
+        if not isinstance(characteristics, dict) or len(characteristics) != len(questions):
+            raise CatalogError(f"{name}: нужно {len(questions)} характеристик, по одной на вопрос теста")
+        if not isinstance(tea["price"], (int, float)):
+            raise CatalogError(f"{name}: цена должна быть числом")
+
+
+class Catalog:
+    """Неизменяемая версия каталога: страницы по индексу и чаи по названию за O(1)"""
+
+    def __init__(self, menu, questions, photos_dir, version=None):
+        self.version = version or content_fingerprint(menu, questions)
+        self.questions = questions
+        self.photos_dir = photos_dir
+        self.names = tuple(menu)
+        self.teas = tuple(MappingProxyType(dict(menu[name])) for name in self.names)
+        self.menu = MappingProxyType(dict(zip(self.names, self.teas)))
+        self._pages = {name: page for page, name in enumerate(self.names)}
+
+        # Фото проверяются один раз на версию каталога
+        available, missing = [], []
+        for name, tea in zip(self.names, self.teas):
+            photo_file = tea.get("photo_file")
+            if not photo_file:
+                continue
+            if os.path.exists(os.path.join(photos_dir, photo_file)):
+                available.append(photo_file)
+            else:
+                missing.append((name, photo_file))
+        self.available_photos = tuple(available)
+        self.missing_photos = tuple(missing)
+
+    @classmethod
+    def from_file(cls, path, questions, photos_dir):
+        try:
+            with open(path, encoding="utf-8") as f:
+                menu = json.load(f)
+        except (OSError, ValueError) as e:
+            raise CatalogError(f"Не удалось прочитать каталог {path}: {e}") from e
+        validate_menu(menu, questions)
+        return cls(menu, questions, photos_dir)
+
+    def __len__(self):
+        return len(self.names)
+
+    def page(self, index):
+        """(название, данные) чая на странице index"""
+        return self.names[index], self.teas[index]
+
+    def get(self, name):
+        """Данные чая по названию или None"""
+        page = self._pages.get(name)
+        return None if page is None else self.teas[page]
+
+
+class CatalogLoader:
+    """Загружает каталог из файла и подменяет его при изменении файла.
+
+    prepare(catalog) строит зависящие от каталога структуры (движок подбора,
+    таблицу результатов) до подмены; current возвращает его результат целиком.
+    """
+
+    def __init__(self, path, questions, photos_dir, prepare=None, interval=DEFAULT_WATCH_INTERVAL):
+        self.path = path
+        self.questions = questions
+        self.photos_dir = photos_dir
+        self.prepare = prepare or (lambda catalog: catalog)
+        self.interval = interval
+        self.current = None
+        self._signature = None
+        self._version = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _file_signature(self):
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def load(self):
+        """Первая загрузка: ошибка в файле здесь фатальна"""
+        with self._lock:
+            self._signature = self._file_signature()
+            self._swap(Catalog.from_file(self.path, self.questions, self.photos_dir))
+        return self.current
+
+    def reload(self):
+        """Перечитывает файл, если он изменился. Возвращает True, если каталог подменён"""
+        with self._lock:
+            try:
+                signature = self._file_signature()
+            except OSError as e:
+                logger.error(f"Файл каталога недоступен, остаётся текущая версия: {e}")
+                return False
+            if signature == self._signature:
+                return False
+            # Запоминаем сразу, чтобы не повторять ошибку на каждой проверке
+            self._signature = signature
+            try:
+                catalog = Catalog.from_file(self.path, self.questions, self.photos_dir)
+            except CatalogError as e:
+                logger.error(f"Каталог не обновлён, остаётся текущая версия: {e}")
+                return False
+            if catalog.version == self._version:
+                return False
+            try:
+                self._swap(catalog)
+            except Exception as e:
+                logger.error(f"Не удалось подготовить новую версию каталога: {e}", exc_info=True)
+                return False
+            return True
+
+    def _swap(self, catalog):
+        prepared = self.prepare(catalog)
+        # Одно присваивание: читатели видят либо старую версию, либо новую целиком
+        self.current = prepared
+        self._version = catalog.version
+        logger.info(f"Каталог {catalog.version[:12]} загружен: {len(catalog)} чаев")
+        for name, photo_file in catalog.missing_photos:
+            logger.warning(f"Нет фото для {name}: {photo_file}")
+
+    def start(self):
+        """Запускает фоновую проверку файла каталога"""
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._watch, name="catalog-watcher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            self.reload()
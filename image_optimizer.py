@@ -0,0 +1,209 @@
+"""Подготовка фотографий чаев к отправке в Telegram.
+
+Telegram всё равно пережимает фото (длинная сторона до 1280 px, JPEG), поэтому
+исходники отправлять незачем. Здесь каждое фото один раз превращается в JPEG с
+ограниченным размером и качеством, без EXIF и прочих метаданных. Результаты лежат
+в папке кэша под именем из хэша исходника и настроек: изменение фото или настроек
+даёт новый вариант, а повторный запуск ничего не пересчитывает. Пережатие идёт в
+отдельных процессах photo_worker.py: это чистые интерпретаторы без кода бота (его
+настройки, хранилища и каталог в них не загружаются), а запуск через subprocess не
+копирует многопоточный процесс бота - оптимизация вызывается и из потока слежения
+за каталогом. Pillow - необязательная зависимость: без неё отправляются исходники.
+
+Запуск вручную: python image_optimizer.py [--photos tea_photos] [--cache data/photo_variants]
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import PIL
+except ImportError:
+    PIL = None
+
+logger = logging.getLogger(__name__)
+
+# Telegram показывает фото с длинной стороной не больше 1280 px
+DEFAULT_MAX_SIDE = 1280
+DEFAULT_QUALITY = 85
+
+# Процесс пережатия: задания в stdin, результаты в stdout (см. photo_worker.py)
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "photo_worker.py")
+
+PHOTO_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp", ".gif", ".tif", ".tiff")
+
+# Строка отчёта: исходник, его размер, размер варианта и путь, который будет отправляться
+OptimizedPhoto = namedtuple("OptimizedPhoto", ["source", "source_bytes", "variant_bytes", "path"])
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def source_key(path):
+    """(время изменения, размер) файла: по нему видно, что исходник поменяли"""
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+class PhotoOptimizer:
+    """Готовит и выдаёт оптимизированные варианты фотографий"""
+
+    def __init__(self, cache_dir, max_side=DEFAULT_MAX_SIDE, quality=DEFAULT_QUALITY, workers=None):
+        self.cache_dir = cache_dir
+        self.max_side = max_side
+        self.quality = quality
+        self.workers = workers
+        self._variants = {}  # путь исходника -> ((время изменения, размер) исходника, путь варианта)
+        self._lock = threading.Lock()
+
+    @property
+    def available(self):
+        return PIL is not None
+
+    def _settings_key(self):
+        return json.dumps({"format": "jpeg", "max_side": self.max_side, "quality": self.quality},
+                          sort_keys=True)
+
+    def variant_path(self, source_hash):
+        key = hashlib.sha256(f"{source_hash}:{self._settings_key()}".encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, f"{key[:32]}.jpg")
+
+    def optimize(self, sources):
+        """Готовит варианты для списка фото и возвращает отчёт (список OptimizedPhoto)"""
+        if not self.available:
+            logger.warning("Pillow не установлен, фото отправляются без оптимизации")
+            return []
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        jobs = {}
+        keys = {}
+        for source in sources:
+            try:
+                # Ключ снимается до хэша: если файл поменяют во время чтения, variant() это заметит
+                keys[source] = source_key(source)
+                jobs[source] = self.variant_path(file_hash(source))
+            except OSError as e:
+                logger.warning(f"Не удалось прочитать фото {source}: {e}")
+
+        pending = {source: target for source, target in jobs.items() if not os.path.exists(target)}
+        if pending:
+            for source, error in self._convert(pending).items():
+                logger.warning(f"Не удалось оптимизировать {source}: {error}")
+                del jobs[source]
+
+        report = []
+        for source, target in jobs.items():
+            source_bytes = os.path.getsize(source)
+            variant_bytes = os.path.getsize(target)
+            # Если исходник и так меньше, отправляем его
+            path = target if variant_bytes < source_bytes else source
+            self._variants[source] = (keys[source], path)
+            report.append(OptimizedPhoto(source, source_bytes, variant_bytes, path))
+        return report
+
+    def _convert(self, pending):
+        """Пережимает {исходник: вариант} в процессах photo_worker; {исходник: ошибка} для неудачных"""
+        items = list(pending.items())
+        workers = max(1, min(self.workers or os.cpu_count() or 1, len(items)))
+        errors = {}
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for chunk_errors in pool.map(self._run_worker, [items[i::workers] for i in range(workers)]):
+                errors.update(chunk_errors)
+        return errors
+
+    def _run_worker(self, jobs):
+        lines = "".join(
+            json.dumps({"source": source, "target": target, "max_side": self.max_side, "quality": self.quality},
+                       ensure_ascii=False) + "\n"
+            for source, target in jobs
+        )
+        try:
+            completed = subprocess.run([sys.executable, WORKER_SCRIPT], input=lines, capture_output=True,
+                                       text=True, encoding="utf-8")
+        except OSError as e:
+            return {source: e for source, _ in jobs}
+        results = {}
+        for line in completed.stdout.splitlines():
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue
+            results[result["source"]] = result.get("error")
+        errors = {source: error for source, error in results.items() if error}
+        # Процесс упал, не дойдя до конца заданий
+        stderr = completed.stderr.strip().splitlines()
+        reason = stderr[-1] if stderr else f"photo_worker завершился с кодом {completed.returncode}"
+        errors.update({source: reason for source, _ in jobs if source not in results})
+        return errors
+
+    def optimize_dir(self, photos_dir):
+        sources = sorted(
+            os.path.join(photos_dir, name) for name in os.listdir(photos_dir)
+            if name.lower().endswith(PHOTO_EXTENSIONS)
+        )
+        return self.optimize(sources)
+
+    def variant(self, source):
+        """Путь, который нужно отправлять вместо source (сам source, если варианта нет).
+
+        Если исходник изменился на диске (время изменения или размер), вариант готовится заново.
+        """
+        entry = self._variants.get(source)
+        if entry is None:
+            return source
+        key, path = entry
+        try:
+            if source_key(source) == key:
+                return path
+        except OSError:
+            return source
+        with self._lock:
+            # Другой поток мог уже подготовить новый вариант
+            if self._variants.get(source) is entry:
+                logger.info(f"Фото {source} изменилось, готовим вариант заново")
+                del self._variants[source]
+                self.optimize([source])
+        entry = self._variants.get(source)
+        return source if entry is None else entry[1]
+
+
+def log_report(report):
+    """Пишет в лог экономию по каждому фото и итог"""
+    total_source = total_sent = 0
+    for item in report:
+        sent_bytes = os.path.getsize(item.path)
+        total_source += item.source_bytes
+        total_sent += sent_bytes
+        logger.info(f"🖼 {os.path.basename(item.source)}: {item.source_bytes // 1024} КБ -> "
+                    f"{sent_bytes // 1024} КБ (-{item.source_bytes - sent_bytes} байт)")
+    if report:
+        logger.info(f"🖼 Оптимизировано фото: {len(report)}, сэкономлено {total_source - total_sent} байт "
+                    f"из {total_source}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Оптимизация фотографий чаев для Telegram")
+    parser.add_argument("--photos", default="tea_photos", help="папка с исходными фото")
+    parser.add_argument("--cache", help="папка для оптимизированных вариантов",
+                        default=os.getenv('PHOTO_VARIANTS_DIR',
+                                          os.path.join(os.getenv('BOT_DATA_DIR', 'data'), 'photo_variants')))
+    parser.add_argument("--max-side", type=int, default=int(os.getenv('PHOTO_MAX_SIDE', DEFAULT_MAX_SIDE)))
+    parser.add_argument("--quality", type=int, default=int(os.getenv('PHOTO_QUALITY', DEFAULT_QUALITY)))
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    optimizer = PhotoOptimizer(args.cache, args.max_side, args.quality, args.workers)
+    log_report(optimizer.optimize_dir(args.photos))
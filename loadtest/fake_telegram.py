@@ -0,0 +1,280 @@
+"""Локальная замена Telegram Bot API для нагрузочного теста.
+
+Сервер понимает методы, которые вызывает бот (getMe, getUpdates, sendMessage,
+sendPhoto, editMessageMedia, editMessageText, deleteMessage, answerCallbackQuery,
+вебхук-методы), отвечает правдоподобными объектами Message и умеет:
+- добавлять задержку к каждому ответу (latency и jitter);
+- с заданной вероятностью отвечать 429 Too Many Requests с retry_after;
+- с заданной вероятностью отвечать 502 Bad Gateway, как сбой на стороне Telegram;
+- отдавать боту обновления через long polling (getUpdates).
+О каждом успешном ответе бота в чат сообщается через on_reply, по этому сигналу
+симулятор пользователей делает следующий шаг сценария; о подтверждении нажатия
+кнопки (answerCallbackQuery) - через on_ack.
+"""
+import json
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+# Методы, которыми бот отвечает пользователю (по ним считается задержка обработки)
+REPLY_METHODS = frozenset(["sendMessage", "sendPhoto", "editMessageMedia", "editMessageText", "editMessageCaption"])
+
+# Методы, на которые может прийти искусственный ответ 429
+RATE_LIMITED_METHODS = REPLY_METHODS | {"editMessageReplyMarkup"}
+
+# Служебные методы, которые не относятся к обработке сообщений
+SERVICE_METHODS = frozenset(["getMe", "getUpdates", "deleteWebhook", "setWebhook", "getWebhookInfo", "close", "logOut"])
+
+# Дольше этого getUpdates не держит соединение (чтобы бот быстро останавливался)
+MAX_POLL_TIMEOUT = 5.0
+
+BOT_USER = {"id": 1000000, "is_bot": True, "first_name": "Чайный сомелье", "username": "fake_tea_bot"}
+
+
+def parse_fields(handler, body):
+    """Параметры запроса из строки запроса и тела (urlencoded или multipart)"""
+    fields = dict(parse_qsl(urlsplit(handler.path).query))
+    content_type = handler.headers.get("Content-Type", "")
+    if content_type.startswith("multipart/form-data"):
+        message = BytesParser(policy=HTTP).parsebytes(
+            f"Content-Type: {content_type}\r\n\r\n".encode("latin-1") + body
+        )
+        for part in message.iter_parts():
+            name = part.get_param("name", header="content-disposition")
+            if part.get_filename():
+                fields[name] = {"upload": len(part.get_payload(decode=True) or b"")}
+            else:
+                fields[name] = (part.get_payload(decode=True) or b"").decode("utf-8")
+    elif content_type.startswith("application/json") and body:
+        fields.update(json.loads(body))
+    elif body:
+        fields.update(parse_qsl(body.decode("utf-8")))
+    return fields
+
+
+class FakeTelegramServer:
+    """HTTP-сервер, изображающий Bot API для одного бота"""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, jitter=0.0,
+                 rate_limit_probability=0.0, retry_after=1, server_error_probability=0.0,
+                 on_reply=None, on_ack=None, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit_probability = rate_limit_probability
+        self.retry_after = retry_after
+        self.server_error_probability = server_error_probability
+        self.on_reply = on_reply
+        self.on_ack = on_ack
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._updates = deque()
+        self._updates_ready = threading.Condition(self._lock)
+        self._update_id = 0
+        self._message_ids = defaultdict(int)
+        self._file_id = 0
+        self.calls = defaultdict(int)
+        self.rate_limited = defaultdict(int)
+        self.server_errors = defaultdict(int)
+        # Принятые TCP-соединения: с keep-alive их намного меньше, чем запросов
+        self.connections = 0
+        self.webhook_url = None
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def address(self):
+        return self._httpd.server_address[:2]
+
+    @property
+    def api_url(self):
+        """Шаблон адреса для telebot.apihelper.API_URL"""
+        host, port = self.address
+        return f"http://{host}:{port}/bot{{0}}/{{1}}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="fake-telegram", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            self._updates_ready.notify_all()
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    # Обновления и идентификаторы
+
+    def next_update_id(self):
+        with self._lock:
+            self._update_id += 1
+            return self._update_id
+
+    def next_message_id(self, chat_id):
+        with self._lock:
+            self._message_ids[chat_id] += 1
+            return self._message_ids[chat_id]
+
+    def push_update(self, update):
+        """Кладёт обновление в очередь getUpdates"""
+        with self._lock:
+            self._updates.append(update)
+            self._updates_ready.notify_all()
+
+    def _get_updates(self, offset, limit, timeout):
+        deadline = time.monotonic() + min(timeout, MAX_POLL_TIMEOUT)
+        with self._lock:
+            # Подтверждённые ботом обновления удаляем
+            while self._updates and self._updates[0]["update_id"] < offset:
+                self._updates.popleft()
+            while not self._updates:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return []
+                self._updates_ready.wait(remaining)
+                while self._updates and self._updates[0]["update_id"] < offset:
+                    self._updates.popleft()
+            return list(self._updates)[:limit]
+
+    # Ответы на методы API
+
+    def _photo_id(self, value):
+        if isinstance(value, str) and not value.startswith("attach://"):
+            return value
+        with self._lock:
+            self._file_id += 1
+            return f"fake-photo-{self._file_id}"
+
+    def _message(self, chat_id, message_id=None, reply_markup=None, **fields):
+        message = {
+            "message_id": message_id or self.next_message_id(chat_id),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+        }
+        message.update(fields)
+        # Как и Telegram, в отправленном сообщении возвращаются только инлайн-кнопки
+        markup = json.loads(reply_markup) if isinstance(reply_markup, str) else reply_markup
+        if markup and "inline_keyboard" in markup:
+            message["reply_markup"] = markup
+        return message
+
+    def _photo(self, value):
+        return [{"file_id": self._photo_id(value), "file_unique_id": "u", "width": 1280, "height": 960}]
+
+    def handle(self, method, fields):
+        """Результат метода API или None для неизвестного метода"""
+        if method == "getMe":
+            return BOT_USER
+        if method == "getUpdates":
+            return self._get_updates(int(fields.get("offset") or 0), int(fields.get("limit") or 100),
+                                     float(fields.get("timeout") or 0))
+        if method in ("deleteWebhook", "close", "logOut", "answerCallbackQuery", "deleteMessage"):
+            return True
+        if method == "setWebhook":
+            self.webhook_url = fields.get("url")
+            return True
+        if method == "getWebhookInfo":
+            return {"url": self.webhook_url or "", "has_custom_certificate": False, "pending_update_count": 0}
+
+        chat_id = int(fields.get("chat_id") or 0)
+        markup = fields.get("reply_markup")
+        if method == "sendMessage":
+            return self._message(chat_id, reply_markup=markup, text=fields.get("text", ""))
+        if method == "sendPhoto":
+            return self._message(chat_id, reply_markup=markup, caption=fields.get("caption", ""),
+                                 photo=self._photo(fields.get("photo")))
+        if method == "editMessageMedia":
+            media = json.loads(fields.get("media") or "{}")
+            return self._message(chat_id, int(fields.get("message_id") or 0), markup,
+                                 caption=media.get("caption", ""), photo=self._photo(media.get("media")))
+        if method == "editMessageCaption":
+            # Подпись меняется только у сообщений с медиа - фото остаётся прежним
+            return self._message(chat_id, int(fields.get("message_id") or 0), markup,
+                                 caption=fields.get("caption") or "", photo=self._photo(None))
+        if method in ("editMessageText", "editMessageReplyMarkup"):
+            return self._message(chat_id, int(fields.get("message_id") or 0), markup,
+                                 text=fields.get("text") or "")
+        return None
+
+    def _make_handler(self):
+        server = self
+
+        class FakeTelegramHandler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                with server._lock:
+                    server.connections += 1
+
+            def handle(self):
+                try:
+                    super().handle()
+                except ConnectionResetError:
+                    # Бот закрыл пул соединений при остановке
+                    pass
+
+            def do_GET(self):
+                self._serve()
+
+            def do_POST(self):
+                self._serve()
+
+            def _serve(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                method = urlsplit(self.path).path.rsplit("/", 1)[-1]
+                fields = parse_fields(self, body)
+                with server._lock:
+                    server.calls[method] += 1
+
+                if method not in SERVICE_METHODS:
+                    delay = server.latency + server._random.uniform(0, server.jitter)
+                    if delay > 0:
+                        time.sleep(delay)
+                    if method in RATE_LIMITED_METHODS and server._random.random() < server.rate_limit_probability:
+                        with server._lock:
+                            server.rate_limited[method] += 1
+                        self._reply(429, {
+                            "ok": False, "error_code": 429,
+                            "description": f"Too Many Requests: retry after {server.retry_after}",
+                            "parameters": {"retry_after": server.retry_after},
+                        })
+                        return
+                    if method in RATE_LIMITED_METHODS and server._random.random() < server.server_error_probability:
+                        with server._lock:
+                            server.server_errors[method] += 1
+                        self._reply(502, {"ok": False, "error_code": 502, "description": "Bad Gateway"})
+                        return
+
+                result = server.handle(method, fields)
+                if result is None:
+                    self._reply(404, {"ok": False, "error_code": 404, "description": "Not Found"})
+                    return
+                self._reply(200, {"ok": True, "result": result})
+                if method in REPLY_METHODS and server.on_reply is not None:
+                    server.on_reply(result["chat"]["id"], method, result)
+                if method == "answerCallbackQuery" and server.on_ack is not None:
+                    server.on_ack(fields.get("callback_query_id"))
+
+            def _reply(self, status, payload):
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                try:
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    # Бот остановлен, пока держал long polling
+                    pass
+
+            def log_message(self, format, *args):
+                pass
+
+        return FakeTelegramHandler
@@ -0,0 +1,510 @@
+"""Нагрузочный тест бота против локальной замены Telegram Bot API.
+
+Скрипт поднимает fake_telegram.FakeTelegramServer, запускает bot.py отдельным
+процессом с TELEGRAM_API_URL на этот сервер и прогоняет через него заданное число
+пользователей по сценарию: /start, тест (случайный ответ на каждый вопрос, который
+задал бот, - их число и порядок зависят от QUIZ_MODE), результат, меню из
+результата, листание страниц, возврат в главное меню. Каждый следующий шаг
+пользователь делает после ответа бота на предыдущий.
+
+В отчёте: обновлений в секунду, перцентили задержки от отправки обновления до
+ответа бота, число вызовов API на один пройденный тест. Можно прогнать сразу
+несколько режимов: --engine sync,async --mode polling,webhook.
+
+Прогон считается неудачным (код выхода 1), если кто-то из пользователей не дошёл
+до конца сценария или бот записал в лог исключение (ERROR с трассировкой) до
+начала остановки: сломанный обработчик не должен проходить незамеченным.
+
+    python loadtest/run_loadtest.py --users 2000 --latency-ms 30 --rate-limit 0.01
+"""
+import argparse
+import heapq
+import itertools
+import json
+import os
+import random
+import re
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from fake_telegram import SERVICE_METHODS, FakeTelegramServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TOKEN = "123456:loadtest"
+WEBHOOK_SECRET = "loadtest-secret"
+
+# Начало записи лога бота в текстовом формате: время, логгер, уровень
+LOG_RECORD = re.compile(r"^(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d,\d{3}) - \S+ - (\w+) - ")
+LOG_TIME_FORMAT = "%Y-%m-%d %H:%M:%S,%f"
+
+
+def load_flow():
+    """Кнопки, варианты ответов и число страниц меню берутся из самого bot.py"""
+    saved_env, saved_cwd = dict(os.environ), os.getcwd()
+    os.environ.update({"TELEGRAM_BOT_TOKEN": TOKEN, "SESSION_BACKEND": "memory",
+                       "BOT_DATA_DIR": tempfile.mkdtemp(prefix="chaybar-loadtest-")})
+    os.chdir(ROOT)
+    sys.path.insert(0, ROOT)
+    try:
+        import bot
+        from callbacks import SEPARATOR
+    finally:
+        os.environ.clear()
+        os.environ.update(saved_env)
+        os.chdir(saved_cwd)
+    return {
+        "start_test_button": bot.MAIN_MENU_BUTTONS[0],
+        "questions": [(question["text"], list(question["options"])) for question in bot.QUESTIONS],
+        "pages": len(bot.current_catalog().catalog),
+        "show_menu": bot.callbacks.encode("show_menu"),
+        "menu_pages": [bot.callbacks.encode("menu_page", page) for page in range(len(bot.current_catalog().catalog))],
+        "main_menu": bot.callbacks.encode("main_menu"),
+        # Начало callback_data ответа в инлайн-тесте (QUIZ_UI=inline)
+        "answer_prefix": bot.callbacks.encode("answer", 0, 0, 0).split(SEPARATOR)[0] + SEPARATOR,
+    }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(q / 100 * (len(values) - 1)))))
+    return values[index]
+
+
+class User:
+    """Один симулируемый пользователь: список шагов и текущее состояние"""
+
+    __slots__ = ("chat_id", "steps", "position", "sent_at", "last_message", "last_text", "done", "failed")
+
+    def __init__(self, chat_id, steps):
+        self.chat_id = chat_id
+        self.steps = steps
+        self.position = 0
+        self.sent_at = None
+        self.last_message = None  # последнее сообщение бота с фото или инлайн-кнопками
+        self.last_text = ""
+        self.done = False
+        self.failed = False
+
+
+class LoadTest:
+    """Симулятор пользователей для одного запуска бота"""
+
+    def __init__(self, flow, users, engine, mode, ramp, think_time, timeout, seed,
+                 latency, jitter, rate_limit, retry_after, bot_env):
+        self.flow = flow
+        self.engine = engine
+        self.mode = mode
+        self.ramp = ramp
+        self.think_time = think_time
+        self.timeout = timeout
+        self.bot_env = bot_env
+        self._random = random.Random(seed)
+        self.server = FakeTelegramServer(latency=latency, jitter=jitter, rate_limit_probability=rate_limit,
+                                         retry_after=retry_after, on_reply=self._on_reply,
+                                         on_ack=self._on_ack, seed=seed)
+        self.users = {chat_id: User(chat_id, self._script()) for chat_id in range(10001, 10001 + users)}
+
+        self._lock = threading.Lock()
+        self._schedule = []  # куча (когда, порядковый номер, chat_id)
+        self._seq = itertools.count()
+        self._wakeup = threading.Condition(self._lock)
+        self.latencies = []
+        # Нажатия кнопок, ещё не подтверждённые ботом: id -> время отправки
+        self._callbacks_sent = {}
+        self.ack_latencies = []
+        self.updates_sent = 0
+        self.completed_tests = 0
+        self.questions_answered = 0
+        self.timeouts = 0
+        self.webhook_retries = 0
+        self._webhook_pool = None
+        self._webhook_url = None
+
+    def _script(self):
+        """Шаги сценария: ("text", текст), ("callback", данные) или ("quiz", None) - ответы на
+        вопросы теста, пока бот не пришлёт результат"""
+        flow = self.flow
+        steps = [("text", "/start"), ("text", flow["start_test_button"]), ("quiz", None)]
+        steps += [("callback", flow["show_menu"])]
+        steps += [("callback", flow["menu_pages"][page]) for page in range(1, min(3, flow["pages"]))]
+        steps += [("callback", flow["main_menu"])]
+        return steps
+
+    # Обновления
+
+    def _make_update(self, user, kind, value):
+        update_id = self.server.next_update_id()
+        sender = {"id": user.chat_id, "is_bot": False, "first_name": f"User{user.chat_id}"}
+        chat = {"id": user.chat_id, "type": "private", "first_name": sender["first_name"]}
+        if kind == "callback":
+            return {
+                "update_id": update_id,
+                "callback_query": {
+                    "id": str(update_id),
+                    "from": sender,
+                    "chat_instance": str(user.chat_id),
+                    "data": value,
+                    "message": self._callback_message(user, chat),
+                },
+            }
+        message = {"message_id": self.server.next_message_id(user.chat_id), "date": int(time.time()),
+                   "chat": chat, "from": sender, "text": value}
+        if value.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(value.split()[0])}]
+        return {"update_id": update_id, "message": message}
+
+    def _callback_message(self, user, chat):
+        """Сообщение бота, на кнопку которого нажал пользователь"""
+        message = {"message_id": 1, "date": int(time.time()), "chat": chat,
+                   "from": {"id": 1000000, "is_bot": True, "first_name": "bot"}}
+        if user.last_message is not None:
+            for field in ("message_id", "photo", "caption", "text"):
+                if field in user.last_message:
+                    message[field] = user.last_message[field]
+        return message
+
+    def _deliver(self, update):
+        if self.mode == "webhook":
+            self._webhook_pool.submit(self._post_webhook, update)
+        else:
+            self.server.push_update(update)
+
+    def _post_webhook(self, update):
+        data = json.dumps(update, ensure_ascii=False).encode("utf-8")
+        while True:
+            request = urllib.request.Request(self._webhook_url, data=data, method="POST", headers={
+                "Content-Type": "application/json",
+                "X-Telegram-Bot-Api-Secret-Token": WEBHOOK_SECRET,
+            })
+            try:
+                with urllib.request.urlopen(request, timeout=10):
+                    return
+            except urllib.error.HTTPError as e:
+                if e.code != 503:
+                    return
+            except OSError:
+                pass
+            # Как и Telegram, повторяем доставку, если бот перегружен
+            with self._lock:
+                self.webhook_retries += 1
+            time.sleep(0.2)
+
+    # Шаги сценария
+
+    def _schedule_step(self, chat_id, at):
+        heapq.heappush(self._schedule, (at, next(self._seq), chat_id))
+        self._wakeup.notify()
+
+    def _question_options(self, text):
+        """Варианты ответа на вопрос теста из сообщения бота или None"""
+        for question_text, options in self.flow["questions"]:
+            if question_text in text:
+                return options
+        return None
+
+    def _answer_buttons(self, user):
+        """callback_data кнопок ответа инлайн-теста в последнем сообщении бота"""
+        markup = (user.last_message or {}).get("reply_markup") or {}
+        prefix = self.flow["answer_prefix"]
+        return [button["callback_data"] for row in markup.get("inline_keyboard", ())
+                for button in row if button.get("callback_data", "").startswith(prefix)]
+
+    def _send_step(self, user):
+        kind, value = user.steps[user.position]
+        if kind == "quiz":
+            buttons = self._answer_buttons(user)
+            if buttons:
+                kind, value = "callback", self._random.choice(buttons)
+            else:
+                kind, value = "text", self._random.choice(self._question_options(user.last_text))
+            with self._lock:
+                self.questions_answered += 1
+        update = self._make_update(user, kind, value)
+        with self._lock:
+            user.sent_at = time.monotonic()
+            self.updates_sent += 1
+            if kind == "callback":
+                self._callbacks_sent[update["callback_query"]["id"]] = user.sent_at
+        self._deliver(update)
+
+    def _on_ack(self, callback_query_id):
+        now = time.monotonic()
+        with self._lock:
+            sent_at = self._callbacks_sent.pop(callback_query_id, None)
+            if sent_at is not None:
+                self.ack_latencies.append(now - sent_at)
+
+    def _on_reply(self, chat_id, method, message):
+        user = self.users.get(chat_id)
+        if user is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if user.sent_at is None or user.done or user.failed:
+                return
+            self.latencies.append(now - user.sent_at)
+            user.sent_at = None
+            if "photo" in message or "reply_markup" in message:
+                user.last_message = message
+            user.last_text = message.get("text") or message.get("caption") or ""
+            # Пока бот задаёт вопросы, пользователь остаётся на шаге теста
+            question = self._question_options(user.last_text) is not None
+            if user.steps[user.position][0] == "quiz" and not question:
+                self.completed_tests += 1
+                user.position += 1
+            elif user.steps[user.position][0] != "quiz":
+                user.position += 1
+            if user.position >= len(user.steps):
+                user.done = True
+                self._wakeup.notify()
+            else:
+                self._schedule_step(chat_id, now + self.think_time)
+
+    def _loop(self, deadline):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                # Пользователи, которые не дождались ответа, выбывают
+                for user in self.users.values():
+                    if user.sent_at is not None and now - user.sent_at > self.timeout:
+                        user.failed = True
+                        user.sent_at = None
+                        self.timeouts += 1
+                if all(user.done or user.failed for user in self.users.values()) or now > deadline:
+                    return
+                due = []
+                while self._schedule and self._schedule[0][0] <= now:
+                    due.append(self.users[heapq.heappop(self._schedule)[2]])
+                if not due:
+                    wait = self._schedule[0][0] - now if self._schedule else 0.5
+                    self._wakeup.wait(min(wait, 0.5))
+                    continue
+            for user in due:
+                self._send_step(user)
+
+    # Запуск бота
+
+    def _start_bot(self, data_dir):
+        env = dict(os.environ, **self.bot_env)
+        env.update({
+            "TELEGRAM_BOT_TOKEN": TOKEN,
+            "TELEGRAM_API_URL": self.server.api_url,
+            "BOT_DATA_DIR": data_dir,
+            "BOT_ENGINE": self.engine,
+            "BOT_MODE": self.mode,
+            "PYTHONUNBUFFERED": "1",
+        })
+        if self.mode == "webhook":
+            port = free_port()
+            env.update({"WEBHOOK_HOST": "127.0.0.1", "WEBHOOK_PORT": str(port), "WEBHOOK_PATH": "/webhook",
+                        "WEBHOOK_SECRET": WEBHOOK_SECRET})
+            env.pop("WEBHOOK_URL", None)
+            self._webhook_url = f"http://127.0.0.1:{port}/webhook"
+        log = open(os.path.join(data_dir, "bot.log"), "w")
+        process = subprocess.Popen([sys.executable, "bot.py"], cwd=ROOT, env=env, stdout=log, stderr=log)
+        return process, log
+
+    def _wait_ready(self, process, timeout=60):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"bot.py завершился с кодом {process.returncode}")
+            if self.mode == "webhook":
+                try:
+                    with urllib.request.urlopen(self._webhook_url.replace("/webhook", "/healthz"), timeout=1):
+                        return
+                except OSError:
+                    pass
+            elif self.server.calls["getUpdates"]:
+                return
+            time.sleep(0.1)
+        raise RuntimeError("bot.py не начал принимать обновления")
+
+    def run(self, max_duration):
+        self.server.start()
+        data_dir = tempfile.mkdtemp(prefix="chaybar-loadtest-")
+        process, log = self._start_bot(data_dir)
+        if self.mode == "webhook":
+            self._webhook_pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix="webhook-client")
+        try:
+            self._wait_ready(process)
+            started = time.monotonic()
+            with self._lock:
+                for index, chat_id in enumerate(self.users):
+                    offset = self.ramp * index / max(1, len(self.users) - 1) if self.ramp else 0.0
+                    self._schedule_step(chat_id, started + offset)
+            self._loop(started + max_duration)
+            elapsed = time.monotonic() - started
+            # Ошибки при остановке бота (оборванные запросы и т.п.) прогон не портят
+            stopped_at = time.time()
+        finally:
+            process.send_signal(signal.SIGINT)
+            try:
+                process.wait(timeout=20)
+            except subprocess.TimeoutExpired:
+                process.kill()
+            log.close()
+            if self._webhook_pool is not None:
+                self._webhook_pool.shutdown(wait=False, cancel_futures=True)
+            self.server.stop()
+        return self.report(elapsed, data_dir, stopped_at)
+
+    def report(self, elapsed, data_dir, stopped_at):
+        calls = dict(self.server.calls)
+        api_calls = sum(count for method, count in calls.items() if method not in SERVICE_METHODS)
+        latencies_ms = [value * 1000 for value in self.latencies]
+        ack_latencies_ms = [value * 1000 for value in self.ack_latencies]
+        return {
+            "engine": self.engine,
+            "mode": self.mode,
+            "users": len(self.users),
+            "finished_users": sum(user.done for user in self.users.values()),
+            "timeouts": self.timeouts,
+            "elapsed_s": round(elapsed, 3),
+            "updates_sent": self.updates_sent,
+            "updates_per_s": round(self.updates_sent / elapsed, 1) if elapsed else None,
+            "latency_ms": {
+                name: round(percentile(latencies_ms, q), 2) if latencies_ms else None
+                for name, q in (("p50", 50), ("p90", 90), ("p95", 95), ("p99", 99), ("max", 100))
+            },
+            # От нажатия кнопки до answerCallbackQuery (когда пропадают часики на кнопке)
+            "ack_latency_ms": {
+                name: round(percentile(ack_latencies_ms, q), 2)
+                for name, q in (("p50", 50), ("p95", 95), ("max", 100))
+            } if ack_latencies_ms else None,
+            "completed_tests": self.completed_tests,
+            "api_calls_per_test": round(api_calls / self.completed_tests, 2) if self.completed_tests else None,
+            "questions_per_test": round(self.questions_answered / self.completed_tests, 2) if self.completed_tests else None,
+            "api_calls": calls,
+            "rate_limited": dict(self.server.rate_limited),
+            "connections": self.server.connections,
+            "webhook_retries": self.webhook_retries,
+            "logged_exceptions": logged_exceptions(os.path.join(data_dir, "bot.log"), stopped_at),
+            "bot_log": os.path.join(data_dir, "bot.log"),
+        }
+
+
+def _record_time(text):
+    return datetime.strptime(text, LOG_TIME_FORMAT).timestamp()
+
+
+def logged_exceptions(log_path, until):
+    """Записи ERROR с трассировкой исключения, сделанные до момента until (time.time())"""
+    errors = []
+    record = None
+    with open(log_path, encoding="utf-8", errors="replace") as f:
+        for line in f:
+            if line.startswith("{"):
+                # LOG_FORMAT=json: трассировка - поле exception той же строки
+                try:
+                    data = json.loads(line)
+                except ValueError:
+                    continue
+                if data.get("level") == "ERROR" and data.get("exception") and _record_time(data["time"]) < until:
+                    errors.append(data.get("message", ""))
+                continue
+            match = LOG_RECORD.match(line)
+            if match:
+                time_text, level = match.groups()
+                record = line.strip() if level == "ERROR" and _record_time(time_text) < until else None
+            elif record is not None and line.startswith("Traceback"):
+                errors.append(record)
+                record = None
+    return errors
+
+
+def failed(report):
+    return report["finished_users"] < report["users"] or bool(report["logged_exceptions"])
+
+
+def print_report(report):
+    latency = report["latency_ms"]
+    print(f"[{report['engine']}/{report['mode']}] пользователей {report['finished_users']}/{report['users']}, "
+          f"таймаутов {report['timeouts']}, {report['elapsed_s']} с")
+    print(f"  обновлений/с: {report['updates_per_s']}")
+    print(f"  задержка, мс: p50 {latency['p50']}  p90 {latency['p90']}  p95 {latency['p95']}  "
+          f"p99 {latency['p99']}  max {latency['max']}")
+    ack = report["ack_latency_ms"]
+    if ack:
+        print(f"  подтверждение нажатий, мс: p50 {ack['p50']}  p95 {ack['p95']}  max {ack['max']}")
+    print(f"  тестов пройдено: {report['completed_tests']}, вызовов API на тест: {report['api_calls_per_test']}, "
+          f"вопросов на тест: {report['questions_per_test']}")
+    print(f"  вызовы API: {report['api_calls']}")
+    print(f"  соединений с API: {report['connections']}")
+    if report["rate_limited"]:
+        print(f"  ответов 429: {report['rate_limited']}")
+    if report["logged_exceptions"]:
+        print(f"  исключений в логе бота: {len(report['logged_exceptions'])}, первое: {report['logged_exceptions'][0]}")
+    print(f"  лог бота: {report['bot_log']}")
+    if failed(report):
+        print("  ПРОВАЛ")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест бота с локальной заменой Bot API")
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--engine", default="sync", help="sync, async или оба через запятую")
+    parser.add_argument("--mode", default="polling", help="polling, webhook или оба через запятую")
+    parser.add_argument("--ramp", type=float, default=5.0, help="за сколько секунд подключаются все пользователи")
+    parser.add_argument("--think-time", type=float, default=0.0, help="пауза пользователя между шагами, с")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="задержка ответа Bot API")
+    parser.add_argument("--jitter-ms", type=float, default=10.0, help="случайная добавка к задержке")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="доля ответов 429 на отправку и правку")
+    parser.add_argument("--retry-after", type=int, default=1, help="retry_after в ответах 429")
+    parser.add_argument("--timeout", type=float, default=60.0, help="сколько ждать ответа бота на шаг, с")
+    parser.add_argument("--max-duration", type=float, default=600.0, help="предел длительности прогона, с")
+    parser.add_argument("--unthrottled", action="store_true",
+                        help="снять лимиты исходящих вызовов бота (OUTBOUND_*), чтобы мерить сам бот")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="дополнительные переменные окружения для bot.py")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="сохранить отчёты в JSON")
+    args = parser.parse_args()
+
+    bot_env = {"SESSION_BACKEND": "sqlite"}
+    if args.unthrottled:
+        bot_env.update({"OUTBOUND_GLOBAL_RATE": "1000000", "OUTBOUND_CHAT_RATE": "1000000",
+                        "OUTBOUND_CHAT_BURST": "1000000"})
+    for item in args.env:
+        key, _, value = item.partition("=")
+        bot_env[key] = value
+
+    flow = load_flow()
+    reports = []
+    for engine in args.engine.split(","):
+        for mode in args.mode.split(","):
+            test = LoadTest(flow, args.users, engine.strip(), mode.strip(), args.ramp, args.think_time,
+                            args.timeout, args.seed, args.latency_ms / 1000, args.jitter_ms / 1000,
+                            args.rate_limit, args.retry_after, bot_env)
+            report = test.run(args.max_duration)
+            print_report(report)
+            reports.append(report)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(reports, f, ensure_ascii=False, indent=2)
+
+    if any(failed(report) for report in reports):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""Неблокирующее логирование через очередь и структурированные события.
+
+Обработчики бота только кладут запись в очередь (QueueHandler), а форматирует и
+пишет её фоновый поток (QueueListener), поэтому медленный stdout или сборщик логов
+не задерживает ответы пользователям. В отличие от стандартного QueueHandler запись
+не форматируется при постановке в очередь: текст собирается уже в потоке записи.
+Если очередь переполнена, запись отбрасывается и учитывается, а не ждёт места.
+
+Частые действия пользователей пишутся событиями: event(logger, "test_started",
+"Пользователь {user_id} начал тест", user_id=user_id). Шаблон подставляется только
+при записи, а для выключенного уровня событие не создаётся вовсе. У каждого типа
+события может быть своя доля записи (LOG_SAMPLE="answer=0.1,menu_requested=0.5"):
+остальные события этого типа отбрасываются ещё в вызывающем потоке. С форматом
+json каждая запись - одна строка JSON с именем события и его полями.
+"""
+import atexit
+import json
+import logging
+import queue
+import random
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+
+class EventMessage:
+    """Сообщение события: шаблон str.format и поля, текст собирается при записи"""
+
+    __slots__ = ("name", "template", "fields")
+
+    def __init__(self, name, template, fields):
+        self.name = name
+        self.template = template
+        self.fields = fields
+
+    def __str__(self):
+        return self.template.format(**self.fields)
+
+
+def event(logger, name, template, level=logging.INFO, **fields):
+    """Пишет структурированное событие name; для выключенного уровня ничего не делает"""
+    if logger.isEnabledFor(level):
+        logger.log(level, EventMessage(name, template, fields), stacklevel=2)
+
+
+def parse_sample_rates(text):
+    """{"событие": доля} из строки вида "answer=0.1,menu_requested=0.5" """
+    rates = {}
+    for item in (text or "").split(","):
+        name, _, rate = item.partition("=")
+        if name.strip() and rate.strip():
+            rates[name.strip()] = min(max(float(rate), 0.0), 1.0)
+    return rates
+
+
+class EventSampler(logging.Filter):
+    """Пропускает заданную долю событий каждого типа; обычные записи - все"""
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+        self.dropped = 0
+
+    def filter(self, record):
+        message = record.msg
+        if not isinstance(message, EventMessage):
+            return True
+        rate = self.rates.get(message.name)
+        if rate is None or rate >= 1.0 or random.random() < rate:
+            return True
+        self.dropped += 1
+        return False
+
+
+class DeferredQueueHandler(QueueHandler):
+    """QueueHandler, который не форматирует запись и не ждёт места в очереди"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Аргументы и поля событий - неизменяемые значения, записи можно передать потоку записи как есть
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    """Запись одной строкой JSON: время, уровень, логгер, событие, поля и текст"""
+
+    def format(self, record):
+        data = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+        }
+        message = record.msg
+        if isinstance(message, EventMessage):
+            data["event"] = message.name
+            data.update(message.fields)
+        data["message"] = record.getMessage()
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class LogPipeline:
+    """Очередь, обработчик в вызывающих потоках и фоновый поток записи"""
+
+    def __init__(self, level=logging.INFO, fmt="text", sample_rates=None, queue_size=10000, stream=None):
+        self.queue = queue.Queue(maxsize=queue_size)
+        output = logging.StreamHandler(stream)
+        output.setFormatter(JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT))
+        self.handler = DeferredQueueHandler(self.queue)
+        self.sampler = EventSampler(sample_rates or {})
+        self.handler.addFilter(self.sampler)
+        self.listener = QueueListener(self.queue, output, respect_handler_level=True)
+        self.level = level
+        self._lock = threading.Lock()
+        self._started = False
+
+    def install(self, logger=None):
+        """Заменяет обработчики логгера (по умолчанию корневого) очередью и запускает поток записи"""
+        logger = logger or logging.getLogger()
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+        logger.addHandler(self.handler)
+        logger.setLevel(self.level)
+        with self._lock:
+            if not self._started:
+                self.listener.start()
+                self._started = True
+        # Записи, оставшиеся в очереди при выходе (в том числе через exit()), дописываются
+        atexit.register(self.stop)
+        return self
+
+    def stop(self):
+        """Дописывает очередь и останавливает поток записи"""
+        with self._lock:
+            if not self._started:
+                return
+            self._started = False
+        self.listener.stop()
+
+    def stats(self):
+        return {
+            "queued": self.queue.qsize(),
+            "dropped_full": self.handler.dropped,
+            "dropped_sampled": self.sampler.dropped,
+        }
+
+
+def setup_logging(level="INFO", fmt="text", sample_rates=None, queue_size=10000):
+    """Настраивает корневой логгер на запись через очередь и возвращает LogPipeline"""
+    return LogPipeline(logging.getLevelName(level.upper()) if isinstance(level, str) else level,
+                       fmt, sample_rates, queue_size).install()
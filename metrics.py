@@ -0,0 +1,307 @@
+"""Метрики бота в формате Prometheus.
+
+Счётчики, гистограммы и датчики хранятся в памяти процесса и отдаются текстом
+по HTTP (GET /metrics). Обработчики telebot и функция, через которую идут все
+запросы к Bot API, оборачиваются замером времени: это один вызов perf_counter
+до и после и короткая блокировка на запись, поэтому метрики можно не выключать.
+"""
+import asyncio
+import functools
+import logging
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм времени (секунды)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Списки обработчиков telebot, которые оборачиваются замером времени
+HANDLER_LISTS = (
+    "message_handlers", "edited_message_handlers", "callback_query_handlers",
+    "inline_handlers", "chosen_inline_handlers",
+)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def error_label(error):
+    """Тип ошибки для меток: у ошибок Bot API добавляется код ответа"""
+    code = getattr(error, "error_code", None)
+    return f"{type(error).__name__}:{code}" if code is not None else type(error).__name__
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        with self._lock:
+            return self._values.get(labels, 0)
+
+    def render(self):
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+
+class Gauge:
+    """Датчик: значение задаётся через set() или считается функцией в момент запроса"""
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, function=None):
+        self.name = name
+        self.documentation = documentation
+        self.function = function
+        self._value = 0
+
+    def set(self, value):
+        self._value = value
+
+    def render(self):
+        value = self._value
+        if self.function is not None:
+            try:
+                value = self.function()
+            except Exception as e:
+                logger.warning(f"Не удалось получить значение {self.name}: {e}")
+                return
+        yield f"{self.name} {_format_value(value)}"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._values = {}  # метки -> [счётчики по корзинам (+Inf последней), сумма, количество]
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        with self._lock:
+            values = [(labels, list(state[0]), state[1], state[2]) for labels, state in self._values.items()]
+        for labels, counts, total, count in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}"
+
+
+class MetricsRegistry:
+    """Набор метрик, который отдаётся одним текстом"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, function=None):
+        return self.register(Gauge(name, documentation, function))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def timed(function, histogram, errors, label_of):
+    """Оборачивает function замером времени и подсчётом ошибок; label_of(args) даёт метку"""
+    if asyncio.iscoroutinefunction(function):
+        @functools.wraps(function)
+        async def async_wrapper(*args, **kwargs):
+            label = label_of(args)
+            start = time.perf_counter()
+            try:
+                return await function(*args, **kwargs)
+            except Exception as e:
+                errors.inc(label, error_label(e))
+                raise
+            finally:
+                histogram.observe(time.perf_counter() - start, label)
+        return async_wrapper
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        label = label_of(args)
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        except Exception as e:
+            errors.inc(label, error_label(e))
+            raise
+        finally:
+            histogram.observe(time.perf_counter() - start, label)
+    return wrapper
+
+
+class BotMetrics:
+    """Метрики бота: обработчики, вызовы Bot API, откаты на текст, пройденные тесты"""
+
+    def __init__(self, registry=None):
+        self.registry = registry or MetricsRegistry()
+        self.handler_seconds = self.registry.histogram(
+            "chaybar_handler_seconds", "Время работы обработчика обновления", ["handler"])
+        self.handler_errors = self.registry.counter(
+            "chaybar_handler_errors_total", "Исключения в обработчиках по типу", ["handler", "error"])
+        self.api_seconds = self.registry.histogram(
+            "chaybar_api_request_seconds", "Время запроса к Bot API", ["method"])
+        self.api_errors = self.registry.counter(
+            "chaybar_api_errors_total", "Ошибки запросов к Bot API по типу", ["method", "error"])
+        self.photo_fallbacks = self.registry.counter(
+            "chaybar_photo_fallbacks_total", "Отправки фото, которые пошли не по основному пути", ["reason"])
+        self.delivery_attempts = self.registry.counter(
+            "chaybar_delivery_attempts_total", "Попытки вызовов API при доставке сообщений по исходу",
+            ["method", "outcome"])
+        self.tests_completed = self.registry.counter(
+            "chaybar_tests_completed_total", "Пройденные тесты (показанные результаты)")
+        self.broadcast_messages = self.registry.counter(
+            "chaybar_broadcast_messages_total", "Сообщения рассылки по исходу", ["outcome"])
+
+    def gauge(self, name, documentation, function):
+        return self.registry.gauge(name, documentation, function)
+
+    def fallback(self, reason):
+        self.photo_fallbacks.inc(reason)
+
+    def attempt(self, method, outcome):
+        """Одна попытка вызова API при доставке: outcome - "ok" или класс ошибки (api_errors)"""
+        self.delivery_attempts.inc(method, outcome)
+
+    def instrument_handlers(self, bot):
+        """Оборачивает все зарегистрированные обработчики бота (вызывать после регистрации)"""
+        count = 0
+        for attribute in HANDLER_LISTS:
+            for handler in getattr(bot, attribute, ()):
+                function = handler["function"]
+                if getattr(function, "_instrumented", False):
+                    continue
+                name = function.__name__
+                handler["function"] = timed(function, self.handler_seconds, self.handler_errors,
+                                            lambda args, name=name: name)
+                handler["function"]._instrumented = True
+                count += 1
+        return count
+
+    def instrument_router(self, router):
+        """Оборачивает обработчики маршрутизатора (router.MessageRouter, callbacks.CallbackRouter)"""
+        def wrap(function):
+            if getattr(function, "_instrumented", False):
+                return function
+            name = function.__name__
+            wrapper = timed(function, self.handler_seconds, self.handler_errors, lambda args, name=name: name)
+            wrapper._instrumented = True
+            return wrapper
+        router.replace_handlers(wrap)
+
+    def instrument_api(self, module, attribute):
+        """Оборачивает функцию запроса к Bot API (apihelper._make_request или
+        asyncio_helper._process_request): метка - имя метода API, второй аргумент"""
+        function = getattr(module, attribute)
+        if not getattr(function, "_instrumented", False):
+            wrapper = timed(function, self.api_seconds, self.api_errors, lambda args: args[1])
+            wrapper._instrumented = True
+            setattr(module, attribute, wrapper)
+
+
+class MetricsServer:
+    """HTTP-сервер, отдающий метрики на GET /metrics"""
+
+    def __init__(self, registry, host="127.0.0.1", port=9100):
+        self.registry = registry
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def address(self):
+        return self._httpd.server_address
+
+    def _make_handler(self):
+        registry = self.registry
+
+        class MetricsRequestHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] != "/metrics":
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return MetricsRequestHandler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="metrics-server", daemon=True)
+        self._thread.start()
+        host, port = self.address[:2]
+        logger.info(f"📊 Метрики: http://{host}:{port}/metrics")
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
@@ -0,0 +1,366 @@
+"""Очередь исходящих вызовов Telegram API с ограничением частоты.
+
+Telegram ограничивает ботов примерно 30 сообщениями в секунду суммарно и около
+одного сообщения в секунду в один чат (с небольшими всплесками). Диспетчер
+пропускает вызовы через два ведра токенов (общее и на чат), сохраняет порядок
+вызовов внутри чата, сам выдерживает паузу retry_after при ответе 429 и
+схлопывает устаревшие операции: если в очереди несколько правок одного и того
+же сообщения, отправляется только последняя. Вызовы, порядок которых не важен
+(подтверждение нажатия кнопки, удаление старого сообщения), можно отправить
+вне очереди чата - параллельно с остальными.
+
+В асинхронном режиме очереди нет: AsyncRateLimiter подменяет методы AsyncTeleBot
+так, что каждый вызов сначала ждёт токены тех же вёдер в цикле событий.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from api_errors import OK, classify, retry_after
+
+logger = logging.getLogger(__name__)
+
+# Методы, которые проходят через очередь (порядок внутри чата сохраняется)
+QUEUED_METHODS = (
+    "send_message", "send_photo", "edit_message_media", "edit_message_text",
+    "edit_message_caption", "edit_message_reply_markup", "delete_message",
+)
+
+# Методы, которые расходуют лимит сообщений
+RATE_LIMITED_METHODS = frozenset([
+    "send_message", "send_photo", "edit_message_media", "edit_message_text",
+    "edit_message_caption", "edit_message_reply_markup",
+])
+
+# Методы, у которых chat_id - первый позиционный аргумент
+_CHAT_ID_FIRST = frozenset(["send_message", "send_photo", "delete_message"])
+
+# Сколько вёдер чатов держать, прежде чем забыть полные
+_MAX_CHAT_BUCKETS = 10000
+
+
+def call_chat_id(name, args, kwargs):
+    """chat_id вызова метода бота или None"""
+    chat_id = kwargs.get("chat_id")
+    if chat_id is None and args and name in _CHAT_ID_FIRST:
+        chat_id = args[0]
+    return chat_id
+
+
+class TokenBucket:
+    """Ведро токенов: rate токенов в секунду, не больше capacity про запас"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now):
+        if now > self.updated_at:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+
+    def delay(self, now=None):
+        """Сколько секунд ждать до появления токена"""
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now=None):
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        self.tokens -= 1
+
+    def is_full(self, now=None):
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+    def acquire(self):
+        """Блокирует поток до появления токена и забирает его"""
+        while True:
+            wait = self.delay()
+            if wait <= 0:
+                self.take()
+                return
+            time.sleep(wait)
+
+
+class ChatBuckets:
+    """Вёдра токенов по чатам; вёдра давно молчащих чатов забываются"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._buckets = {}
+
+    def get(self, chat_id):
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            if len(self._buckets) > _MAX_CHAT_BUCKETS:
+                # Забываем вёдра давно молчащих чатов - они всё равно полные
+                now = time.monotonic()
+                self._buckets = {cid: b for cid, b in self._buckets.items() if not b.is_full(now)}
+            bucket = TokenBucket(self.rate, self.capacity)
+            self._buckets[chat_id] = bucket
+        return bucket
+
+
+class _Operation:
+    __slots__ = ("method", "name", "args", "kwargs", "chat_id", "lane", "coalesce_key", "future", "attempts")
+
+    def __init__(self, method, name, args, kwargs, chat_id, lane, coalesce_key):
+        self.method = method
+        self.name = name
+        self.args = args
+        self.kwargs = kwargs
+        self.chat_id = chat_id
+        # Очередь, в которой ждёт операция: chat_id или своя для вызова вне очереди чата
+        self.lane = lane
+        self.coalesce_key = coalesce_key
+        self.future = Future()
+        self.attempts = 0
+
+
+class OutboundDispatcher:
+    """Отправляет вызовы API с учётом лимитов Telegram, по очереди внутри каждого чата"""
+
+    def __init__(self, bot, global_rate=30, chat_rate=1, chat_burst=3, workers=8, max_retries=5, on_attempt=None):
+        self.bot = bot
+        # on_attempt(метод, исход) - на каждый вызов API, в том числе на повторы после 429
+        self.on_attempt = on_attempt
+        self.global_bucket = TokenBucket(global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="outbound")
+        self._originals = {}
+
+        self._cond = threading.Condition()
+        self._chats = {}  # очередь (chat_id) -> deque операций в порядке отправки
+        self._chat_buckets = ChatBuckets(chat_rate, chat_burst)
+        self._coalesce = {}  # ключ схлопывания -> операция, ещё не отправленная
+        self._in_flight = set()  # очереди, у которых операция уже выполняется
+        self._ready = []  # куча (когда можно отправлять, порядковый номер, очередь)
+        self._seq = itertools.count()
+        self._thread = None
+        self._stopped = False
+        self._counters = {"submitted": 0, "sent": 0, "coalesced": 0, "retried": 0, "failed": 0, "throttled": 0}
+
+    def install(self, bot=None, methods=QUEUED_METHODS):
+        """Подменяет методы бота: вызовы идут через очередь и ждут своего результата"""
+        bot = bot or self.bot
+        for name in methods:
+            original = getattr(bot, name)
+            self._originals[name] = original
+            setattr(bot, name, self._make_wrapper(name))
+        self.start()
+
+    def _make_wrapper(self, name):
+        def call(*args, **kwargs):
+            return self.submit(name, *args, **kwargs).result()
+        call.__name__ = name
+        return call
+
+    def start(self):
+        with self._cond:
+            if self._thread is None:
+                self._stopped = False
+                self._thread = threading.Thread(target=self._dispatch_loop, name="outbound-dispatcher", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout=None):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self._executor.shutdown(wait=True)
+
+    def submit(self, name, *args, coalesce_key=None, ordered=True, **kwargs):
+        """Ставит вызов метода бота в очередь чата и возвращает Future с результатом.
+
+        Если передан coalesce_key и в очереди уже есть неотправленная операция с тем же
+        ключом, она заменяется новой, а её Future получает результат None. С ordered=False
+        вызов не ждёт остальных операций чата (лимиты частоты при этом соблюдаются).
+        """
+        self.start()
+        method = self._originals.get(name) or getattr(self.bot, name)
+        chat_id = call_chat_id(name, args, kwargs)
+        superseded = None
+        with self._cond:
+            self._counters["submitted"] += 1
+            if coalesce_key is not None:
+                pending = self._coalesce.get(coalesce_key)
+                if pending is not None:
+                    # Подменяем аргументы прямо в очереди - операция сохраняет своё место
+                    superseded = pending.future
+                    pending.method, pending.args, pending.kwargs = method, args, kwargs
+                    pending.future = Future()
+                    self._counters["coalesced"] += 1
+                    future = pending.future
+            if superseded is None:
+                lane = chat_id if ordered else (chat_id, next(self._seq))
+                operation = _Operation(method, name, args, kwargs, chat_id, lane, coalesce_key)
+                future = operation.future
+                queue = self._chats.setdefault(lane, deque())
+                queue.append(operation)
+                if coalesce_key is not None:
+                    self._coalesce[coalesce_key] = operation
+                if len(queue) == 1 and lane not in self._in_flight:
+                    self._schedule(lane, time.monotonic())
+        if superseded is not None:
+            superseded.set_result(None)
+        return future
+
+    def _schedule(self, lane, ready_at):
+        heapq.heappush(self._ready, (ready_at, next(self._seq), lane))
+        self._cond.notify()
+
+    def _dispatch_loop(self):
+        while True:
+            with self._cond:
+                while not self._ready and not self._stopped:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                ready_at, _, lane = self._ready[0]
+                now = time.monotonic()
+                if ready_at > now:
+                    self._cond.wait(ready_at - now)
+                    continue
+
+                operation = self._chats[lane][0]
+                if operation.name in RATE_LIMITED_METHODS:
+                    chat_bucket = self._chat_buckets.get(operation.chat_id)
+                    delay = max(self.global_bucket.delay(now), chat_bucket.delay(now))
+                    if delay > 0:
+                        self._counters["throttled"] += 1
+                        heapq.heapreplace(self._ready, (now + delay, next(self._seq), lane))
+                        continue
+                    self.global_bucket.take(now)
+                    chat_bucket.take(now)
+
+                heapq.heappop(self._ready)
+                self._chats[lane].popleft()
+                if operation.coalesce_key is not None and self._coalesce.get(operation.coalesce_key) is operation:
+                    del self._coalesce[operation.coalesce_key]
+                self._in_flight.add(lane)
+            self._executor.submit(self._execute, operation)
+
+    def _execute(self, operation):
+        chat_id = operation.chat_id
+        lane = operation.lane
+        delay = 0.0
+        outcome = None
+        try:
+            result = operation.method(*operation.args, **operation.kwargs)
+            outcome = (True, result)
+            self._record(operation.name, OK)
+        except Exception as e:
+            self._record(operation.name, classify(e))
+            pause = retry_after(e)
+            if pause is not None and operation.attempts < self.max_retries:
+                operation.attempts += 1
+                delay = pause
+                logger.warning(f"Telegram просит подождать {pause} с ({operation.name}, чат {chat_id})")
+            else:
+                outcome = (False, e)
+
+        with self._cond:
+            self._in_flight.discard(lane)
+            if outcome is None and operation.coalesce_key in self._coalesce:
+                # Пока ждали, в очередь встала более свежая операция с тем же ключом
+                self._counters["coalesced"] += 1
+                outcome = (True, None)
+            elif outcome is None:
+                # Повторяем ту же операцию первой в очереди чата после паузы
+                self._counters["retried"] += 1
+                self._chats[lane].appendleft(operation)
+                if operation.coalesce_key is not None:
+                    self._coalesce[operation.coalesce_key] = operation
+            else:
+                self._counters["sent" if outcome[0] else "failed"] += 1
+            if self._chats[lane]:
+                self._schedule(lane, time.monotonic() + delay)
+            else:
+                del self._chats[lane]
+
+        if outcome is not None:
+            ok, value = outcome
+            if ok:
+                operation.future.set_result(value)
+            else:
+                operation.future.set_exception(value)
+
+    def _record(self, name, outcome):
+        if self.on_attempt is not None:
+            self.on_attempt(name, outcome)
+
+    def stats(self):
+        with self._cond:
+            return dict(self._counters, queued=sum(len(q) for q in self._chats.values()),
+                        in_flight=len(self._in_flight))
+
+
+class AsyncRateLimiter:
+    """Лимиты Telegram для AsyncTeleBot: общее ведро и ведро на чат, ожидание в цикле событий.
+
+    Порядок внутри чата обеспечивает сам асинхронный режим (обновления одного чата
+    обрабатываются по очереди), поэтому здесь только паузы до появления токенов.
+    Всё выполняется в одном цикле событий, блокировки не нужны.
+    """
+
+    def __init__(self, global_rate=30, chat_rate=1, chat_burst=3):
+        self.global_bucket = TokenBucket(global_rate)
+        self._chat_buckets = ChatBuckets(chat_rate, chat_burst)
+        self._counters = {"sent": 0, "throttled": 0, "coalesced": 0}
+
+    def install(self, bot, methods=RATE_LIMITED_METHODS):
+        """Подменяет методы бота: вызов сначала ждёт токены"""
+        for name in methods:
+            setattr(bot, name, self._make_wrapper(name, getattr(bot, name)))
+
+    def _make_wrapper(self, name, original):
+        async def call(*args, **kwargs):
+            await self.acquire(call_chat_id(name, args, kwargs))
+            return await original(*args, **kwargs)
+        call.__name__ = name
+        return call
+
+    def _delay(self, chat_id, now):
+        return max(self.global_bucket.delay(now), self._chat_buckets.get(chat_id).delay(now))
+
+    async def wait(self, chat_id):
+        """Ждёт, пока у чата и у бота появится токен, не забирая его"""
+        while True:
+            delay = self._delay(chat_id, time.monotonic())
+            if delay <= 0:
+                return
+            self._counters["throttled"] += 1
+            await asyncio.sleep(delay)
+
+    async def acquire(self, chat_id):
+        """Ждёт токен и забирает его"""
+        await self.wait(chat_id)
+        # После последней проверки в wait цикл событий не переключался - токены на месте
+        now = time.monotonic()
+        self.global_bucket.take(now)
+        self._chat_buckets.get(chat_id).take(now)
+        self._counters["sent"] += 1
+
+    def coalesced(self):
+        """Учитывает операцию, которую заменила более свежая"""
+        self._counters["coalesced"] += 1
+
+    def stats(self):
+        return dict(self._counters)
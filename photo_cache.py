@@ -0,0 +1,112 @@
+"""Кэш file_id для фотографий чая.
+
+После первой загрузки Telegram возвращает file_id, по которому фото можно
+отправлять повторно без передачи байтов. Кэш хранится на диске и привязан
+к хэшу содержимого файла: после перезапуска бота file_id переиспользуются,
+а изменённая картинка автоматически загружается заново.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Фрагменты описаний ошибок, с которыми Telegram отклоняет file_id
+REJECTED_FILE_ID_ERRORS = (
+    "wrong file identifier",
+    "wrong remote file identifier",
+    "file_id",
+    "file reference",
+)
+
+
+class PhotoFileIdCache:
+    """Соответствие sha256 содержимого файла -> file_id в Telegram"""
+
+    def __init__(self, cache_path):
+        self.cache_path = cache_path
+        self._lock = threading.Lock()
+        self._file_ids = {}
+        # path -> (mtime_ns, size, digest), чтобы не хэшировать файл на каждый запрос
+        self._digests = {}
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if isinstance(data, dict):
+                self._file_ids = {str(k): str(v) for k, v in data.items()}
+            logger.info(f"Загружено {len(self._file_ids)} file_id из {self.cache_path}")
+        except (OSError, ValueError) as e:
+            logger.warning(f"Не удалось прочитать кэш file_id {self.cache_path}: {e}")
+
+    def _save(self):
+        # Пишем во временный файл и атомарно подменяем, чтобы не оставить битый JSON
+        tmp_path = f"{self.cache_path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._file_ids, f, ensure_ascii=False, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить кэш file_id {self.cache_path}: {e}")
+
+    def digest(self, path):
+        """Возвращает sha256 содержимого файла (пересчитывается только при изменении файла)"""
+        stat = os.stat(path)
+        key = (stat.st_mtime_ns, stat.st_size)
+        cached = self._digests.get(path)
+        if cached and cached[:2] == key:
+            return cached[2]
+
+        sha = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(65536), b''):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+        self._digests[path] = (*key, digest)
+        return digest
+
+    def get(self, path):
+        """Возвращает file_id для файла или None, если он ещё не загружался"""
+        try:
+            digest = self.digest(path)
+        except OSError:
+            return None
+        return self._file_ids.get(digest)
+
+    def put(self, path, file_id):
+        try:
+            digest = self.digest(path)
+        except OSError:
+            return
+        with self._lock:
+            if self._file_ids.get(digest) == file_id:
+                return
+            self._file_ids[digest] = file_id
+            self._save()
+
+    def forget(self, path):
+        """Удаляет file_id файла (например, если Telegram его отклонил)"""
+        try:
+            digest = self.digest(path)
+        except OSError:
+            return
+        with self._lock:
+            if self._file_ids.pop(digest, None) is not None:
+                self._save()
+
+    def __len__(self):
+        return len(self._file_ids)
+
+
+def file_id_from_message(message):
+    """Достаёт file_id самого большого размера фото из отправленного сообщения"""
+    photos = getattr(message, 'photo', None)
+    if not photos:
+        return None
+    return photos[-1].file_id
@@ -0,0 +1,51 @@
+"""Процесс пережатия фото для image_optimizer.
+
+Запускается отдельным интерпретатором (python photo_worker.py), поэтому не
+импортирует ничего из бота: ни настройки, ни хранилища, ни каталог. Задания
+приходят строками JSON в stdin, на каждое в stdout пишется строка JSON с размером
+варианта или текстом ошибки.
+
+    {"source": "tea_photos/a.jpg", "target": "data/photo_variants/1f.jpg", "max_side": 1280, "quality": 85}
+"""
+import json
+import os
+import sys
+
+from PIL import Image, ImageOps
+
+
+def convert_photo(source, target, max_side, quality):
+    """Пережимает одно фото в JPEG и возвращает размер варианта"""
+    with Image.open(source) as image:
+        # Учитываем поворот из EXIF, сами метаданные в вариант не попадают
+        image = ImageOps.exif_transpose(image)
+        if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+
+        tmp_path = f"{target}.tmp"
+        image.save(tmp_path, "JPEG", quality=quality, optimize=True, progressive=True)
+    os.replace(tmp_path, target)
+    return os.path.getsize(target)
+
+
+def main():
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        job = json.loads(line)
+        try:
+            result = {"source": job["source"],
+                      "bytes": convert_photo(job["source"], job["target"], job["max_side"], job["quality"])}
+        except Exception as e:
+            result = {"source": job["source"], "error": f"{type(e).__name__}: {e}"}
+        print(json.dumps(result, ensure_ascii=False), flush=True)
+
+
+if __name__ == "__main__":
+    main()
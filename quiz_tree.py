@@ -0,0 +1,145 @@
+"""Адаптивный тест: дерево решений по таблице результатов.
+
+Таблица результатов знает победителя для каждой комбинации ответов, поэтому
+заранее видно, когда оставшиеся вопросы уже ничего не меняют: если при любых
+ответах на них побеждает один и тот же чай, тест можно заканчивать. Дерево
+строится один раз на версию каталога. В каждом узле задаётся вопрос, после
+которого меньше всего неопределённости в победителе (минимум средней энтропии
+по вариантам ответа), а лист хранит победителя и его баллы по заданным вопросам.
+
+Узел дерева однозначно задаётся упакованными ответами сессии (Session.answers):
+по ним видно и какие вопросы уже заданы, и что на них ответили.
+"""
+import logging
+
+import numpy as np
+
+from recommender import EXACT_MATCH_SCORE
+from session_store import ANSWER_BITS, ANSWER_MASK
+
+logger = logging.getLogger(__name__)
+
+
+def pack_answer(answers, question, option):
+    """Упакованные ответы с добавленным ответом на вопрос (как Session.set_answer)"""
+    return answers | ((option + 1) << (question * ANSWER_BITS))
+
+
+def asked_questions(answers, question_count):
+    """Номера вопросов, на которые уже есть ответ"""
+    return [q for q in range(question_count) if (answers >> (q * ANSWER_BITS)) & ANSWER_MASK]
+
+
+def _entropy(codes, size):
+    counts = np.bincount(codes.ravel(), minlength=size)
+    counts = counts[counts > 0]
+    if len(counts) <= 1:
+        return 0.0
+    p = counts / counts.sum()
+    return float(-(p * np.log2(p)).sum())
+
+
+class QuizTree:
+    """Следующий вопрос и готовый результат для каждого пути по дереву"""
+
+    def __init__(self, results, next_questions, leaves):
+        self.results = results
+        self.names = results.names
+        self.teas = results.teas
+        self.shape = shape = results.shape
+        self.question_count = len(shape)
+        self._next = next_questions  # ответы -> номер следующего вопроса
+        self._leaves = leaves  # ответы -> (номер чая или -1, баллы)
+
+    @classmethod
+    def build(cls, recommender, results, questions):
+        """Строит дерево по таблице результатов и матрице баллов для тех же меню и вопросов"""
+        shape = results.shape
+        # Победители перекодируются в плотные номера, чтобы считать их частоты bincount
+        winners, codes = np.unique(np.asarray(results.winners), return_inverse=True)
+        codes = codes.reshape(shape)
+        size = len(winners)
+        option_rows = [
+            [recommender.row_offsets[i] + recommender.vocab[i][value] for value in question["options"].values()]
+            for i, question in enumerate(questions)
+        ]
+        next_questions = {}
+        leaves = {}
+
+        # Обход в глубину: (упакованные ответы, индекс подмассива, незаданные вопросы, строки матрицы баллов)
+        stack = [(0, (slice(None),) * len(shape), tuple(range(len(shape))), ())]
+        while stack:
+            answers, index, remaining, rows = stack.pop()
+            node = codes[index]
+            first = node.flat[0]
+            if not remaining or (node == first).all():
+                winner = int(winners[first])
+                score = int(recommender.score_matrix[list(rows), winner].sum()) if winner >= 0 and rows else 0
+                leaves[answers] = (winner, score)
+                continue
+
+            # Вопрос с наименьшей средней энтропией победителя; при равенстве - раньше по порядку
+            best_question, best_entropy = None, None
+            for question in remaining:
+                entropy = 0.0
+                for option in range(shape[question]):
+                    sub = index[:question] + (option,) + index[question + 1:]
+                    entropy += _entropy(codes[sub], size)
+                entropy /= shape[question]
+                if best_entropy is None or entropy < best_entropy - 1e-12:
+                    best_question, best_entropy = question, entropy
+
+            next_questions[answers] = best_question
+            rest = tuple(q for q in remaining if q != best_question)
+            for option in range(shape[best_question]):
+                stack.append((
+                    pack_answer(answers, best_question, option),
+                    index[:best_question] + (option,) + index[best_question + 1:],
+                    rest,
+                    rows + (option_rows[best_question][option],),
+                ))
+
+        tree = cls(results, next_questions, leaves)
+        logger.info(f"Дерево адаптивного теста: {len(next_questions)} узлов, {len(leaves)} листьев, "
+                    f"в среднем {tree.average_depth():.2f} вопроса из {len(shape)}")
+        return tree
+
+    def next_question(self, answers):
+        """Номер следующего вопроса или None, если результат уже известен.
+
+        Ответы не с этого дерева (например, тест начат до смены каталога) проходят
+        оставшиеся вопросы по порядку.
+        """
+        question = self._next.get(answers)
+        if question is not None or answers in self._leaves:
+            return question
+        asked = asked_questions(answers, self.question_count)
+        return next((q for q in range(self.question_count) if q not in asked), None)
+
+    def result(self, answers):
+        """(название, данные, баллы) победителя или None, как ResultTable.lookup.
+
+        Баллы - по заданным вопросам. Полный набор ответов не с этого дерева берётся из
+        таблицы результатов; для неполного, который не ведёт в лист, - KeyError.
+        """
+        leaf = self._leaves.get(answers)
+        if leaf is None:
+            options = [((answers >> (q * ANSWER_BITS)) & ANSWER_MASK) - 1 for q in range(self.question_count)]
+            return self.results.lookup_options([None if option < 0 else option for option in options])
+        winner, score = leaf
+        if winner < 0:
+            return None
+        return self.names[winner], self.teas[winner], score
+
+    def max_score(self, answers):
+        """Наибольшие возможные баллы по заданным вопросам"""
+        return len(asked_questions(answers, self.question_count)) * EXACT_MATCH_SCORE
+
+    def average_depth(self):
+        """Среднее число вопросов при равновероятных ответах"""
+        total = 0.0
+        for answers in self._leaves:
+            asked = asked_questions(answers, self.question_count)
+            # Вероятность листа - произведение 1/число вариантов по заданным вопросам
+            total += len(asked) / float(np.prod([self.shape[q] for q in asked]))
+        return total
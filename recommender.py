@@ -0,0 +1,109 @@
+"""Векторизованный подбор чая по ответам теста.
+
+Характеристики всех чаев один раз кодируются в целочисленную матрицу, а правила
+частичного совпадения (семейство настоящих чаев, уровни кофеина) заранее
+раскладываются в таблицы баллов. Оценка всех чаев сводится к выборке строк
+из матрицы баллов и одному суммированию в NumPy.
+"""
+import numpy as np
+
+# Баллы за полное совпадение ответа с характеристикой чая
+EXACT_MATCH_SCORE = 3
+
+# Частичные совпадения: индекс вопроса -> список (группа значений, баллы).
+# Баллы начисляются, если ответ и характеристика разные, но из одной группы.
+PARTIAL_MATCHES = {
+    0: [(frozenset(["green", "black", "oolong", "white"]), 1)],  # Оба настоящие чаи
+    2: [(frozenset(["medium", "low"]), 1)],  # Умеренный кофеин
+}
+
+
+def pair_score(question_index, user_val, tea_val):
+    """Баллы за один вопрос теста (те же правила, что и в find_best_tea)"""
+    if user_val == tea_val:
+        return EXACT_MATCH_SCORE
+    for group, score in PARTIAL_MATCHES.get(question_index, ()):
+        if user_val in group and tea_val in group:
+            return score
+    return 0
+
+
+class TeaRecommender:
+    """Оценивает сразу все чаи меню и возвращает лучшие по убыванию баллов"""
+
+    def __init__(self, menu, questions):
+        self.names = list(menu.keys())
+        self.teas = [menu[name] for name in self.names]
+        self.question_count = len(questions)
+
+        # Словарь значений для каждого вопроса: варианты ответов, значения чаев
+        # и значения из групп частичного совпадения
+        tea_values = [list(tea["characteristics"].values()) for tea in self.teas]
+        self.vocab = []
+        for i, question in enumerate(questions):
+            values = list(question["options"].values())
+            values += [chars[i] for chars in tea_values if i < len(chars)]
+            for group, _ in PARTIAL_MATCHES.get(i, ()):
+                values += sorted(group)
+            self.vocab.append({value: code for code, value in enumerate(dict.fromkeys(values))})
+
+        # Матрица баллов: строка на каждое (вопрос, значение ответа), столбец на чай.
+        # Последняя строка нулевая - для пропущенных и неизвестных ответов.
+        self.row_offsets = []
+        rows = []
+        for i, vocab in enumerate(self.vocab):
+            self.row_offsets.append(len(rows))
+            tea_column = [chars[i] if i < len(chars) else None for chars in tea_values]
+            for user_val in vocab:
+                rows.append([pair_score(i, user_val, tea_val) for tea_val in tea_column])
+        self.empty_row = len(rows)
+        rows.append([0] * len(self.teas))
+        self.score_matrix = np.array(rows, dtype=np.int16).reshape(len(rows), len(self.teas))
+
+    def encode(self, user_prefs):
+        """Переводит ответы вида {"q0": "green", ...} в номера строк матрицы баллов"""
+        rows = np.full(self.question_count, self.empty_row, dtype=np.intp)
+        for i, vocab in enumerate(self.vocab):
+            code = vocab.get(user_prefs.get(f"q{i}"))
+            if code is not None:
+                rows[i] = self.row_offsets[i] + code
+        return rows
+
+    def scores(self, user_prefs):
+        """Баллы всех чаев для одного набора ответов"""
+        return self.score_matrix[self.encode(user_prefs)].sum(axis=0, dtype=np.int32)
+
+    def scores_for_rows(self, rows):
+        """Баллы всех чаев для пачки закодированных ответов формы (n, вопросы)"""
+        return self.score_matrix[rows].sum(axis=1, dtype=np.int32)
+
+    @staticmethod
+    def rank(scores, k):
+        """Индексы k лучших чаев; при равных баллах выше тот, что раньше в меню"""
+        k = min(k, len(scores))
+        if k <= 0:
+            return np.empty(0, dtype=np.intp)
+        if k < len(scores):
+            # Отсекаем кандидатов по k-му значению, чтобы не сортировать весь каталог
+            threshold = np.partition(scores, len(scores) - k)[len(scores) - k]
+            candidates = np.flatnonzero(scores >= threshold)
+        else:
+            candidates = np.arange(len(scores))
+        order = np.argsort(-scores[candidates], kind="stable")
+        return candidates[order[:k]]
+
+    def top_k(self, user_prefs, k=3, min_score=1):
+        """Список до k лучших чаев в виде (название, данные, баллы)"""
+        scores = self.scores(user_prefs)
+        result = []
+        for index in self.rank(scores, k):
+            score = int(scores[index])
+            if score < min_score:
+                break
+            result.append((self.names[index], self.teas[index], score))
+        return result
+
+    def best(self, user_prefs):
+        """Лучший чай или None, если ни один не набрал баллов (как find_best_tea)"""
+        top = self.top_k(user_prefs, k=1)
+        return top[0] if top else None
@@ -0,0 +1,62 @@
+"""Готовые подписи и клавиатуры для сообщений бота.
+
+Подписи страниц меню и вся разметка (главное меню, страницы меню, вопросы теста,
+кнопки результата) строятся один раз на версию каталога и хранятся уже
+сериализованными в JSON. Обработчики отдают готовые строки в Telegram API, не
+собирая заново InlineKeyboardMarkup/ReplyKeyboardMarkup на каждое сообщение.
+При смене версии каталога кэш пересобирается при первом обращении.
+"""
+import logging
+import threading
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+# Страница меню: чай, готовая подпись и сериализованная клавиатура
+MenuPage = namedtuple("MenuPage", ["tea_name", "tea_data", "caption", "markup"])
+
+# Вопрос теста: текст и сериализованная клавиатура с вариантами
+RenderedQuestion = namedtuple("RenderedQuestion", ["text", "markup"])
+
+
+class Rendered:
+    """Все подписи и разметка для одной версии каталога"""
+
+    def __init__(self, app, catalog):
+        self.version = catalog.version
+        self.main_menu = app.main_menu().to_json()
+        self.result_markup = app.result_keyboard().to_json()
+
+        self.total_pages = len(catalog)
+        self.pages = tuple(
+            MenuPage(
+                tea_name,
+                tea_data,
+                app.menu_page_caption(page, tea_name, tea_data, self.total_pages),
+                app.get_menu_keyboard(page, self.total_pages).to_json()
+            )
+            for page, (tea_name, tea_data) in enumerate(zip(catalog.names, catalog.teas))
+        )
+        self.questions = tuple(
+            RenderedQuestion(app.question_text(index), app.question_keyboard(index).to_json())
+            for index in range(len(catalog.questions))
+        )
+
+
+class RenderCache:
+    """Хранит Rendered для текущей версии каталога и пересобирает его при смене версии"""
+
+    def __init__(self, app):
+        self.app = app
+        self._lock = threading.Lock()
+        self._rendered = None
+
+    def get(self, catalog):
+        rendered = self._rendered
+        if rendered is not None and rendered.version == catalog.version:
+            return rendered
+        with self._lock:
+            if self._rendered is None or self._rendered.version != catalog.version:
+                self._rendered = Rendered(self.app, catalog)
+                logger.info(f"Подписи и клавиатуры собраны для версии каталога {catalog.version[:12]}")
+            return self._rendered
@@ -0,0 +1,162 @@
+"""Таблица готовых результатов теста.
+
+Пространство ответов теста конечно (произведение числа вариантов всех вопросов),
+поэтому победитель и его баллы считаются заранее для каждой комбинации ответов.
+show_result после этого делает одно обращение к массиву по индексу ответов.
+Таблица привязана к отпечатку меню и вопросов и пересобирается при их изменении.
+"""
+import hashlib
+import json
+import logging
+import os
+
+import numpy as np
+
+from recommender import EXACT_MATCH_SCORE, PARTIAL_MATCHES
+
+logger = logging.getLogger(__name__)
+
+# Сколько комбинаций ответов оценивается за один проход (ограничивает память на больших каталогах)
+BUILD_CHUNK_SIZE = 256
+
+# Версия формата таблицы: увеличивать при любой правке построения или выбора победителя
+TABLE_FORMAT_VERSION = 1
+
+
+def catalog_fingerprint(menu, questions):
+    """Отпечаток данных и правил подсчёта, от которых зависит результат теста"""
+    payload = {
+        "format": TABLE_FORMAT_VERSION,
+        "exact_score": EXACT_MATCH_SCORE,
+        "partial": [[question, [[sorted(group), score] for group, score in rules]]
+                    for question, rules in sorted(PARTIAL_MATCHES.items())],
+        "menu": [[name, list(tea["characteristics"].items())] for name, tea in menu.items()],
+        "questions": [list(question["options"].items()) for question in questions],
+    }
+    raw = json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResultTable:
+    """Победитель и баллы для каждой комбинации ответов, индексируемые номерами вариантов"""
+
+    def __init__(self, fingerprint, menu, questions, winners, scores):
+        self.fingerprint = fingerprint
+        self.names = list(menu.keys())
+        self.teas = [menu[name] for name in self.names]
+        self.shape = tuple(len(question["options"]) for question in questions)
+        # Значение ответа -> номер варианта для каждого вопроса
+        self.option_indices = [
+            {value: index for index, value in enumerate(question["options"].values())}
+            for question in questions
+        ]
+        # Шаги для перевода номеров вариантов в плоский индекс
+        self.strides = [int(np.prod(self.shape[i + 1:], dtype=np.int64)) for i in range(len(self.shape))]
+        self.winners = winners
+        self.scores = scores
+
+    @classmethod
+    def build(cls, recommender, menu, questions):
+        """Перебирает все комбинации ответов и запоминает лучший чай для каждой"""
+        shape = tuple(len(question["options"]) for question in questions)
+        # Номер строки матрицы баллов для каждого варианта каждого вопроса
+        option_rows = [
+            np.array([recommender.row_offsets[i] + recommender.vocab[i][value]
+                      for value in question["options"].values()], dtype=np.intp)
+            for i, question in enumerate(questions)
+        ]
+        combos = np.indices(shape).reshape(len(shape), -1).T
+        total = len(combos)
+
+        winners = np.full(total, -1, dtype=np.min_scalar_type(-max(len(recommender.names), 1)))
+        scores = np.zeros(total, dtype=np.uint8)
+        for start in range(0, total, BUILD_CHUNK_SIZE):
+            chunk = combos[start:start + BUILD_CHUNK_SIZE]
+            rows = np.stack([option_rows[i][chunk[:, i]] for i in range(len(shape))], axis=1)
+            chunk_scores = recommender.scores_for_rows(rows)
+            if chunk_scores.shape[1] == 0:
+                continue
+            # argmax берёт первый максимум - тот же порядок, что и в find_best_tea
+            best = chunk_scores.argmax(axis=1)
+            best_scores = chunk_scores[np.arange(len(chunk)), best]
+            scores[start:start + len(chunk)] = best_scores
+            winners[start:start + len(chunk)] = np.where(best_scores > 0, best, -1)
+
+        return cls(catalog_fingerprint(menu, questions), menu, questions, winners, scores)
+
+    def index_of(self, user_prefs):
+        """Плоский индекс комбинации ответов или None, если ответы неполные"""
+        index = 0
+        for i, options in enumerate(self.option_indices):
+            option = options.get(user_prefs.get(f"q{i}"))
+            if option is None:
+                return None
+            index += option * self.strides[i]
+        return index
+
+    def lookup(self, user_prefs):
+        """Лучший чай в виде (название, данные, баллы) или None (как find_best_tea).
+
+        Для неполного набора ответов выбрасывает KeyError.
+        """
+        index = self.index_of(user_prefs)
+        if index is None:
+            raise KeyError("Неполный набор ответов")
+        return self._result(index)
+
+    def lookup_options(self, options):
+        """То же по номерам выбранных вариантов (так ответы хранятся в сессии)"""
+        if len(options) != len(self.shape):
+            raise KeyError("Неполный набор ответов")
+        index = 0
+        for option, size, stride in zip(options, self.shape, self.strides):
+            if option is None or not 0 <= option < size:
+                raise KeyError("Неполный набор ответов")
+            index += option * stride
+        return self._result(index)
+
+    def _result(self, index):
+        winner = int(self.winners[index])
+        if winner < 0:
+            return None
+        return self.names[winner], self.teas[winner], int(self.scores[index])
+
+    def save(self, path):
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, fingerprint=np.array(self.fingerprint),
+                 winners=self.winners, scores=self.scores)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, menu, questions):
+        """Загружает таблицу с диска, если она построена для тех же меню и вопросов"""
+        fingerprint = catalog_fingerprint(menu, questions)
+        with np.load(path) as data:
+            if str(data["fingerprint"]) != fingerprint:
+                return None
+            table = cls(fingerprint, menu, questions, data["winners"], data["scores"])
+        if len(table.winners) != int(np.prod(table.shape, dtype=np.int64)):
+            return None
+        return table
+
+
+def load_or_build(recommender, menu, questions, path=None):
+    """Берёт таблицу из файла, а если её нет или меню изменилось - строит заново"""
+    if path and os.path.exists(path):
+        try:
+            table = ResultTable.load(path, menu, questions)
+            if table is not None:
+                logger.info(f"Таблица результатов загружена из {path}")
+                return table
+            logger.info("Меню или вопросы изменились, таблица результатов будет пересобрана")
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Не удалось прочитать таблицу результатов {path}: {e}")
+
+    table = ResultTable.build(recommender, menu, questions)
+    logger.info(f"Таблица результатов построена: {len(table.winners)} комбинаций ответов")
+    if path:
+        try:
+            table.save(path)
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить таблицу результатов {path}: {e}")
+    return table
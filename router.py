@@ -0,0 +1,100 @@
+"""Маршрутизация текстовых сообщений по таблицам.
+
+Вместо списка обработчиков telebot с фильтрами-лямбдами, которые проверяются по
+очереди, обработчик выбирается поиском в словарях: по команде, по точному тексту
+кнопки и по состоянию разговора. Правила проверяются ярусами в порядке
+регистрации (подряд идущие правила одного вида попадают в один ярус), поэтому
+приоритеты те же, что были у обработчиков telebot, а стоимость выбора зависит от
+числа ярусов, а не от числа кнопок, команд и состояний.
+"""
+from telebot.util import extract_command
+
+COMMAND = "command"
+TEXT = "text"
+STATE = "state"
+
+
+class MessageRouter:
+    """Выбирает обработчик сообщения по команде, тексту или состоянию чата"""
+
+    def __init__(self, state_of):
+        # state_of(chat_id) -> текущее состояние разговора; вызывается, только если дошли до яруса состояний
+        self.state_of = state_of
+        self._tiers = []  # [(вид, {ключ: обработчик})]
+        self._default = None
+
+    def _add(self, kind, keys, handler):
+        if not self._tiers or self._tiers[-1][0] != kind:
+            self._tiers.append((kind, {}))
+        table = self._tiers[-1][1]
+        for key in keys:
+            table.setdefault(key, handler)
+
+    def command(self, *commands):
+        """Обработчик команд (/start, /help ...)"""
+        def decorator(handler):
+            self._add(COMMAND, commands, handler)
+            return handler
+        return decorator
+
+    def text(self, *texts):
+        """Обработчик точного текста сообщения (кнопки reply-клавиатуры)"""
+        def decorator(handler):
+            self._add(TEXT, texts, handler)
+            return handler
+        return decorator
+
+    def state(self, *states):
+        """Обработчик сообщений в заданных состояниях разговора"""
+        def decorator(handler):
+            self._add(STATE, states, handler)
+            return handler
+        return decorator
+
+    def default(self, handler):
+        """Обработчик всего, что не подошло под другие правила"""
+        self._default = handler
+        return handler
+
+    def resolve(self, message):
+        """Обработчик для сообщения или None"""
+        text = message.text
+        command = extract_command(text) if text else None
+        state = None
+        for kind, table in self._tiers:
+            if kind == COMMAND:
+                key = command
+            elif kind == TEXT:
+                key = text
+            else:
+                if state is None:
+                    state = self.state_of(message.chat.id)
+                key = state
+            handler = table.get(key)
+            if handler is not None:
+                return handler
+        return self._default
+
+    def dispatch(self, message):
+        handler = self.resolve(message)
+        if handler is not None:
+            return handler(message)
+
+    def handlers(self):
+        """Все зарегистрированные обработчики (без повторов)"""
+        seen = {}
+        for _, table in self._tiers:
+            for handler in table.values():
+                seen.setdefault(id(handler), handler)
+        if self._default is not None:
+            seen.setdefault(id(self._default), self._default)
+        return list(seen.values())
+
+    def replace_handlers(self, wrap):
+        """Заменяет каждый обработчик на wrap(обработчик), например для замера времени"""
+        wrapped = {id(handler): wrap(handler) for handler in self.handlers()}
+        for _, table in self._tiers:
+            for key, handler in table.items():
+                table[key] = wrapped[id(handler)]
+        if self._default is not None:
+            self._default = wrapped[id(self._default)]
@@ -0,0 +1,142 @@
+"""Поиск чаев для инлайн-режима (@бот улун).
+
+Индекс строится один раз на версию каталога: каждое слово названия и остального
+текста (описание, названия характеристик) раскладывается на триграммы с пробелом
+в начале слова. Слово запроса ищется как начало слова в тексте чая, от двух букв
+("ул" -> триграмма " ул"), поэтому результаты появляются по мере набора. Запрос -
+пересечение списков чаев по триграммам каждого слова; совпадения в названии
+поднимаются выше. Кандидаты сверяются с текстом (триграммы дают редкие ложные
+совпадения) только в пределах нужной страницы результатов.
+"""
+import logging
+import re
+import threading
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+# Telegram показывает не больше 50 результатов на один ответ
+MAX_RESULTS = 50
+
+WORD_RE = re.compile(r"\w+")
+
+
+def normalize(text):
+    """Слова текста в нижнем регистре, ё -> е"""
+    return WORD_RE.findall(str(text).lower().replace("ё", "е"))
+
+
+def trigrams(word):
+    padded = " " + word
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SearchIndex:
+    """Триграммный индекс по названиям и текстам чаев одной версии каталога"""
+
+    def __init__(self, version, names, texts):
+        # texts[i] - весь остальной текст i-го чая, по которому тоже ищем
+        self.version = version
+        self.size = len(names)
+        self._name_words = []
+        self._text_words = []
+        name_postings = defaultdict(set)
+        text_postings = defaultdict(set)
+        for doc, (name, text) in enumerate(zip(names, texts)):
+            name_words = normalize(name)
+            text_words = normalize(text)
+            # Пробел в начале: начало слова запроса ищется как " " + слово
+            self._name_words.append(" " + " ".join(name_words))
+            self._text_words.append(" " + " ".join(text_words))
+            for word in name_words:
+                for gram in trigrams(word):
+                    name_postings[gram].add(doc)
+            for word in text_words:
+                for gram in trigrams(word):
+                    text_postings[gram].add(doc)
+        self._name_postings = {gram: frozenset(docs) for gram, docs in name_postings.items()}
+        self._text_postings = {gram: frozenset(docs) for gram, docs in text_postings.items()}
+
+    @classmethod
+    def from_catalog(cls, catalog, describe):
+        """describe(данные чая) -> строка с названиями характеристик для поиска"""
+        texts = [f"{tea.get('description', '')} {describe(tea)}" for tea in catalog.teas]
+        return cls(catalog.version, catalog.names, texts)
+
+    def _candidates(self, postings, word):
+        """Чаи, в которых есть все триграммы слова запроса"""
+        sets = [postings.get(gram) for gram in trigrams(word)]
+        if not sets or None in sets:
+            return frozenset()
+        sets.sort(key=len)
+        docs = sets[0]
+        for other in sets[1:]:
+            docs = docs & other
+            if not docs:
+                break
+        return docs
+
+    def search(self, query, offset=0, limit=MAX_RESULTS):
+        """Номера чаев для страницы результатов и смещение следующей страницы (или None).
+
+        Слова короче двух букв не учитываются; пустой запрос возвращает весь каталог.
+        """
+        words = [word for word in normalize(query) if len(word) >= 2]
+        if not words:
+            ranked = range(self.size)
+        else:
+            matched = None
+            name_hits = []
+            for word in words:
+                in_name = self._candidates(self._name_postings, word)
+                docs = in_name | self._candidates(self._text_postings, word)
+                matched = docs if matched is None else matched & docs
+                if not matched:
+                    return [], None
+                name_hits.append(in_name)
+            # Больше слов запроса в названии - выше; при равенстве - порядок каталога.
+            # Группы по числу совпадений в названии считаются операциями над множествами
+            groups = {0: matched}
+            for hits in name_hits:
+                regrouped = defaultdict(frozenset)
+                for count, docs in groups.items():
+                    regrouped[count + 1] |= docs & hits
+                    regrouped[count] |= docs - hits
+                groups = regrouped
+            ranked = [doc for count in sorted(groups, reverse=True) for doc in sorted(groups[count])]
+
+        results = []
+        for position in range(offset, len(ranked)):
+            doc = ranked[position]
+            if words and not self._verify(doc, words):
+                continue
+            results.append(doc)
+            if len(results) == limit:
+                position += 1
+                break
+        else:
+            position = len(ranked)
+        return results, (position if position < len(ranked) else None)
+
+    def _verify(self, doc, words):
+        name, text = self._name_words[doc], self._text_words[doc]
+        return all(" " + word in name or " " + word in text for word in words)
+
+
+class SearchIndexCache:
+    """Хранит индекс для текущей версии каталога и пересобирает его при смене версии"""
+
+    def __init__(self, describe):
+        self.describe = describe
+        self._lock = threading.Lock()
+        self._index = None
+
+    def get(self, catalog):
+        index = self._index
+        if index is not None and index.version == catalog.version:
+            return index
+        with self._lock:
+            if self._index is None or self._index.version != catalog.version:
+                self._index = SearchIndex.from_catalog(catalog, self.describe)
+                logger.info(f"Поисковый индекс построен для версии каталога {catalog.version[:12]}")
+            return self._index
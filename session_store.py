@@ -0,0 +1,356 @@
+"""Хранилище состояния диалогов с пользователями.
+
+Вместо глобальных словарей бот работает с сессиями через интерфейс SessionStore.
+Есть два бэкенда: в памяти (с ограничением размера и TTL) и SQLite в режиме WAL
+с пакетной записью, кэшем последних сессий и вытеснением неактивных чатов по TTL.
+Сессия занимает несколько десятков байт в памяти и 14 байт на диске.
+"""
+import bisect
+import json
+import logging
+import sqlite3
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Неактивные дольше этого срока сессии удаляются (секунды)
+DEFAULT_TTL = 7 * 24 * 3600
+
+
+class State:
+    """Состояния диалога - небольшие целые числа"""
+
+    MAIN = 0
+    TEST = 1
+    BROWSING_MENU = 2
+    RESULT = 3
+    # QUESTION + i - ждём ответ на вопрос i
+    QUESTION = 16
+
+    @staticmethod
+    def question(index):
+        return State.QUESTION + index
+
+    @staticmethod
+    def question_index(state):
+        """Номер вопроса для состояния ответа на вопрос, иначе None"""
+        return state - State.QUESTION if state >= State.QUESTION else None
+
+
+# Имена состояний в сессиях старого формата (JSON)
+LEGACY_STATES = {
+    "main": State.MAIN,
+    "test": State.TEST,
+    "browsing_menu": State.BROWSING_MENU,
+    "result": State.RESULT,
+}
+
+# Ответ на вопрос хранится как (номер варианта + 1) в 4 битах, 0 - ответа нет
+ANSWER_BITS = 4
+ANSWER_MASK = (1 << ANSWER_BITS) - 1
+MAX_OPTIONS = ANSWER_MASK
+MAX_QUESTIONS = 64 // ANSWER_BITS
+
+# Сериализованная сессия: версия формата, состояние, страница меню, ответы
+SESSION_FORMAT = struct.Struct("<BBIQ")
+SESSION_FORMAT_VERSION = 1
+
+
+class Session:
+    """Состояние диалога одного чата.
+
+    Ответы теста упакованы в одно целое: по 4 бита на вопрос с номером варианта.
+    """
+
+    __slots__ = ("state", "answers", "menu_page")
+
+    def __init__(self, state=State.MAIN, answers=0, menu_page=0):
+        self.state = state
+        self.answers = answers
+        self.menu_page = menu_page
+
+    def answer(self, question):
+        """Номер выбранного варианта или None"""
+        option = (self.answers >> (question * ANSWER_BITS)) & ANSWER_MASK
+        return option - 1 if option else None
+
+    def set_answer(self, question, option):
+        if not 0 <= question < MAX_QUESTIONS or not 0 <= option < MAX_OPTIONS:
+            raise ValueError(f"Ответ {option} на вопрос {question} не помещается в сессию")
+        shift = question * ANSWER_BITS
+        self.answers = self.answers & ~(ANSWER_MASK << shift) | (option + 1) << shift
+
+    def options(self, count):
+        """Номера вариантов ответов на первые count вопросов (None - ответа нет)"""
+        return tuple(self.answer(question) for question in range(count))
+
+    def answered(self):
+        """Число вопросов, на которые есть ответ"""
+        answers, count = self.answers, 0
+        while answers:
+            count += (answers & ANSWER_MASK) != 0
+            answers >>= ANSWER_BITS
+        return count
+
+    def dumps(self):
+        return SESSION_FORMAT.pack(SESSION_FORMAT_VERSION, self.state, self.menu_page, self.answers)
+
+    @classmethod
+    def loads(cls, raw):
+        if isinstance(raw, str):
+            return cls.from_legacy(json.loads(raw))
+        version, state, menu_page, answers = SESSION_FORMAT.unpack(raw)
+        if version != SESSION_FORMAT_VERSION:
+            raise ValueError(f"Неизвестная версия формата сессии: {version}")
+        return cls(state, answers, menu_page)
+
+    @classmethod
+    def from_legacy(cls, data):
+        """Сессия из старого JSON-формата. Ответы там хранились значениями вариантов, а не
+        номерами, поэтому незаконченный тест не переносится: чат попадает в главное меню"""
+        state = LEGACY_STATES.get(data.get("s"), State.MAIN)
+        return cls(state=state, menu_page=data.get("p", 0))
+
+
+class SessionStore:
+    """Интерфейс хранилища сессий"""
+
+    def get(self, chat_id):
+        """Возвращает сессию чата или None"""
+        raise NotImplementedError
+
+    def put(self, chat_id, session):
+        raise NotImplementedError
+
+    def delete(self, chat_id):
+        raise NotImplementedError
+
+    def chat_ids(self, after=None):
+        """Перебирает id всех чатов с активной сессией по возрастанию (с after - только большие)"""
+        raise NotImplementedError
+
+    def count(self):
+        raise NotImplementedError
+
+    def flush(self):
+        """Сбрасывает отложенные изменения в постоянное хранилище"""
+
+    def close(self):
+        self.flush()
+
+
+class MemorySessionStore(SessionStore):
+    """Сессии в памяти процесса: LRU с ограничением размера и TTL"""
+
+    def __init__(self, ttl=DEFAULT_TTL, max_sessions=100000):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()  # chat_id -> (session, updated_at)
+
+    def get(self, chat_id):
+        with self._lock:
+            item = self._sessions.get(chat_id)
+            if item is None:
+                return None
+            session, updated_at = item
+            if self.ttl and time.time() - updated_at > self.ttl:
+                del self._sessions[chat_id]
+                return None
+            return session
+
+    def put(self, chat_id, session):
+        with self._lock:
+            self._sessions[chat_id] = (session, time.time())
+            self._sessions.move_to_end(chat_id)
+            # Вытесняем самые давние сессии, чтобы память не росла без предела
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def delete(self, chat_id):
+        with self._lock:
+            self._sessions.pop(chat_id, None)
+
+    def chat_ids(self, after=None):
+        with self._lock:
+            chat_ids = sorted(self._sessions)
+        if after is not None:
+            chat_ids = chat_ids[bisect.bisect_right(chat_ids, after):]
+        yield from chat_ids
+
+    def count(self):
+        return len(self._sessions)
+
+
+class SQLiteSessionStore(SessionStore):
+    """Сессии в SQLite (WAL) с пакетной записью и вытеснением по TTL"""
+
+    def __init__(self, path, ttl=DEFAULT_TTL, batch_size=200, flush_interval=1.0, cache_size=10000):
+        self.path = path
+        self.ttl = ttl
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.cache_size = cache_size
+
+        self._lock = threading.RLock()
+        self._pending = {}  # chat_id -> (сериализованная сессия или None для удаления, время)
+        self._cache = OrderedDict()  # Последние использованные сессии: chat_id -> (session, updated_at)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "chat_id INTEGER PRIMARY KEY, data BLOB NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions(updated_at)")
+        self.evict_expired()
+
+        # Фоновый поток периодически сбрасывает накопленные изменения
+        self._stop = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, name="session-flusher", daemon=True)
+        self._flusher.start()
+
+    def _expired(self, updated_at, now=None):
+        if now is None:
+            now = time.time()
+        return bool(self.ttl) and now - updated_at > self.ttl
+
+    def _remember(self, chat_id, session, updated_at):
+        self._cache[chat_id] = (session, updated_at)
+        self._cache.move_to_end(chat_id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def get(self, chat_id):
+        with self._lock:
+            pending = self._pending.get(chat_id)
+            if pending is not None and pending[0] is None:
+                return None
+            item = self._cache.get(chat_id)
+            if item is not None:
+                session, updated_at = item
+                if self._expired(updated_at):
+                    del self._cache[chat_id]
+                    return None
+                self._cache.move_to_end(chat_id)
+                return session
+
+            row = self._conn.execute(
+                "SELECT data, updated_at FROM sessions WHERE chat_id = ?", (chat_id,)
+            ).fetchone()
+            if row is None or self._expired(row[1]):
+                return None
+            session = Session.loads(row[0])
+            self._remember(chat_id, session, row[1])
+            return session
+
+    def put(self, chat_id, session):
+        # Сначала сериализуем: сессия, которую нельзя записать, не должна остаться в кэше
+        data = session.dumps()
+        now = time.time()
+        with self._lock:
+            self._remember(chat_id, session, now)
+            self._pending[chat_id] = (data, now)
+            if len(self._pending) >= self.batch_size:
+                self.flush()
+
+    def delete(self, chat_id):
+        with self._lock:
+            self._cache.pop(chat_id, None)
+            self._pending[chat_id] = (None, time.time())
+
+    def flush(self):
+        with self._lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, {}
+            upserts = [(chat_id, data, ts) for chat_id, (data, ts) in pending.items() if data is not None]
+            deletes = [(chat_id,) for chat_id, (data, _) in pending.items() if data is None]
+            try:
+                self._conn.execute("BEGIN")
+                if upserts:
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO sessions (chat_id, data, updated_at) VALUES (?, ?, ?)", upserts
+                    )
+                if deletes:
+                    self._conn.executemany("DELETE FROM sessions WHERE chat_id = ?", deletes)
+                self._conn.execute("COMMIT")
+            except sqlite3.Error as e:
+                self._conn.execute("ROLLBACK")
+                # Возвращаем изменения в очередь, не затирая более свежие
+                for chat_id, item in pending.items():
+                    self._pending.setdefault(chat_id, item)
+                logger.error(f"Ошибка записи сессий в {self.path}: {e}")
+
+    def evict_expired(self):
+        """Удаляет сессии чатов, неактивных дольше TTL"""
+        if not self.ttl:
+            return 0
+        now = time.time()
+        with self._lock:
+            # Кэш тоже чистим, иначе в нём остаются сессии давно ушедших чатов
+            for chat_id in [chat_id for chat_id, (_, updated_at) in self._cache.items()
+                            if self._expired(updated_at, now)]:
+                del self._cache[chat_id]
+            cursor = self._conn.execute("DELETE FROM sessions WHERE updated_at < ?", (now - self.ttl,))
+            if cursor.rowcount:
+                logger.info(f"Удалено {cursor.rowcount} неактивных сессий")
+            return cursor.rowcount
+
+    def _flush_loop(self):
+        last_eviction = time.monotonic()
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+                if time.monotonic() - last_eviction > 60:
+                    self.evict_expired()
+                    last_eviction = time.monotonic()
+            except Exception as e:
+                logger.error(f"Ошибка фоновой записи сессий: {e}")
+
+    def chat_ids(self, after=None):
+        self.flush()
+        min_updated = time.time() - self.ttl if self.ttl else 0
+        last_id = after
+        # Читаем порциями, чтобы не держать в памяти всех пользователей
+        while True:
+            with self._lock:
+                if last_id is None:
+                    rows = self._conn.execute(
+                        "SELECT chat_id FROM sessions WHERE updated_at >= ? ORDER BY chat_id LIMIT 1000",
+                        (min_updated,)).fetchall()
+                else:
+                    rows = self._conn.execute(
+                        "SELECT chat_id FROM sessions WHERE updated_at >= ? AND chat_id > ? ORDER BY chat_id LIMIT 1000",
+                        (min_updated, last_id)).fetchall()
+            if not rows:
+                return
+            for (chat_id,) in rows:
+                yield chat_id
+            last_id = rows[-1][0]
+
+    def count(self):
+        self.flush()
+        min_updated = time.time() - self.ttl if self.ttl else 0
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM sessions WHERE updated_at >= ?", (min_updated,)).fetchone()[0]
+
+    def close(self):
+        self._stop.set()
+        self.flush()
+        with self._lock:
+            self._conn.close()
+
+
+def create_session_store(backend, path=None, ttl=DEFAULT_TTL):
+    """Создаёт хранилище сессий по имени бэкенда ("memory" или "sqlite")"""
+    if backend == "memory":
+        return MemorySessionStore(ttl=ttl)
+    if backend == "sqlite":
+        return SQLiteSessionStore(path, ttl=ttl)
+    raise ValueError(f"Неизвестный бэкенд хранилища сессий: {backend}")
@@ -0,0 +1,14 @@
+"""Окружение для офлайн-импорта bot.py в тестах: каталог и фото берутся из репозитория"""
+import logging
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+os.chdir(ROOT)
+sys.path.insert(0, ROOT)
+os.environ.setdefault('TELEGRAM_BOT_TOKEN', '0:test')
+os.environ.setdefault('BOT_DATA_DIR', tempfile.mkdtemp(prefix='chaybar-test-'))
+os.environ.setdefault('SESSION_BACKEND', 'memory')
+logging.disable(logging.WARNING)
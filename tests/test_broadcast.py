@@ -0,0 +1,41 @@
+"""Broadcaster: чат администратора пропускается, но курсор рассылки проходит и его"""
+import time
+
+from broadcast import Broadcaster
+from session_store import MemorySessionStore, Session
+
+TEXT = "Новый чай в меню"
+ADMIN_CHAT_ID = 3
+
+
+def run_broadcast(tmp_path, chat_ids, chunk_size):
+    sessions = MemorySessionStore()
+    for chat_id in chat_ids:
+        sessions.put(chat_id, Session())
+    delivered = []
+
+    def send(chat_id, text, photo_path):
+        if text == TEXT:
+            delivered.append(chat_id)
+
+    broadcaster = Broadcaster(sessions, send, str(tmp_path / "broadcast.json"), rate=1000,
+                              chunk_size=chunk_size, report_interval=3600)
+    job = broadcaster.start(TEXT, admin_chat_id=ADMIN_CHAT_ID)
+    deadline = time.monotonic() + 10
+    while broadcaster.running() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return job, delivered
+
+
+def test_admin_is_skipped_and_cursor_moves_past_it(tmp_path):
+    job, delivered = run_broadcast(tmp_path, [1, 2, ADMIN_CHAT_ID], chunk_size=2)
+    assert job.finished
+    assert sorted(delivered) == [1, 2]
+    assert job.sent == 2
+    assert job.after == ADMIN_CHAT_ID
+
+
+def test_admin_inside_chunk(tmp_path):
+    job, delivered = run_broadcast(tmp_path, [1, 2, ADMIN_CHAT_ID, 4, 5], chunk_size=2)
+    assert sorted(delivered) == [1, 2, 4, 5]
+    assert job.after == 5
@@ -0,0 +1,57 @@
+"""PhotoOptimizer: варианты фото и их пересборка после правки исходника"""
+import os
+
+import pytest
+
+PIL = pytest.importorskip("PIL")
+from PIL import Image  # noqa: E402
+
+from image_optimizer import PhotoOptimizer  # noqa: E402
+
+
+def make_photo(path, size, color):
+    Image.new("RGB", size, color).save(path, "PNG")
+
+
+@pytest.fixture
+def optimizer(tmp_path):
+    return PhotoOptimizer(str(tmp_path / "variants"), max_side=64, workers=1)
+
+
+def test_variant_is_smaller_jpeg(tmp_path, optimizer):
+    source = str(tmp_path / "tea.png")
+    make_photo(source, (400, 300), (10, 120, 40))
+    report = optimizer.optimize([source])
+    assert [item.source for item in report] == [source]
+    variant = optimizer.variant(source)
+    assert variant != source
+    with Image.open(variant) as image:
+        assert image.format == "JPEG"
+        assert max(image.size) == 64
+
+
+def test_edited_source_gets_new_variant(tmp_path, optimizer):
+    source = str(tmp_path / "tea.png")
+    make_photo(source, (400, 300), (10, 120, 40))
+    optimizer.optimize([source])
+    old_variant = optimizer.variant(source)
+
+    make_photo(source, (300, 400), (200, 30, 30))
+    new_variant = optimizer.variant(source)
+    assert new_variant != old_variant
+    with Image.open(new_variant) as image:
+        assert image.size == (48, 64)
+    # Без новых правок вариант не пересобирается
+    assert optimizer.variant(source) == new_variant
+
+
+def test_removed_source_falls_back_to_path(tmp_path, optimizer):
+    source = str(tmp_path / "tea.png")
+    make_photo(source, (400, 300), (10, 120, 40))
+    optimizer.optimize([source])
+    os.remove(source)
+    assert optimizer.variant(source) == source
+
+
+def test_unknown_source_is_sent_as_is(tmp_path, optimizer):
+    assert optimizer.variant(str(tmp_path / "missing.png")) == str(tmp_path / "missing.png")
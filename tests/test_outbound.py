@@ -0,0 +1,61 @@
+"""OutboundDispatcher считает каждый вызов API, в том числе повторы после 429"""
+import pytest
+import telebot
+from telebot import apihelper
+
+from api_errors import OK, RATE_LIMITED
+from loadtest.fake_telegram import FakeTelegramServer
+from outbound import OutboundDispatcher
+
+CHAT_ID = 42
+
+
+@pytest.fixture
+def server():
+    server = FakeTelegramServer(retry_after=0)
+    server.start()
+    saved = apihelper.API_URL
+    apihelper.API_URL = server.api_url
+    yield server
+    apihelper.API_URL = saved
+    server.stop()
+
+
+@pytest.fixture
+def attempts():
+    return []
+
+
+@pytest.fixture
+def outbound(server, attempts):
+    bot = telebot.TeleBot("0:test", threaded=False)
+    outbound = OutboundDispatcher(bot, global_rate=1000, chat_rate=1000, chat_burst=1000,
+                                  on_attempt=lambda method, outcome: attempts.append((method, outcome)))
+    outbound.install(bot)
+    yield outbound
+    outbound.stop(timeout=5)
+
+
+def test_every_retry_after_429_is_counted(server, outbound, attempts):
+    def on_attempt(method, outcome):
+        attempts.append((method, outcome))
+        if len(attempts) == 2:
+            server.rate_limit_probability = 0.0
+
+    outbound.on_attempt = on_attempt
+    server.rate_limit_probability = 1.0
+    assert outbound.submit("send_message", CHAT_ID, "после 429").result(timeout=5).text == "после 429"
+    assert attempts == [("send_message", RATE_LIMITED), ("send_message", RATE_LIMITED), ("send_message", OK)]
+    assert server.calls["sendMessage"] == 3
+    assert outbound.stats()["retried"] == 2
+
+
+def test_superseded_operation_is_not_counted(server, outbound, attempts):
+    server.latency = 0.2
+    first = outbound.submit("send_message", CHAT_ID, "первое")
+    key = ("edit_message_text", CHAT_ID, 1)
+    outbound.submit("edit_message_text", "старое", chat_id=CHAT_ID, message_id=1, coalesce_key=key)
+    latest = outbound.submit("edit_message_text", "новое", chat_id=CHAT_ID, message_id=1, coalesce_key=key)
+    first.result(timeout=5)
+    assert latest.result(timeout=5).text == "новое"
+    assert attempts == [("send_message", OK), ("edit_message_text", OK)]
@@ -0,0 +1,74 @@
+"""TeaRecommender.best должен выбирать тот же чай, что и эталонный find_best_tea"""
+import itertools
+import random
+
+import pytest
+
+import bot
+import recommender
+import result_table
+from recommender import TeaRecommender
+
+
+def all_answer_combinations(questions):
+    return [
+        {f"q{i}": value for i, value in enumerate(combo)}
+        for combo in itertools.product(*[question["options"].values() for question in questions])
+    ]
+
+
+def synthetic_menu(size, questions, seed=1):
+    """Меню из size чаев со случайными характеристиками - много чаев с равными баллами"""
+    rng = random.Random(seed)
+    keys = ["type", "strength", "caffeine", "taste", "aroma"]
+    values = [list(question["options"].values()) for question in questions]
+    return {
+        f"Чай {index}": {
+            "characteristics": {keys[i]: rng.choice(values[i]) for i in range(len(questions))},
+        }
+        for index in range(size)
+    }
+
+
+COMBOS = all_answer_combinations(bot.QUESTIONS)
+
+
+def test_all_answer_combinations_are_covered():
+    expected = 1
+    for question in bot.QUESTIONS:
+        expected *= len(question["options"])
+    assert len(COMBOS) == expected
+
+
+def test_best_matches_find_best_tea_on_current_menu():
+    snapshot = bot.current_catalog()
+    menu = snapshot.catalog.menu
+    mismatches = [
+        prefs for prefs in COMBOS
+        if snapshot.recommender.best(prefs) != bot.find_best_tea(prefs, menu)
+    ]
+    assert mismatches == []
+
+
+@pytest.mark.parametrize("size", [1, 50, 500])
+def test_best_matches_find_best_tea_on_synthetic_menu(size):
+    menu = synthetic_menu(size, bot.QUESTIONS)
+    recommender = TeaRecommender(menu, bot.QUESTIONS)
+    for prefs in COMBOS[::7]:
+        assert recommender.best(prefs) == bot.find_best_tea(prefs, menu)
+
+
+def test_best_matches_find_best_tea_on_partial_answers():
+    snapshot = bot.current_catalog()
+    menu = snapshot.catalog.menu
+    for prefs in COMBOS[::11]:
+        for answered in range(len(bot.QUESTIONS)):
+            partial = {key: prefs[key] for key in list(prefs)[:answered]}
+            assert snapshot.recommender.best(partial) == bot.find_best_tea(partial, menu)
+
+
+def test_fingerprint_changes_with_scoring_rules(monkeypatch):
+    menu = bot.current_catalog().catalog.menu
+    fingerprint = result_table.catalog_fingerprint(menu, bot.QUESTIONS)
+    monkeypatch.setattr(result_table, "EXACT_MATCH_SCORE", recommender.EXACT_MATCH_SCORE + 1)
+    assert result_table.catalog_fingerprint(menu, bot.QUESTIONS) != fingerprint
@@ -0,0 +1,60 @@
+"""SQLiteSessionStore: TTL действует и на сессии из кэша"""
+import time
+
+import pytest
+
+import session_store
+from session_store import Session, SQLiteSessionStore, State
+
+CHAT_ID = 42
+
+
+class Clock:
+    """Подменяет модуль time в session_store: time() управляется тестом"""
+
+    monotonic = staticmethod(time.monotonic)
+
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(session_store, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def store(tmp_path, clock):
+    store = SQLiteSessionStore(str(tmp_path / "sessions.db"), ttl=60, flush_interval=3600)
+    yield store
+    store.close()
+
+
+def test_cached_session_expires(store, clock):
+    store.put(CHAT_ID, Session(state=State.TEST))
+    clock.now += 30
+    assert store.get(CHAT_ID).state == State.TEST
+    clock.now += 31
+    assert store.get(CHAT_ID) is None
+
+
+def test_evict_expired_clears_cache(store, clock):
+    store.put(CHAT_ID, Session(state=State.TEST))
+    store.flush()
+    clock.now += 61
+    assert store.evict_expired() == 1
+    assert CHAT_ID not in store._cache
+    assert store.count() == 0
+
+
+def test_put_refreshes_ttl(store, clock):
+    store.put(CHAT_ID, Session(state=State.TEST))
+    clock.now += 50
+    store.put(CHAT_ID, Session(state=State.RESULT))
+    clock.now += 50
+    assert store.get(CHAT_ID).state == State.RESULT
@@ -0,0 +1,131 @@
+"""PooledTransport против заглушки Bot API: переиспользование соединений, 429 и 5xx"""
+import threading
+
+import pytest
+import telebot
+from telebot import apihelper
+
+from api_errors import ApiCallError, ApiCaller, OK, RATE_LIMITED, TRANSPORT
+from loadtest.fake_telegram import FakeTelegramServer
+from transport import PooledTransport
+
+CHAT_ID = 42
+
+
+@pytest.fixture
+def server():
+    server = FakeTelegramServer(retry_after=0)
+    server.start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def transport(server):
+    saved = apihelper.API_URL, apihelper.CUSTOM_REQUEST_SENDER
+    transport = PooledTransport(pool_size=4)
+    transport.install(apihelper)
+    apihelper.API_URL = server.api_url
+    yield transport
+    transport.close()
+    apihelper.API_URL, apihelper.CUSTOM_REQUEST_SENDER = saved
+
+
+@pytest.fixture
+def bot(transport):
+    return telebot.TeleBot("0:test", threaded=False)
+
+
+def recording_caller(**kwargs):
+    attempts = []
+    caller = ApiCaller(on_attempt=lambda method, outcome: attempts.append(outcome), **kwargs)
+    return caller, attempts
+
+
+def test_sequential_requests_reuse_one_connection(server, transport, bot):
+    for index in range(20):
+        message = bot.send_message(CHAT_ID, f"сообщение {index}")
+        assert message.chat.id == CHAT_ID
+    assert server.calls["sendMessage"] == 20
+    assert server.connections == 1
+    stats = transport.stats()
+    assert stats["requests"] == 20
+    assert stats["connections_opened"] == 1
+    assert stats["connections_reused"] == 19
+    assert stats["errors"] == 0
+
+
+def test_concurrent_requests_stay_within_pool(server, transport, bot):
+    def send(count):
+        for index in range(count):
+            bot.send_message(CHAT_ID, f"сообщение {index}")
+
+    threads = [threading.Thread(target=send, args=(10,)) for _ in range(transport.pool_size)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert server.calls["sendMessage"] == 10 * transport.pool_size
+    assert server.connections <= transport.pool_size
+    assert transport.stats()["connections_reused"] >= 9 * transport.pool_size
+
+
+def test_rate_limited_call_is_retried_on_the_same_connection(server, transport, bot):
+    server.rate_limit_probability = 1.0
+    caller, attempts = recording_caller(rate_limit_retries=3)
+
+    def send():
+        if len(attempts) == 2:
+            server.rate_limit_probability = 0.0
+        return bot.send_message(CHAT_ID, "после 429")
+
+    message = caller.call("send_message", send)
+    assert message.text == "после 429"
+    assert attempts == [RATE_LIMITED, RATE_LIMITED, OK]
+    assert server.rate_limited["sendMessage"] == 2
+    assert server.connections == 1
+
+
+def test_rate_limited_call_gives_up_after_retries(server, transport, bot):
+    server.rate_limit_probability = 1.0
+    caller, attempts = recording_caller(rate_limit_retries=2)
+    with pytest.raises(ApiCallError) as info:
+        caller.call("send_message", bot.send_message, CHAT_ID, "не дойдёт")
+    assert info.value.kind == RATE_LIMITED
+    assert attempts == [RATE_LIMITED] * 3
+    assert server.calls["sendMessage"] == 3
+
+
+def test_server_error_is_not_retried_and_keeps_connection(server, transport, bot):
+    server.server_error_probability = 1.0
+    caller, attempts = recording_caller(transport_retries=1)
+    with pytest.raises(ApiCallError) as info:
+        caller.call("send_message", bot.send_message, CHAT_ID, "502")
+    # Запрос дошёл до сервера - повтор мог бы задвоить сообщение
+    assert info.value.kind == TRANSPORT
+    assert attempts == [TRANSPORT]
+    assert server.server_errors["sendMessage"] == 1
+
+    server.server_error_probability = 0.0
+    assert caller.call("send_message", bot.send_message, CHAT_ID, "снова работает").text == "снова работает"
+    assert server.connections == 1
+    assert transport.stats()["errors"] == 0
+
+
+def test_refused_connection_is_counted_and_retried_once(transport):
+    saved = apihelper.API_URL
+    # Порт сервера после остановки: соединение не устанавливается, запрос точно не ушёл
+    closed = FakeTelegramServer()
+    closed.start()
+    apihelper.API_URL = closed.api_url
+    closed.stop()
+    bot = telebot.TeleBot("0:test", threaded=False)
+    caller, attempts = recording_caller(transport_retries=1)
+    try:
+        with pytest.raises(ApiCallError) as info:
+            caller.call("send_message", bot.send_message, CHAT_ID, "некуда")
+    finally:
+        apihelper.API_URL = saved
+    assert info.value.kind == TRANSPORT
+    assert attempts == [TRANSPORT, TRANSPORT]
+    assert transport.stats()["errors"] == 2
@@ -0,0 +1,48 @@
+"""WebhookServer: проверка секретного заголовка"""
+import http.client
+import json
+import threading
+
+import pytest
+
+from webhook_server import SECRET_HEADER, WebhookServer
+
+UPDATE = {"update_id": 1, "message": {"message_id": 1, "date": 0, "chat": {"id": 42, "type": "private"},
+                                      "from": {"id": 42, "is_bot": False, "first_name": "Тест"}, "text": "/start"}}
+
+
+@pytest.fixture
+def server():
+    received = []
+    server = WebhookServer(received.extend, host="127.0.0.1", port=0, secret_token="секрет-1")
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.stop()
+    thread.join(timeout=10)
+
+
+def post(server, secret):
+    host, port = server.address[:2]
+    connection = http.client.HTTPConnection(host, port, timeout=10)
+    body = json.dumps(UPDATE).encode("utf-8")
+    connection.putrequest("POST", server.path)
+    connection.putheader("Content-Type", "application/json")
+    connection.putheader("Content-Length", str(len(body)))
+    if secret is not None:
+        connection.putheader(SECRET_HEADER, secret)
+    connection.endheaders(body)
+    status = connection.getresponse().status
+    connection.close()
+    return status
+
+
+def test_correct_secret_is_accepted(server):
+    assert post(server, "секрет-1".encode("utf-8")) == 200
+    assert server.stats()["accepted"] == 1
+
+
+@pytest.mark.parametrize("secret", [None, b"wrong", "секрет-2".encode("utf-8"), b"\xff\xfe"])
+def test_wrong_secret_is_rejected(server, secret):
+    assert post(server, secret) == 403
+    assert server.stats()["rejected"] == 1
@@ -0,0 +1,91 @@
+"""Общий пул HTTP-соединений для запросов telebot к Bot API.
+
+По умолчанию apihelper держит отдельную requests.Session в каждом потоке и
+пересоздаёт её раз в 10 минут, так что воркеры обработки и очереди outbound
+открывают свои соединения и заново проходят TLS-рукопожатие. Здесь одна сессия
+на процесс с пулом keep-alive соединений нужного размера; она подключается через
+apihelper.CUSTOM_REQUEST_SENDER и работает с существующим экземпляром TeleBot.
+
+Таймауты свои: короткий на установку соединения и отдельный на чтение ответа.
+Для getUpdates время чтения оставляется тем, что посчитал telebot (long polling
+держит запрос до 60 с), заменяется только таймаут соединения.
+"""
+import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# Таймауты по умолчанию (секунды)
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 30
+
+# Метод API, для которого время чтения задаёт long polling
+LONG_POLL_METHOD = "getUpdates"
+
+
+class PooledTransport:
+    """requests.Session с общим пулом соединений и счётчиками их переиспользования"""
+
+    def __init__(self, pool_size=16, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 pool_block=False):
+        # pool_block: ждать свободное соединение, а не открывать сверх пула одноразовое
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=pool_block)
+        self.session = requests.Session()
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+        self._lock = threading.Lock()
+        self._counters = {"requests": 0, "errors": 0}
+
+    def install(self, apihelper):
+        """Направляет запросы apihelper через этот пул"""
+        apihelper.CUSTOM_REQUEST_SENDER = self.request
+
+    def timeout(self, url, timeout=None):
+        """(соединение, чтение) для запроса: для long polling чтение берётся из telebot"""
+        if timeout and url.rsplit("/", 1)[-1] == LONG_POLL_METHOD:
+            read_timeout = timeout[1] if isinstance(timeout, tuple) else timeout
+            return self.connect_timeout, max(read_timeout, self.read_timeout)
+        return self.connect_timeout, self.read_timeout
+
+    def request(self, method, url, params=None, files=None, timeout=None, proxies=None):
+        """Сигнатура apihelper.CUSTOM_REQUEST_SENDER; возвращает requests.Response"""
+        try:
+            return self.session.request(method, url, params=params, files=files,
+                                        timeout=self.timeout(url, timeout), proxies=proxies)
+        except requests.exceptions.RequestException:
+            with self._lock:
+                self._counters["errors"] += 1
+            raise
+        finally:
+            with self._lock:
+                self._counters["requests"] += 1
+
+    def connections_opened(self):
+        """Сколько соединений открыто за всё время (по пулам urllib3)"""
+        pools = self.adapter.poolmanager.pools
+        total = 0
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                total += pool.num_connections
+        return total
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+        opened = self.connections_opened()
+        counters.update(
+            connections_opened=opened,
+            connections_reused=max(counters["requests"] - opened, 0),
+            pool_size=self.pool_size,
+        )
+        return counters
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,190 @@
+"""Обработка входящих обновлений пулом воркеров с сохранением порядка внутри чата.
+
+Каждое обновление попадает в очередь воркера, выбранного по chat.id, поэтому
+обновления одного чата обрабатываются строго по очереди (и не гоняются за
+состояние теста), а разные чаты обрабатываются параллельно. Продолжение обработки
+(submit_task) встаёт в ту же очередь, что и обновления его чата.
+"""
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Поля Update, из которых можно достать чат или пользователя
+_UPDATE_FIELDS = (
+    "message", "edited_message", "callback_query", "inline_query", "chosen_inline_result",
+    "channel_post", "edited_channel_post", "my_chat_member", "chat_member", "chat_join_request",
+    "shipping_query", "pre_checkout_query", "poll_answer",
+)
+
+_STOP = object()
+
+
+class _Task:
+    """Продолжение обработки, поставленное в очередь воркера чата"""
+
+    __slots__ = ("function", "args")
+
+    def __init__(self, function, args):
+        self.function = function
+        self.args = args
+
+
+def update_chat_id(update):
+    """Возвращает id чата (или пользователя), к которому относится обновление"""
+    for field in _UPDATE_FIELDS:
+        event = getattr(update, field, None)
+        if event is None:
+            continue
+        chat = getattr(event, "chat", None)
+        if chat is None:
+            message = getattr(event, "message", None)
+            chat = getattr(message, "chat", None)
+        if chat is not None:
+            return chat.id
+        user = getattr(event, "from_user", None) or getattr(event, "user", None)
+        if user is not None:
+            return user.id
+    return getattr(update, "update_id", 0)
+
+
+class ChatUpdateScheduler:
+    """Распределяет обновления по фиксированному пулу воркеров по chat.id"""
+
+    def __init__(self, workers=4, queue_size=1000, handler=None, on_receive=None):
+        self.workers = max(1, workers)
+        self.handler = handler
+        # Вызывается для каждого обновления сразу при получении, до очереди воркера
+        # (например, чтобы подтвердить нажатие кнопки, не дожидаясь обработки)
+        self.on_receive = on_receive
+        self._queues = [queue.Queue(maxsize=queue_size) for _ in range(self.workers)]
+        self._threads = []
+        self._lock = threading.Lock()
+        self._enqueued = 0
+        self._processed = 0
+        self._failed = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def install(self, bot):
+        """Подменяет bot.process_new_updates, чтобы обновления шли через очереди воркеров.
+
+        Бот должен быть создан с threaded=False: тогда обработчики выполняются
+        прямо в потоке воркера, а не во внутреннем пуле telebot.
+        """
+        process_new_updates = bot.process_new_updates
+        self.handler = lambda update: process_new_updates([update])
+
+        def submit_updates(updates):
+            # Long polling берёт следующий offset из last_update_id, который telebot обновляет
+            # при обработке. Обработка теперь идёт позже в воркерах, поэтому сдвигаем его сразу,
+            # иначе следующий getUpdates вернёт те же обновления повторно.
+            if updates:
+                bot.last_update_id = max(bot.last_update_id, max(update.update_id for update in updates))
+            self.submit_many(updates)
+
+        bot.process_new_updates = submit_updates
+        self.start()
+
+    def start(self):
+        for index, updates_queue in enumerate(self._queues):
+            thread = threading.Thread(
+                target=self._work, args=(updates_queue,), name=f"updates-{index}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        """Дожидается обработки уже принятых обновлений и останавливает воркеры"""
+        for updates_queue in self._queues:
+            updates_queue.put(_STOP)
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def shard_for(self, chat_id):
+        return hash(chat_id) % self.workers
+
+    def submit(self, update, chat_id=None):
+        """Ставит обновление в очередь воркера его чата (блокируется, если очередь полна)"""
+        if chat_id is None:
+            chat_id = update_chat_id(update)
+        if self.on_receive is not None:
+            try:
+                self.on_receive(update)
+            except Exception as e:
+                logger.error(f"Ошибка при получении обновления чата {chat_id}: {e}")
+        self._queues[self.shard_for(chat_id)].put((time.monotonic(), chat_id, update))
+        with self._lock:
+            self._enqueued += 1
+
+    def submit_task(self, chat_id, function, *args):
+        """Ставит продолжение обработки в очередь воркера чата.
+
+        Оно выполнится в том же воркере после уже принятых обновлений чата и не
+        параллельно с ними, а обработчик, который его поставил, сразу освобождает воркер.
+        """
+        if not self._threads:
+            # Воркеры не запущены - выполнять некому, выполняем сразу
+            function(*args)
+            return
+        try:
+            self._queues[self.shard_for(chat_id)].put_nowait((time.monotonic(), chat_id, _Task(function, args)))
+        except queue.Full:
+            # Ждать места в своей же очереди воркер не может - выполняем сразу, порядок чата сохраняется
+            function(*args)
+            return
+        with self._lock:
+            self._enqueued += 1
+
+    def submit_many(self, updates):
+        for update in updates:
+            self.submit(update)
+
+    def _work(self, updates_queue):
+        while True:
+            item = updates_queue.get()
+            if item is _STOP:
+                # Продолжения, которые обработчики поставили уже после сигнала остановки
+                while True:
+                    try:
+                        item = updates_queue.get_nowait()
+                    except queue.Empty:
+                        return
+                    if item is not _STOP:
+                        self._process(item)
+            self._process(item)
+
+    def _process(self, item):
+        enqueued_at, chat_id, update = item
+        wait = time.monotonic() - enqueued_at
+        failed = False
+        try:
+            if isinstance(update, _Task):
+                update.function(*update.args)
+            else:
+                self.handler(update)
+        except Exception as e:
+            failed = True
+            logger.error(f"Ошибка обработки обновления чата {chat_id}: {e}", exc_info=True)
+        with self._lock:
+            self._processed += 1
+            self._failed += failed
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+
+    def stats(self):
+        """Счётчики очередей: глубина по воркерам, число обновлений и время ожидания"""
+        with self._lock:
+            processed = self._processed
+            return {
+                "workers": self.workers,
+                "queue_depth": [updates_queue.qsize() for updates_queue in self._queues],
+                "enqueued": self._enqueued,
+                "processed": processed,
+                "failed": self._failed,
+                "wait_avg": self._wait_total / processed if processed else 0.0,
+                "wait_max": self._wait_max,
+            }
@@ -0,0 +1,142 @@
+"""Приём обновлений Telegram через вебхук.
+
+Локальный HTTP-сервер принимает POST-запросы Telegram с обновлениями, проверяет
+заголовок X-Telegram-Bot-Api-Secret-Token и кладёт обновления в ограниченную
+очередь. Из очереди их по одному забирает поток-потребитель и передаёт обработчикам
+бота. Потребитель один: иначе два обновления одного чата могли бы уйти обработчикам
+в обратном порядке ещё до того, как планировщик выстроит их по чатам.
+Если очередь переполнена, сервер отвечает 503 и Telegram повторит доставку позже.
+Так несколько процессов бота можно поставить за балансировщик нагрузки.
+"""
+import hmac
+import logging
+import queue
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from telebot import types
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+# Обновления Telegram небольшие, всё крупнее считаем ошибкой
+MAX_BODY_SIZE = 1024 * 1024
+
+_STOP = object()
+
+
+class WebhookServer:
+    """HTTP-сервер вебхука с ограниченной очередью обновлений"""
+
+    def __init__(self, process_updates, host="0.0.0.0", port=8080, path="/webhook",
+                 secret_token=None, queue_size=1000):
+        self.process_updates = process_updates
+        self.path = path
+        self.secret_token = secret_token
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._consumer = threading.Thread(target=self._consume, name="webhook-consumer", daemon=True)
+        self._lock = threading.Lock()
+        self._counters = {"accepted": 0, "rejected": 0, "overloaded": 0, "invalid": 0}
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._httpd.daemon_threads = True
+
+    @property
+    def address(self):
+        return self._httpd.server_address
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _make_handler(self):
+        server = self
+
+        class WebhookRequestHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                # Проверка живости для балансировщика
+                if self.path == "/healthz":
+                    self._reply(200)
+                else:
+                    self._reply(404)
+
+            def do_POST(self):
+                if self.path != server.path:
+                    self._reply(404)
+                    return
+
+                # compare_digest не принимает строки с не-ASCII символами, поэтому сравниваем байты.
+                # http.server декодирует заголовки как latin-1, обратное кодирование даёт байты запроса.
+                secret = self.headers.get(SECRET_HEADER, "").encode("latin-1", "replace")
+                if server.secret_token and not hmac.compare_digest(secret, server.secret_token.encode("utf-8")):
+                    server._count("rejected")
+                    self._reply(403)
+                    return
+
+                try:
+                    length = int(self.headers.get("Content-Length") or 0)
+                except ValueError:
+                    length = 0
+                if length <= 0 or length > MAX_BODY_SIZE:
+                    server._count("invalid")
+                    self._reply(413 if length > MAX_BODY_SIZE else 400)
+                    return
+
+                try:
+                    update = types.Update.de_json(self.rfile.read(length).decode("utf-8"))
+                except (ValueError, KeyError, TypeError) as e:
+                    server._count("invalid")
+                    logger.warning(f"Некорректное обновление в вебхуке: {e}")
+                    self._reply(400)
+                    return
+
+                try:
+                    server._queue.put_nowait(update)
+                except queue.Full:
+                    # Telegram повторит доставку, когда мы разгрузимся
+                    server._count("overloaded")
+                    self._reply(503, retry_after=1)
+                    return
+
+                server._count("accepted")
+                self._reply(200)
+
+            def _reply(self, status, retry_after=None):
+                self.send_response(status)
+                if retry_after is not None:
+                    self.send_header("Retry-After", str(retry_after))
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                logger.debug(f"{self.address_string()} {format % args}")
+
+        return WebhookRequestHandler
+
+    def _consume(self):
+        while True:
+            update = self._queue.get()
+            if update is _STOP:
+                break
+            try:
+                self.process_updates([update])
+            except Exception as e:
+                logger.error(f"Ошибка передачи обновления обработчикам: {e}", exc_info=True)
+
+    def serve_forever(self):
+        """Запускает потребителя и обслуживает запросы до вызова stop()"""
+        self._consumer.start()
+        host, port = self.address[:2]
+        logger.info(f"🌐 Вебхук слушает http://{host}:{port}{self.path}")
+        self._httpd.serve_forever()
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._queue.put(_STOP)
+        if self._consumer.is_alive():
+            self._consumer.join(timeout=10)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, queue_depth=self._queue.qsize())